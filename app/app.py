@@ -3,7 +3,10 @@ from flasgger import Swagger
 from flask_cors import CORS
 from flask_json import FlaskJSON
 from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth, MultiAuth
-from database import db
+from flask_sock import Sock
+from fast_json import JSONProvider
+from database import db, database_uri, engine_options, set_sqlite_pragma
+from sqlalchemy import event
 import os
 
 # 获取当前文件的绝对路径
@@ -17,13 +20,27 @@ CORS(app, supports_credentials=True)
 
 # json 解析拓展
 FlaskJSON(app)
+# 安装 orjson 时使用更快的 JSON 序列化
+app.json_provider_class = JSONProvider
+app.json = JSONProvider(app)
 
-# 数据库
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(
-    basedir, "data.sqlite"
+# websocket
+sock = Sock(app)
+
+# 数据库，可通过环境变量 DATABASE_URL 指定，默认使用当前目录下的 SQLite
+app.config["SQLALCHEMY_DATABASE_URI"] = database_uri(
+    "sqlite:///" + os.path.join(basedir, "data.sqlite")
+)
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+    app.config["SQLALCHEMY_DATABASE_URI"]
 )
 # app.config['SQLALCHEMY_ECHO'] = True
 db.init_app(app)
+with app.app_context():
+    event.listen(db.engine, "connect", set_sqlite_pragma)
+
+# 注册会话事件，本进程提交的修改都会更新表版本号
+import versions
 
 # 身份认证
 basic_auth = HTTPBasicAuth()  # 基本认证
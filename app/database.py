@@ -1,4 +1,114 @@
+import os
+import sqlite3
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+
+# SQLite 的日志模式，WAL 模式下读写互不阻塞
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+# SQLite 的同步级别，WAL 模式下 NORMAL 足够安全且写入更快
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+# 数据库被锁时最多等待多久（毫秒），而不是立即报 database is locked
+SQLITE_BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000))
+# 连接池大小，及超出后最多额外创建的连接数
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+# 连接最长存活时间（秒），避免使用被数据库服务端断开的连接
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
 
 # 创建 SQLAlchemy 实例
 db = SQLAlchemy()
+
+
+def database_uri(default: str) -> str:
+    """
+    数据库地址，优先使用环境变量 DATABASE_URL（如 PostgreSQL）
+    :param default: 未设置环境变量时使用的地址
+    :return:
+    """
+    uri = os.environ.get("DATABASE_URL", default)
+    # 部分平台提供的是 SQLAlchemy 不再支持的 postgres:// 前缀
+    if uri.startswith("postgres://"):
+        uri = "postgresql://" + uri[len("postgres://") :]
+    return uri
+
+
+def engine_options(uri: str) -> dict:
+    """
+    按数据库类型生成 SQLAlchemy 引擎参数
+    :param uri: 数据库地址
+    :return: SQLALCHEMY_ENGINE_OPTIONS
+    """
+    if uri.startswith("sqlite"):
+        if ":memory:" in uri or uri.rstrip("/") == "sqlite:":
+            # 内存数据库每个连接都是独立的库，使用默认的连接池
+            return {}
+        return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+def set_sqlite_pragma(dbapi_connection, connection_record):
+    """
+    每个新建的 SQLite 连接都设置日志模式、同步级别和锁等待时间，作为引擎的 connect 事件注册
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT}")
+    cursor.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+    cursor.close()
+
+
+def add_missing_columns():
+    """
+    为已存在的表补上模型中新增的列，可重复执行，需要在应用上下文中调用
+    create_all 只创建不存在的表，不会修改已有的表；新增的列必须可为空或设置 server_default
+    :return: 新增的列，形如 ["user.token_version"]
+    """
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    added = []
+    with db.engine.begin() as connection:
+        preparer = connection.dialect.identifier_preparer
+        for table in db.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.execute(
+                    text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}")
+                )
+                added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def add_missing_indexes():
+    """
+    为已存在的表补上模型中新增的索引（如 index=True 的列），可重复执行，需要在应用上下文中调用
+    create_all 和 add_missing_columns 都不会为已有的表创建索引
+    :return: 新建的索引，形如 ["ix_pt_waypoint_id"]
+    """
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    added = []
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                index.create(connection)
+                added.append(index.name)
+    return added
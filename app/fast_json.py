@@ -0,0 +1,37 @@
+from flask_json import FlaskJSONProvider
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时使用 Flask-JSON 默认的标准库实现
+    orjson = None
+
+
+class OrjsonProvider(FlaskJSONProvider):
+    """
+    使用 orjson 的 JSON 序列化，直接生成 UTF-8 字节；
+    orjson 不支持的类型仍交给 Flask-JSON 注册的编码器处理
+    """
+
+    def _dumpb(self, obj, sort_keys=None, indent=None) -> bytes:
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys if sort_keys is None else sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj, **kwargs) -> str:
+        return self._dumpb(obj, kwargs.get("sort_keys"), kwargs.get("indent")).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(
+            self._dumpb(obj, indent=indent) + b"\n", mimetype=self.mimetype
+        )
+
+
+JSONProvider = OrjsonProvider if orjson is not None else FlaskJSONProvider
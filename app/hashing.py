@@ -0,0 +1,83 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# 密码哈希算法及参数，格式同 werkzeug，如 scrypt、scrypt:65536:8:1、pbkdf2:sha256:600000
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+PASSWORD_SALT_LENGTH = int(os.environ.get("PASSWORD_SALT_LENGTH", 16))
+# 同时计算密码哈希的线程数，默认为 CPU 核数的一半
+PASSWORD_HASH_WORKERS = int(
+    os.environ.get("PASSWORD_HASH_WORKERS", max(1, (os.cpu_count() or 2) // 2))
+)
+# 最多排队等待计算的请求数，以及最长等待时间（秒），超出时直接拒绝
+PASSWORD_HASH_QUEUE = int(os.environ.get("PASSWORD_HASH_QUEUE", 32))
+PASSWORD_HASH_TIMEOUT = float(os.environ.get("PASSWORD_HASH_TIMEOUT", 5))
+
+
+class HashingBusyError(Exception):
+    """
+    密码哈希线程池已满
+    """
+
+    pass
+
+
+class HashingPool:
+    """
+    计算密码哈希的有界线程池：哈希计算在 hashlib 中释放 GIL，
+    限制同时计算的数量后，登录高峰只占用固定数量的 CPU，其他请求不受影响
+
+    workers: 同时计算的线程数
+    max_pending: 计算中和排队中的请求总数上限
+    timeout: 等待进入线程池的最长时间
+    """
+
+    def __init__(
+        self,
+        workers=PASSWORD_HASH_WORKERS,
+        max_pending=PASSWORD_HASH_QUEUE,
+        timeout=PASSWORD_HASH_TIMEOUT,
+    ):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="hashing")
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+
+    def run(self, func, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HashingBusyError("Too many password hashing requests.")
+        try:
+            return self._executor.submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+
+# 全局密码哈希线程池
+hashing_pool = HashingPool()
+
+
+@lru_cache(maxsize=8)
+def _method_prefix(method: str) -> str:
+    """
+    哈希值中表示算法和参数的前缀，如 scrypt 展开为 scrypt:32768:8:1
+    """
+    return generate_password_hash("", method=method).split("$", 1)[0]
+
+
+def hash_password(password: str) -> str:
+    return hashing_pool.run(
+        generate_password_hash, password, PASSWORD_HASH_METHOD, PASSWORD_SALT_LENGTH
+    )
+
+
+def verify_password(password_hash: str, password: str) -> bool:
+    return hashing_pool.run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """
+    哈希值使用的算法或参数与当前配置不同时，需要在用户下次登录时重新计算
+    """
+    return password_hash.split("$", 1)[0] != _method_prefix(PASSWORD_HASH_METHOD)
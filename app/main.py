@@ -8,14 +8,20 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardi
 print(sys.path)
 
 from app import app
-from database import db
+from database import add_missing_columns, add_missing_indexes, db
 from views.user_views import user_bp
 from views.map_views import map_bp
 from views.waypoint_views import waypoint_bp
 from views.robot_views import robot_bp
 from views.rx_views import rx_bp
 from views.pt_views import pt_bp
+from views.command_views import command_bp
+from views.transport_views import transport_bp
+from rosbridge import listener
+from waypoint_sync import waypoint_sync
+from travel_distance import travel_distances
 import click
+from werkzeug.serving import is_running_from_reloader
 
 # 注册蓝图
 app.register_blueprint(user_bp)
@@ -24,9 +30,24 @@ app.register_blueprint(waypoint_bp)
 app.register_blueprint(robot_bp)
 app.register_blueprint(rx_bp)
 app.register_blueprint(pt_bp)
+app.register_blueprint(command_bp)
+app.register_blueprint(transport_bp)
 app.config["SECRET_KEY"] = "the quick brown fox jumps over the lazy dog"
 
 
+def start_background():
+    """
+    启动后台任务，只由服务进程调用，flask initdb 等命令导入本模块时不启动；
+    使用 gunicorn 等多进程部署时在每个工作进程中调用，如 post_worker_init 钩子
+    """
+    # 连接所有机器人并订阅状态话题，更新实时状态缓存（历史记录由 rosbridge/listener.py 服务写入）
+    listener.start(persist=False)
+    # 定期把各地图的航点文件增量同步到航点表，多个进程中只有一个会运行
+    waypoint_sync.start()
+    # 后台计算各地图航点之间的行驶距离
+    travel_distances.warm(app)
+
+
 @app.cli.command()  # 注册为命令，可以传入 name 参数来自定义命令
 @click.option("--drop", is_flag=True, help="Create after drop.")  # 设置选项
 def initdb(drop):
@@ -36,13 +57,21 @@ def initdb(drop):
     if drop:  # 判断是否输入了选项
         db.drop_all()
     db.create_all()
+    # 升级已有的数据库：为已存在的表补上新增的列和索引，不删除数据
+    for column in add_missing_columns():
+        click.echo(f"Added column {column}.")
+    for index in add_missing_indexes():
+        click.echo(f"Added index {index}.")
     click.echo("Initialized database.")  # 输出提示信息
 
 
 if __name__ == "__main__":
-    # 获取当前文件所属目录的绝对路径
-    basedir = os.path.abspath(os.path.dirname(__file__))
-    if not os.path.exists(os.path.join(basedir, "data.sqlite")):
-        with app.app_context():
-            db.create_all()
+    # 创建尚不存在的表，数据库可能由 DATABASE_URL 指定，不能只检查 SQLite 文件
+    with app.app_context():
+        db.create_all()
+        add_missing_columns()
+        add_missing_indexes()
+    # 调试模式下重载器的父进程只负责监视代码变化，后台任务在实际处理请求的子进程中启动
+    if is_running_from_reloader():
+        start_background()
     app.run(host="0.0.0.0", port=5000, debug=True)
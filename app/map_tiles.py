@@ -0,0 +1,230 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import threading
+import uuid
+import zlib
+
+import numpy as np
+
+from occupancy_grid import UNKNOWN_VALUE, file_version, map_files, read_pgm
+
+# 瓦片边长（像素）
+TILE_SIZE = 256
+# 瓦片金字塔的磁盘缓存目录
+MAP_CACHE_DIR = os.environ.get(
+    "MAP_CACHE_DIR",
+    os.path.join(os.path.abspath(os.path.dirname(__file__)), "map_cache"),
+)
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(data))
+        + kind
+        + data
+        + struct.pack(">I", zlib.crc32(kind + data))
+    )
+
+
+def encode_png(tile: np.ndarray) -> bytes:
+    """
+    把 uint8 灰度数组编码为 8 位灰度 PNG
+    """
+    height, width = tile.shape
+    # 每行前加一个字节的过滤类型 0
+    raw = np.zeros((height, width + 1), np.uint8)
+    raw[:, 1:] = tile
+    return b"".join(
+        (
+            b"\x89PNG\r\n\x1a\n",
+            _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)),
+            _png_chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)),
+            _png_chunk(b"IEND", b""),
+        )
+    )
+
+
+def downsample(image: np.ndarray) -> np.ndarray:
+    """
+    长宽各缩小一半，每 2x2 像素取最小值，即障碍物优先，缩小后墙壁不会消失
+    """
+    height, width = image.shape
+    if height % 2 or width % 2:
+        image = np.pad(image, ((0, height % 2), (0, width % 2)), mode="edge")
+    height, width = image.shape
+    return image.reshape(height // 2, 2, width // 2, 2).min(axis=(1, 3))
+
+
+def pyramid_levels(image: np.ndarray, tile_size=TILE_SIZE) -> list:
+    """
+    逐级缩小直到整张图放得进一个瓦片
+    :return: 从第 0 级（最小）到原始分辨率的图片列表
+    """
+    levels = [image]
+    while max(levels[-1].shape) > tile_size:
+        levels.append(downsample(levels[-1]))
+    return levels[::-1]
+
+
+def build_pyramid(image_path: str, directory: str, tile_size=TILE_SIZE):
+    """
+    生成瓦片金字塔并写入 directory：
+    tiles.bin 依次存放所有 PNG 瓦片，index.npy 为每个瓦片在 tiles.bin 中的 (偏移, 长度)，
+    meta.json 记录每级的行列数和第一个瓦片的序号。先写入临时目录再整体改名，其他进程不会读到一半
+    """
+    image = read_pgm(image_path)
+    os.makedirs(os.path.dirname(directory), exist_ok=True)
+    tmp = f"{directory}.tmp-{uuid.uuid4().hex}"
+    os.makedirs(tmp)
+    try:
+        levels, index, offset = [], [], 0
+        with open(os.path.join(tmp, "tiles.bin"), "wb") as f:
+            for level in pyramid_levels(image, tile_size):
+                height, width = level.shape
+                cols, rows = -(-width // tile_size), -(-height // tile_size)
+                levels.append(
+                    {
+                        "width": width,
+                        "height": height,
+                        "cols": cols,
+                        "rows": rows,
+                        "first": len(index),
+                    }
+                )
+                # 边缘瓦片用未知区域的灰度补齐
+                padded = np.full(
+                    (rows * tile_size, cols * tile_size), UNKNOWN_VALUE, np.uint8
+                )
+                padded[:height, :width] = level
+                for y in range(rows):
+                    for x in range(cols):
+                        png = encode_png(
+                            padded[
+                                y * tile_size : (y + 1) * tile_size,
+                                x * tile_size : (x + 1) * tile_size,
+                            ]
+                        )
+                        f.write(png)
+                        index.append((offset, len(png)))
+                        offset += len(png)
+        np.save(os.path.join(tmp, "index.npy"), np.array(index, np.int64))
+        meta = {
+            "width": int(image.shape[1]),
+            "height": int(image.shape[0]),
+            "tile_size": tile_size,
+            "levels": levels,
+        }
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        try:
+            os.replace(tmp, directory)
+        except OSError:
+            # 其他进程已经生成了同一版本的金字塔
+            if not os.path.exists(os.path.join(directory, "meta.json")):
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+class TilePyramid:
+    """
+    磁盘上的瓦片金字塔，tiles.bin 以只读方式内存映射，
+    读取瓦片只是按索引切出一段字节，不解码也不重新编码
+
+    directory: build_pyramid 生成的目录
+    """
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.index = np.load(os.path.join(directory, "index.npy"))
+        with open(os.path.join(directory, "tiles.bin"), "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def max_zoom(self) -> int:
+        return len(self.meta["levels"]) - 1
+
+    def tile(self, z: int, x: int, y: int):
+        """
+        :return: PNG 数据，超出范围时为 None
+        """
+        if not 0 <= z <= self.max_zoom:
+            return None
+        level = self.meta["levels"][z]
+        if not (0 <= x < level["cols"] and 0 <= y < level["rows"]):
+            return None
+        offset, length = (
+            int(value) for value in self.index[level["first"] + y * level["cols"] + x]
+        )
+        return self._mmap[offset : offset + length]
+
+
+class MapTileCache:
+    """
+    按地图缓存瓦片金字塔，地图图片的大小或修改时间变化后重新生成，并删除该地图的旧版本
+
+    directory: 磁盘缓存目录
+    tile_size: 瓦片边长
+    """
+
+    def __init__(self, directory=MAP_CACHE_DIR, tile_size=TILE_SIZE):
+        self.directory = directory
+        self.tile_size = tile_size
+        self._pyramids = {}
+        self._build_locks = {}
+        self._lock = threading.Lock()
+
+    def key(self, map_id: int, mappath: str) -> str:
+        """
+        地图当前版本的标识，也用作缓存目录名和 ETag
+        """
+        _, image_path = map_files(mappath)
+        digest = hashlib.sha1(file_version(image_path).encode()).hexdigest()[:16]
+        return f"{map_id}-{digest}-{self.tile_size}"
+
+    def pyramid(self, map_id: int, mappath: str):
+        """
+        :return: (版本标识, TilePyramid)
+        """
+        key = self.key(map_id, mappath)
+        with self._lock:
+            cached = self._pyramids.get(map_id)
+            if cached is not None and cached[0] == key:
+                return cached
+            build_lock = self._build_locks.setdefault(map_id, threading.Lock())
+        # 同一地图同时只生成一次，不影响其他地图的瓦片请求
+        with build_lock:
+            with self._lock:
+                cached = self._pyramids.get(map_id)
+            if cached is None or cached[0] != key:
+                directory = os.path.join(self.directory, key)
+                if not os.path.exists(os.path.join(directory, "meta.json")):
+                    _, image_path = map_files(mappath)
+                    build_pyramid(image_path, directory, self.tile_size)
+                    self._prune(map_id, key)
+                cached = (key, TilePyramid(directory))
+                with self._lock:
+                    self._pyramids[map_id] = cached
+        return cached
+
+    def _prune(self, map_id: int, key: str):
+        for name in os.listdir(self.directory):
+            # 跳过其他进程正在写入的临时目录
+            if name.startswith(f"{map_id}-") and name != key and ".tmp-" not in name:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def invalidate(self, map_id: int):
+        """
+        地图被修改或删除后释放内存映射，磁盘缓存在下次生成时清理
+        """
+        with self._lock:
+            self._pyramids.pop(map_id, None)
+
+
+# 全局地图瓦片缓存
+map_tiles = MapTileCache()
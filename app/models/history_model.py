@@ -0,0 +1,33 @@
+from database import db
+
+
+# 送药业务执行状态历史
+class TransportStatus(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    robot_id = db.Column(db.Integer, db.ForeignKey("robot.id"), index=True)
+    data = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, index=True)
+
+
+# 巡诊业务执行状态历史
+class CruiseStatus(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    robot_id = db.Column(db.Integer, db.ForeignKey("robot.id"), index=True)
+    data = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, index=True)
+
+
+# 测温请求历史
+class TpRequest(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    robot_id = db.Column(db.Integer, db.ForeignKey("robot.id"), index=True)
+    data = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, index=True)
+
+
+# 测温结果历史
+class TpResult(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    robot_id = db.Column(db.Integer, db.ForeignKey("robot.id"), index=True)
+    data = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, index=True)
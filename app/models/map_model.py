@@ -4,4 +4,7 @@ class Map(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     mapname = db.Column(db.String(20), unique=True)
     mappath = db.Column(db.String(128))
-    waypointpath = db.Column(db.String(128))
\ No newline at end of file
+    waypointpath = db.Column(db.String(128))
+    # 航点文件上次同步到航点表时的内容哈希，及文件中的航点名称（JSON 列表），由 waypoint_sync 维护
+    waypointdigest = db.Column(db.String(40))
+    waypointnames = db.Column(db.Text)
@@ -0,0 +1,7 @@
+from database import db
+
+
+# 每张表的版本号，由 versions.py 在修改该表的事务中加一
+class TableVersion(db.Model):
+    tablename = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
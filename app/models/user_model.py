@@ -1,10 +1,20 @@
 from database import db
-from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
+import threading
 import time
 from app import app
 from app import basic_auth, token_auth
 from flask import g
+from flask_json import JsonError
+import hashing
+from sqlalchemy.orm import make_transient_to_detached
+from versions import versions
+
+# 用户缓存的有效期（秒），多个进程之间的修改最多延迟这么久生效
+USER_CACHE_TTL = 60
+# access token 和 refresh token 的有效期（秒）
+ACCESS_TOKEN_EXPIRES = 600
+REFRESH_TOKEN_EXPIRES = 7 * 24 * 3600
 
 
 class User(db.Model):
@@ -14,18 +24,21 @@ class User(db.Model):
     id: 用户id
     username: 用户名
     password_hash: 密码的哈希值
+    role: 用户角色
+    token_version: token 版本，加一后之前签发的所有 token 失效
     """
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(20), unique=True)
     password_hash = db.Column(db.String(128))
     role = db.Column(db.String(20), default="user")
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     def hash_password(self, password):
         """
         用于生成密码哈希值的方法，接受密码作为参数
         """
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hashing.hash_password(password)
 
     def verify_password(self, password):
         """
@@ -33,32 +46,189 @@ class User(db.Model):
 
         返回布尔值，表示密码是否正确
         """
-        return check_password_hash(self.password_hash, password)
+        return hashing.verify_password(self.password_hash, password)
+
+    def needs_rehash(self):
+        """
+        密码哈希的算法或参数是否与当前配置不同
+        """
+        return hashing.needs_rehash(self.password_hash)
+
+    def generate_auth_token(self, expires_in=ACCESS_TOKEN_EXPIRES):
+        """
+        生成 access token，其中带有用户名、角色和 token 版本，验证时不需要查询数据库
+
+        expires_in: token 的有效时间
+        """
+        return self._encode("access", expires_in, name=self.username, role=self.role)
 
-    def generate_auth_token(self, expires_in=600):
+    def generate_refresh_token(self, expires_in=REFRESH_TOKEN_EXPIRES):
         """
-        生成认证 token
+        生成 refresh token，用于换取新的 access token，不需要再次验证密码
 
         expires_in: token 的有效时间
         """
+        return self._encode("refresh", expires_in)
+
+    def _encode(self, token_type, expires_in, **claims):
         return jwt.encode(
-            {"id": self.id, "exp": time.time() + expires_in},
+            {
+                "id": self.id,
+                "type": token_type,
+                "ver": self.token_version,
+                "exp": time.time() + expires_in,
+                **claims,
+            },
             app.config["SECRET_KEY"],
             algorithm="HS256",
         )
 
+    def revoke_tokens(self):
+        """
+        吊销该用户已签发的所有 token，调用方负责提交事务，回滚时不吊销
+        提交后本进程立即拒绝旧 token，其他进程最迟在用户缓存过期（USER_CACHE_TTL）后拒绝
+        """
+        self.token_version = User.token_version + 1
+
+    @staticmethod
+    def decode_token(token, token_type):
+        """
+        验证 token 的签名、有效期和类型，同一请求中相同的 token 只解码一次
+
+        token: 需要验证的 token
+        token_type: access 或 refresh
+        :return: token 中的数据，无效时返回 None
+        """
+        tokens = g.setdefault("auth_tokens", {})
+        if token not in tokens:
+            try:
+                tokens[token] = jwt.decode(
+                    token, app.config["SECRET_KEY"], algorithms=["HS256"]
+                )
+            except jwt.InvalidTokenError:
+                tokens[token] = None
+        data = tokens[token]
+        if data is None or data.get("type") != token_type:
+            return None
+        # token 版本与数据库中的不一致，说明已被吊销
+        values = user_cache.values(id=data["id"])
+        if values is None or data["ver"] != values["token_version"]:
+            return None
+        return data
+
     @staticmethod
     def verify_auth_token(token):
         """
-        验证 token
+        验证 access token，只读取用户缓存中的 token 版本，不构造 User 对象
+
+        token: 需要验证的 token
+        :return: token 中的用户身份，无效时返回 None
+        """
+        data = User.decode_token(token, "access")
+        return TokenPrincipal(data) if data is not None else None
+
+    @staticmethod
+    def verify_refresh_token(token):
+        """
+        验证 refresh token
 
         token: 需要验证的 token
+        :return: 用户，无效时返回 None
         """
-        try:
-            data = jwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
-        except:
-            return
-        return User.query.get(data["id"])
+        data = User.decode_token(token, "refresh")
+        if data is None:
+            return None
+        return user_cache.get(id=data["id"])
+
+
+class TokenPrincipal:
+    """
+    从 access token 中解析出的用户身份
+
+    id: 用户id
+    username: 用户名
+    role: 用户角色
+    token_version: token 版本
+    """
+
+    def __init__(self, data: dict):
+        self.id = data["id"]
+        self.username = data.get("name")
+        self.role = data.get("role")
+        self.token_version = data["ver"]
+
+
+def current_user():
+    """
+    当前登录用户的 User 对象，token 认证时按需从用户缓存中获取
+    """
+    if isinstance(g.user, User):
+        return g.user
+    return user_cache.get(id=g.user.id)
+
+
+class UserCache:
+    """
+    按 ID 和用户名缓存用户的列值，命中时不查询数据库
+    缓存项在 ttl 秒后过期；用户表有事务提交（如修改密码、角色）后，本进程中的缓存项立即失效
+
+    ttl: 缓存项的有效期（秒）
+    """
+
+    def __init__(self, ttl=USER_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, **key):
+        """
+        获取用户，同一请求中重复获取同一用户时直接返回
+        key: id=用户 ID 或 username=用户名
+        :return: 当前会话中的 User 对象，不存在时返回 None
+        """
+        ((field, value),) = key.items()
+        users = g.setdefault("users", {})
+        if (field, value) not in users:
+            values = self.values(**key)
+            users[(field, value)] = self._attach(values) if values else None
+        return users[(field, value)]
+
+    def values(self, **key):
+        """
+        获取用户的列值，不构造 User 对象
+        key: id=用户 ID 或 username=用户名
+        :return: 列名到值的映射，不存在时返回 None
+        """
+        ((field, value),) = key.items()
+        version = versions.local_version(User.__tablename__)
+        with self._lock:
+            entry = self._entries.get((field, value))
+        if entry is not None and entry[0] > time.monotonic() and entry[1] == version:
+            return entry[2]
+        row = (
+            db.session.query(*User.__table__.columns)
+            .filter(User.__table__.columns[field] == value)
+            .first()
+        )
+        if row is None:
+            return None
+        values = dict(row._mapping)
+        entry = (time.monotonic() + self.ttl, version, values)
+        with self._lock:
+            self._entries[("id", values["id"])] = entry
+            self._entries[("username", values["username"])] = entry
+        return values
+
+    @staticmethod
+    def _attach(values: dict):
+        # 用缓存的列值构造对象并并入当前会话，不执行查询，之后的修改可以正常提交
+        user = User(**values)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+
+# 全局用户缓存
+user_cache = UserCache()
 
 
 @basic_auth.verify_password
@@ -69,12 +239,20 @@ def verify_password(username, password):
     username: 用户名
     password: 密码
     """
-    user = User.query.filter_by(username=username).first()
-    if not user or not user.verify_password(password):
-        return False
+    user = user_cache.get(username=username)
+    try:
+        if not user or not user.verify_password(password):
+            return False
+        if user.needs_rehash():
+            # 登录时用当前配置的算法和参数重新计算哈希，逐步升级已有用户的密码哈希
+            user.hash_password(password)
+            db.session.commit()
+    except hashing.HashingBusyError:
+        raise JsonError(status_=503, description="登录请求过多，请稍后重试")
     # 保存当前登录用户
     g.user = user
-    return True
+    # 返回用户对象，获取角色时直接使用，不再重复查询
+    return user
 
 
 @token_auth.verify_token
@@ -89,32 +267,16 @@ def verify_token(token):
         return False
     # 保存当前登录用户
     g.user = user
-    return True
+    # 返回用户身份，获取角色时直接使用，不再重复解码 token
+    return user
 
 
 @basic_auth.get_user_roles
-def get_user_roles(authorization):
-    """
-    获取用户角色
-
-    authorization: werkzeug.datastructures.auth.Authorization 对象
-    """
-    username = authorization.username
-    user = User.query.filter_by(username=username).first()
-    if user is None:
-        return []
-    return [user.role]
-
-
 @token_auth.get_user_roles
-def get_user_roles(authorization):
+def get_user_roles(user):
     """
     获取用户角色
 
-    authorization: werkzeug.datastructures.auth.Authorization 对象
+    user: verify_password 返回的用户对象或 verify_token 返回的用户身份
     """
-    token = authorization.token
-    user = User.verify_auth_token(token)
-    if user is None:
-        return []
     return [user.role]
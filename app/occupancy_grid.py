@@ -0,0 +1,214 @@
+import os
+import threading
+
+import numpy as np
+import yaml
+
+# ROS map_server 地图图片中未知区域的灰度值
+UNKNOWN_VALUE = 205
+
+
+class MapFileError(Exception):
+    """
+    地图文件不存在或格式错误
+    """
+
+    pass
+
+
+def map_files(mappath: str):
+    """
+    解析 Map.mappath 指向的地图文件，可以是 map_server 保存的 YAML，也可以直接是 PGM 图片
+    :return: (YAML 路径，没有时为 None, 图片路径)
+    """
+    if not mappath:
+        raise MapFileError("地图路径为空")
+    if os.path.splitext(mappath)[1].lower() in (".yaml", ".yml"):
+        metadata = load_metadata(mappath)
+        image = metadata.get("image")
+        if not image:
+            raise MapFileError(f"地图描述文件 {mappath} 中没有 image")
+        return mappath, os.path.join(os.path.dirname(mappath), image)
+    yaml_path = os.path.splitext(mappath)[0] + ".yaml"
+    return (yaml_path if os.path.exists(yaml_path) else None), mappath
+
+
+def load_metadata(yaml_path: str) -> dict:
+    try:
+        with open(yaml_path, "rb") as f:
+            metadata = yaml.safe_load(f)
+    except (OSError, yaml.YAMLError) as e:
+        raise MapFileError(f"无法读取地图描述文件 {yaml_path}: {e}")
+    if not isinstance(metadata, dict):
+        raise MapFileError(f"地图描述文件 {yaml_path} 格式错误")
+    return metadata
+
+
+def file_version(*paths) -> str:
+    """
+    由文件路径、大小和修改时间组成的版本标识，文件被覆盖后随之改变
+    """
+    parts = []
+    for path in paths:
+        if path is None:
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            raise MapFileError(f"无法读取地图文件 {path}")
+        parts.append(f"{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return "|".join(parts)
+
+
+def _pgm_header(data, path: str):
+    """
+    解析 PGM 文件头，支持 # 注释
+    :return: (格式, 宽, 高, 最大灰度值, 像素数据起始位置)
+    """
+    fields = []
+    pos = 0
+    while len(fields) < 4:
+        while pos < len(data) and data[pos : pos + 1].isspace():
+            pos += 1
+        if data[pos : pos + 1] == b"#":
+            while pos < len(data) and data[pos : pos + 1] not in (b"\n", b"\r"):
+                pos += 1
+            continue
+        start = pos
+        while pos < len(data) and not data[pos : pos + 1].isspace():
+            pos += 1
+        if start == pos:
+            raise MapFileError(f"地图图片 {path} 文件头不完整")
+        fields.append(bytes(data[start:pos]))
+    magic = fields[0]
+    if magic not in (b"P5", b"P2"):
+        raise MapFileError(f"地图图片 {path} 不是 PGM 格式")
+    try:
+        width, height, maxval = (int(field) for field in fields[1:])
+    except ValueError:
+        raise MapFileError(f"地图图片 {path} 文件头格式错误")
+    # 文件头与像素数据之间只有一个空白字符
+    return magic, width, height, maxval, pos + 1
+
+
+def read_pgm(path: str) -> np.ndarray:
+    """
+    读取 PGM 地图图片，第 0 行为图片顶部
+    :return: uint8 灰度数组，形状为 (高, 宽)，16 位图片按最大灰度值缩放到 0~255
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        raise MapFileError(f"无法读取地图图片 {path}")
+    magic, width, height, maxval, offset = _pgm_header(data, path)
+    count = width * height
+    if magic == b"P5":
+        dtype = np.uint8 if maxval < 256 else np.dtype(">u2")
+        try:
+            pixels = np.frombuffer(data, dtype, count, offset)
+        except ValueError:
+            raise MapFileError(f"地图图片 {path} 像素数据不完整")
+    else:
+        pixels = np.array(data[offset:].split()[:count], dtype=np.int64)
+        if pixels.size != count:
+            raise MapFileError(f"地图图片 {path} 像素数据不完整")
+    if maxval != 255:
+        pixels = pixels.astype(np.int64) * 255 // maxval
+    return pixels.astype(np.uint8, copy=False).reshape(height, width)
+
+
+class OccupancyGrid:
+    """
+    map_server 格式的栅格地图，按 YAML 中的阈值把像素分为空闲、障碍和未知；
+    与 map_server 相同，忽略 origin 中的偏航角
+
+    image: read_pgm 读取的灰度数组，第 0 行为地图顶部
+    resolution: 每个像素的边长（米）
+    origin: 图片左下角像素的世界坐标 (x, y)
+    """
+
+    def __init__(
+        self,
+        image: np.ndarray,
+        resolution: float,
+        origin,
+        negate=False,
+        occupied_thresh=0.65,
+        free_thresh=0.196,
+    ):
+        self.image = image
+        self.resolution = float(resolution)
+        self.origin = (float(origin[0]), float(origin[1]))
+        # 与 map_server 相同：像素越黑，被占用的概率越大
+        occupancy = image / 255.0 if negate else (255 - image) / 255.0
+        self.free = occupancy < free_thresh
+        self.occupied = occupancy > occupied_thresh
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    def world_to_cell(self, xs, ys):
+        """
+        把世界坐标批量转换为栅格的行列号，坐标可以为 None
+        :return: (行号数组, 列号数组, 是否在地图范围内)，不在范围内的行列号为 0
+        """
+        height, width = self.image.shape
+        cols = np.floor((np.asarray(xs, float) - self.origin[0]) / self.resolution)
+        rows = (
+            height
+            - 1
+            - np.floor((np.asarray(ys, float) - self.origin[1]) / self.resolution)
+        )
+        inside = (cols >= 0) & (cols < width) & (rows >= 0) & (rows < height)
+        rows, cols = np.where(inside, rows, 0), np.where(inside, cols, 0)
+        return rows.astype(np.int64), cols.astype(np.int64), inside
+
+
+def load_grid(mappath: str) -> OccupancyGrid:
+    yaml_path, image_path = map_files(mappath)
+    if yaml_path is None:
+        raise MapFileError(f"地图 {mappath} 缺少描述文件 YAML")
+    metadata = load_metadata(yaml_path)
+    try:
+        return OccupancyGrid(
+            read_pgm(image_path),
+            metadata["resolution"],
+            metadata["origin"],
+            bool(metadata.get("negate", 0)),
+            float(metadata.get("occupied_thresh", 0.65)),
+            float(metadata.get("free_thresh", 0.196)),
+        )
+    except (KeyError, TypeError, IndexError, ValueError):
+        raise MapFileError(f"地图描述文件 {yaml_path} 缺少 resolution 或 origin")
+
+
+class OccupancyGridCache:
+    """
+    按地图文件版本缓存栅格地图，YAML 或图片变化后重新读取
+    """
+
+    def __init__(self):
+        self._grids = {}
+        self._lock = threading.Lock()
+
+    def version(self, mappath: str) -> str:
+        return file_version(*map_files(mappath))
+
+    def get(self, mappath: str):
+        """
+        :return: (地图文件版本, OccupancyGrid)
+        """
+        version = self.version(mappath)
+        with self._lock:
+            cached = self._grids.get(mappath)
+        if cached is None or cached[0] != version:
+            cached = (version, load_grid(mappath))
+            with self._lock:
+                self._grids[mappath] = cached
+        return cached
+
+
+# 全局栅格地图缓存
+occupancy_grids = OccupancyGridCache()
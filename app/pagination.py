@@ -0,0 +1,68 @@
+from flask_json import JsonError, request
+
+# 每页默认和最多返回的记录数
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def _int_arg(name: str, default=None):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise JsonError(description=f"{name} must be an integer.")
+
+
+def paginate(serializer, filters: tuple = ()):
+    """
+    按主键做游标（keyset）分页，只查询需要的列
+    请求参数：
+    cursor: 上一页响应中的 next_cursor，不传时从第一条开始
+    limit: 每页记录数，最大 MAX_LIMIT；只传 cursor 时默认 DEFAULT_LIMIT，
+           limit 和 cursor 都不传时不分页，返回全部记录，与分页前的接口兼容
+    fields: 逗号分隔的字段列表，不传时返回全部字段，id 总是返回
+    filters 中的列名: 按该列精确过滤，只应开放有索引的列
+    :param serializer: 模型的序列化器，其字段即可返回的字段
+    :param filters: 可过滤的字段
+    :return: (记录列表, 下一页的游标)，没有下一页时游标为 None
+    """
+    limit = _int_arg("limit")
+    cursor = _int_arg("cursor")
+    if limit is None and cursor is not None:
+        limit = DEFAULT_LIMIT
+    if limit is not None and not 0 < limit <= MAX_LIMIT:
+        raise JsonError(description=f"limit must be between 1 and {MAX_LIMIT}.")
+
+    model = serializer.model
+    selected = None
+    if request.args.get("fields"):
+        selected = [name.strip() for name in request.args["fields"].split(",")]
+        unknown = [name for name in selected if name not in serializer.fields]
+        if unknown:
+            raise JsonError(description=f"Unknown fields: {unknown}")
+        selected = ("id",) + tuple(name for name in selected if name != "id")
+
+    query = serializer.query(selected)
+    for name in filters:
+        if name in request.args:
+            column = getattr(model, name)
+            try:
+                value = column.type.python_type(request.args[name])
+            except ValueError:
+                raise JsonError(description=f"Invalid value for {name}.")
+            query = query.filter(column == value)
+    if cursor is not None:
+        query = query.filter(model.id > cursor)
+    query = query.order_by(model.id)
+    if limit is None:
+        return serializer.dump_rows(query.all(), selected), None
+    # 多取一条，用于判断是否还有下一页
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+    return serializer.dump_rows(rows, selected), next_cursor
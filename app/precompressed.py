@@ -0,0 +1,81 @@
+import gzip
+import os
+import threading
+import uuid
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时只提供 gzip
+    brotli = None
+
+# 小于该大小（字节）的文件不压缩
+MIN_SIZE = 1024
+
+# 内容编码到 (文件后缀, 压缩函数)，按优先级排列
+ENCODINGS = {"gzip": (".gz", lambda data: gzip.compress(data, 9, mtime=0))}
+if brotli is not None:
+    ENCODINGS = {
+        "br": (".br", lambda data: brotli.compress(data, quality=11)),
+        **ENCODINGS,
+    }
+
+_lock = threading.Lock()
+
+
+def variant(path: str, encoding: str):
+    """
+    获取文件的预压缩版本，保存在原文件旁，如 map.pgm.gz；
+    预压缩文件的修改时间与原文件相同，原文件被覆盖后重新生成
+    :return: 预压缩文件路径，无法生成时为 None
+    """
+    suffix, compress = ENCODINGS[encoding]
+    compressed = path + suffix
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        if _mtime(compressed) == mtime:
+            return compressed
+        with _lock:
+            if _mtime(compressed) == mtime:
+                return compressed
+            with open(path, "rb") as f:
+                data = compress(f.read())
+            # 先写入临时文件再改名，并发的请求不会读到一半
+            tmp = f"{compressed}.tmp-{uuid.uuid4().hex}"
+            try:
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.utime(tmp, ns=(mtime, mtime))
+                os.replace(tmp, compressed)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        return compressed
+    except OSError:
+        # 原文件所在目录不可写等情况下直接返回原文件
+        return None
+
+
+def _mtime(path: str):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def negotiate(path: str, accept_encodings):
+    """
+    按请求头 Accept-Encoding 选择要发送的文件
+    :param path: 原文件路径
+    :param accept_encodings: request.accept_encodings
+    :return: (要发送的文件路径, 内容编码，发送原文件时为 None)
+    """
+    size = os.path.getsize(path)
+    if size < MIN_SIZE:
+        return path, None
+    for encoding in ENCODINGS:
+        if not accept_encodings.quality(encoding):
+            continue
+        compressed = variant(path, encoding)
+        if compressed is not None and os.path.getsize(compressed) < size:
+            return compressed, encoding
+    return path, None
@@ -0,0 +1,87 @@
+import numpy as np
+
+# 2-opt 最多优化的轮数，防止航点很多时耗时过长
+MAX_2OPT_ROUNDS = 50
+
+
+def distance_matrix(points) -> np.ndarray:
+    """
+    计算航点两两之间的直线距离
+    :param points: 形如 [(pos_x, pos_y), ...] 的坐标列表
+    :return: n x n 距离矩阵
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    diff = points[:, None, :] - points[None, :, :]
+    return np.hypot(diff[..., 0], diff[..., 1])
+
+
+def route_length(dist: np.ndarray, route) -> float:
+    """
+    按顺序经过 route 中各航点的总路程
+    :param dist: 距离矩阵
+    :param route: 航点下标列表
+    :return:
+    """
+    route = np.asarray(route)
+    return float(dist[route[:-1], route[1:]].sum())
+
+
+def nearest_neighbour(dist: np.ndarray, start: int) -> list:
+    """
+    最近邻法构造初始路线：从 start 出发，每次前往最近的未访问航点
+    :param dist: 距离矩阵
+    :param start: 起点下标
+    :return: 访问顺序，不含回到起点的一步
+    """
+    visited = np.zeros(len(dist), dtype=bool)
+    visited[start] = True
+    route = [start]
+    for _ in range(len(dist) - 1):
+        nearest = int(np.where(visited, np.inf, dist[route[-1]]).argmin())
+        visited[nearest] = True
+        route.append(nearest)
+    return route
+
+
+def two_opt(dist: np.ndarray, route, max_rounds=MAX_2OPT_ROUNDS) -> np.ndarray:
+    """
+    2-opt 优化，首尾航点固定不动；每次固定一条边，向量化地计算与其后所有边交换的收益
+    :param dist: 距离矩阵
+    :param route: 访问顺序，首尾航点固定
+    :param max_rounds: 最多优化的轮数
+    :return: 优化后的访问顺序
+    """
+    route = np.array(route)
+    for _ in range(max_rounds):
+        improved = False
+        for i in range(1, len(route) - 2):
+            # 翻转 route[i:j + 1]：边 (a, b)、(c, d) 换成 (a, c)、(b, d)
+            a, b = route[i - 1], route[i]
+            c, d = route[i + 1 : -1], route[i + 2 :]
+            delta = dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d]
+            k = int(delta.argmin())
+            if delta[k] < -1e-9:
+                j = i + 1 + k
+                route[i : j + 1] = route[i : j + 1][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return route
+
+
+def plan_cruise(points, dist: np.ndarray = None):
+    """
+    规划巡诊路线：机器人从起始点出发，经过所有航点后回到起始点，起始点是 points 中的最后一个
+    :param points: 形如 [(pos_x, pos_y), ...] 的坐标列表，最后一个是起始点
+    :param dist: 距离矩阵，如地图上的行驶距离，不传时使用直线距离
+    :return: (访问顺序, 预计路程)，访问顺序是 points 的下标，最后一个仍是起始点
+    """
+    origin = len(points) - 1
+    if dist is None:
+        dist = distance_matrix(points)
+    if origin < 2:
+        # 不超过两个航点时无需优化
+        route = [origin] + list(range(len(points)))
+    else:
+        route = two_opt(dist, nearest_neighbour(dist, origin) + [origin])
+    return [int(i) for i in route[1:]], route_length(dist, route)
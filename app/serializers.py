@@ -0,0 +1,89 @@
+from functools import lru_cache
+from operator import attrgetter
+
+from database import db
+from models.map_model import Map
+from models.pt_model import Pt
+from models.robot_model import Robot
+from models.rx_model import Rx
+from models.user_model import User
+from models.waypoint_model import Waypoint
+
+
+def _object_dumper(fields: tuple):
+    """
+    生成把模型对象转换为字典的函数，attrgetter 一次取出所有字段
+    """
+    get = attrgetter(*fields)
+    if len(fields) == 1:
+        # 只有一个字段时 attrgetter 返回单个值而不是元组
+        return lambda obj: {fields[0]: get(obj)}
+    return lambda obj: dict(zip(fields, get(obj)))
+
+
+def _row_dumper(fields: tuple):
+    """
+    生成把列元组转换为字典的函数，列的顺序与 fields 相同
+    """
+    return lambda row: dict(zip(fields, row))
+
+
+class Serializer:
+    """
+    模型的序列化器，预先生成模型对象和列元组到字典的转换函数
+
+    model: 模型类
+    fields: 对外输出的字段，第一个必须是 id
+    """
+
+    def __init__(self, model, fields: tuple):
+        self.model = model
+        self.fields = tuple(fields)
+        self.dump = _object_dumper(self.fields)
+        self.dump_row = self.row_dumper(self.fields)
+
+    def columns(self, fields: tuple = None) -> list:
+        return [getattr(self.model, name) for name in fields or self.fields]
+
+    def query(self, fields: tuple = None):
+        """
+        只查询指定的列，返回列元组而不是模型对象
+        """
+        return db.session.query(*self.columns(fields))
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def row_dumper(fields: tuple):
+        """
+        按列元组中的字段顺序生成转换函数，用于 fields= 投影，结果按字段组合缓存
+        """
+        return _row_dumper(fields)
+
+    def dump_rows(self, rows, fields: tuple = None) -> list:
+        """
+        把 query(fields) 查询到的列元组批量转换为字典
+        """
+        dump = self.row_dumper(tuple(fields)) if fields else self.dump_row
+        return [dump(row) for row in rows]
+
+
+waypoint_serializer = Serializer(
+    Waypoint,
+    (
+        "id",
+        "waypointname",
+        "pos_x",
+        "pos_y",
+        "pos_z",
+        "ori_x",
+        "ori_y",
+        "ori_z",
+        "ori_w",
+        "table_height",
+    ),
+)
+pt_serializer = Serializer(Pt, ("id", "name", "waypoint_id"))
+rx_serializer = Serializer(Rx, ("id", "name"))
+map_serializer = Serializer(Map, ("id", "mapname", "mappath", "waypointpath"))
+robot_serializer = Serializer(Robot, ("id", "robot_status", "robot_ip"))
+user_serializer = Serializer(User, ("id", "username", "role"))
@@ -0,0 +1,212 @@
+import heapq
+import math
+import threading
+
+from database import db
+from models.waypoint_model import Waypoint
+from versions import versions
+
+# 网格边长（米）
+CELL_SIZE = 1.0
+
+
+class WaypointGridIndex:
+    """
+    航点的均匀网格空间索引，按 pos_x、pos_y 把航点分到边长为 cell_size 的格子中
+    首次查询时从数据库加载，并记录加载时航点表的版本号；之后每次查询都检查版本号，
+    其他进程修改过航点表时重新加载。本进程的航点视图写入后增量更新，版本号随之前进
+
+    cell_size: 网格边长，航点的平均间距附近效果最好
+    """
+
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self._points = {}
+        self._cells = {}
+        self._bounds = None
+        # 索引对应的航点表版本号，未加载时为 None
+        self._version = None
+        self._lock = threading.RLock()
+
+    def _cell(self, x: float, y: float):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def _load(self):
+        version = versions.version(Waypoint.__table__.name)
+        with self._lock:
+            if self._version == version:
+                return
+            self._clear()
+            rows = db.session.query(
+                Waypoint.id, Waypoint.waypointname, Waypoint.pos_x, Waypoint.pos_y
+            ).filter(Waypoint.pos_x.isnot(None), Waypoint.pos_y.isnot(None))
+            for row in rows:
+                self._add(row.id, row.waypointname, row.pos_x, row.pos_y)
+            self._version = version
+
+    def _clear(self):
+        self._points.clear()
+        self._cells.clear()
+        self._bounds = None
+        self._version = None
+
+    def _advance(self, version: int) -> bool:
+        """
+        本进程提交写入后调用：version 只比索引新一个版本时说明期间没有其他写入，可以增量更新，
+        否则清空索引，下次查询时重新加载
+        :return: 是否可以增量更新
+        """
+        if self._version is None:
+            return False
+        if version != self._version + 1:
+            self._clear()
+            return False
+        self._version = version
+        return True
+
+    def _add(self, waypoint_id: int, name: str, x: float, y: float):
+        self._remove(waypoint_id)
+        cell = self._cell(x, y)
+        self._points[waypoint_id] = (x, y, name, cell)
+        self._cells.setdefault(cell, set()).add(waypoint_id)
+        if self._bounds is None:
+            self._bounds = [cell[0], cell[1], cell[0], cell[1]]
+        else:
+            self._bounds[0] = min(self._bounds[0], cell[0])
+            self._bounds[1] = min(self._bounds[1], cell[1])
+            self._bounds[2] = max(self._bounds[2], cell[0])
+            self._bounds[3] = max(self._bounds[3], cell[1])
+
+    def _remove(self, waypoint_id: int):
+        point = self._points.pop(waypoint_id, None)
+        if point is None:
+            return
+        ids = self._cells[point[3]]
+        ids.discard(waypoint_id)
+        if not ids:
+            del self._cells[point[3]]
+
+    def add(self, waypoint_id: int, name: str, x: float, y: float, version: int):
+        """
+        新增或移动航点，索引尚未加载时忽略，加载时会从数据库读到
+        :param version: 本次提交后航点表的版本号
+        """
+        with self._lock:
+            if not self._advance(version):
+                return
+            if x is not None and y is not None:
+                self._add(waypoint_id, name, x, y)
+            else:
+                self._remove(waypoint_id)
+
+    def remove(self, waypoint_id: int, version: int):
+        """
+        删除航点
+        :param version: 本次提交后航点表的版本号
+        """
+        with self._lock:
+            if self._advance(version):
+                self._remove(waypoint_id)
+
+    def invalidate(self):
+        """
+        清空索引，下次查询时重新加载，用于批量导入等大量写入之后
+        """
+        with self._lock:
+            self._clear()
+
+    def _result(self, waypoint_id: int, distance=None):
+        x, y, name, _ = self._points[waypoint_id]
+        result = {"id": waypoint_id, "waypointname": name, "pos_x": x, "pos_y": y}
+        if distance is not None:
+            result["distance"] = distance
+        return result
+
+    def nearest(self, x: float, y: float, k=1) -> list:
+        """
+        距离 (x, y) 最近的 k 个航点：从所在格子开始逐圈向外搜索，
+        已找到 k 个且下一圈的最近距离超过第 k 近的距离时停止
+        :return: 按距离从近到远排列的航点列表
+        """
+        self._load()
+        with self._lock:
+            if not self._points:
+                return []
+            cx, cy = self._cell(x, y)
+            min_cx, min_cy, max_cx, max_cy = self._bounds
+            max_ring = max(cx - min_cx, max_cx - cx, cy - min_cy, max_cy - cy)
+            best = []
+            for ring in range(max_ring + 1):
+                for cell in self._ring(cx, cy, ring):
+                    for waypoint_id in self._cells.get(cell, ()):
+                        px, py = self._points[waypoint_id][:2]
+                        distance = math.hypot(px - x, py - y)
+                        if len(best) < k:
+                            heapq.heappush(best, (-distance, waypoint_id))
+                        elif distance < -best[0][0]:
+                            heapq.heapreplace(best, (-distance, waypoint_id))
+                # 第 ring + 1 圈中的点到 (x, y) 的距离不小于 ring * cell_size
+                if len(best) == k and -best[0][0] <= ring * self.cell_size:
+                    break
+            return [
+                self._result(waypoint_id, -distance)
+                for distance, waypoint_id in sorted(best, reverse=True)
+            ]
+
+    def _ring(self, cx: int, cy: int, ring: int):
+        """
+        与 (cx, cy) 的切比雪夫距离为 ring 的格子，跳过索引范围之外的格子
+        """
+        min_cx, min_cy, max_cx, max_cy = self._bounds
+        if ring == 0:
+            yield cx, cy
+            return
+        xs = range(max(cx - ring, min_cx), min(cx + ring, max_cx) + 1)
+        for y in (cy - ring, cy + ring):
+            if min_cy <= y <= max_cy:
+                for x in xs:
+                    yield x, y
+        for x in (cx - ring, cx + ring):
+            if min_cx <= x <= max_cx:
+                for y in range(
+                    max(cy - ring + 1, min_cy), min(cy + ring - 1, max_cy) + 1
+                ):
+                    yield x, y
+
+    def within(self, min_x: float, min_y: float, max_x: float, max_y: float) -> list:
+        """
+        矩形范围内的所有航点
+        :return: 按 ID 排列的航点列表
+        """
+        self._load()
+        with self._lock:
+            if not self._points:
+                return []
+            min_cx, min_cy = self._cell(min_x, min_y)
+            max_cx, max_cy = self._cell(max_x, max_y)
+            min_cx, min_cy = max(min_cx, self._bounds[0]), max(min_cy, self._bounds[1])
+            max_cx, max_cy = min(max_cx, self._bounds[2]), min(max_cy, self._bounds[3])
+            found = []
+            if (max_cx - min_cx + 1) * (max_cy - min_cy + 1) > len(self._cells):
+                # 范围比已有格子还多时，直接遍历已有格子
+                cells = [
+                    cell
+                    for cell in self._cells
+                    if min_cx <= cell[0] <= max_cx and min_cy <= cell[1] <= max_cy
+                ]
+            else:
+                cells = [
+                    (x, y)
+                    for x in range(min_cx, max_cx + 1)
+                    for y in range(min_cy, max_cy + 1)
+                ]
+            for cell in cells:
+                for waypoint_id in self._cells.get(cell, ()):
+                    px, py = self._points[waypoint_id][:2]
+                    if min_x <= px <= max_x and min_y <= py <= max_y:
+                        found.append(waypoint_id)
+            return [self._result(waypoint_id) for waypoint_id in sorted(found)]
+
+
+# 全局航点空间索引
+waypoint_index = WaypointGridIndex()
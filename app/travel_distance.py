@@ -0,0 +1,333 @@
+import os
+import threading
+
+import numpy as np
+
+from database import db
+from models.map_model import Map
+from models.waypoint_model import Waypoint
+from occupancy_grid import MapFileError, occupancy_grids
+from versions import versions
+
+# 计算行驶距离时使用的栅格边长（米），地图分辨率更高时合并像素以减少计算量
+TRAVEL_RESOLUTION = float(os.environ.get("TRAVEL_RESOLUTION", 0.1))
+# 航点所在格子不可通行时（如紧贴墙壁），在该半径（米）内寻找最近的可通行格子
+SNAP_RADIUS = float(os.environ.get("TRAVEL_SNAP_RADIUS", 0.5))
+
+# 航点变化后请求最多等待后台更新距离表的时间（秒），超时后先用已算好的部分
+TRAVEL_WAIT = float(os.environ.get("TRAVEL_WAIT", 1.0))
+
+# 估算到达时间使用的机器人平均速度（米/秒）
+ROBOT_SPEED = float(os.environ.get("ROBOT_SPEED", 0.5))
+
+# 直行和斜行一格的代价，7 / 5 近似 √2
+STRAIGHT_COST = 5
+DIAGONAL_COST = 7
+UNREACHED = np.iinfo(np.int64).max
+
+
+def coarsen(free: np.ndarray, factor: int) -> np.ndarray:
+    """
+    每 factor x factor 个像素合并为一格，全部空闲时才可通行，窄于一格的缝隙不会被当作通道
+    """
+    if factor <= 1:
+        return free
+    height, width = free.shape
+    rows, cols = -(-height // factor), -(-width // factor)
+    padded = np.zeros((rows * factor, cols * factor), bool)
+    padded[:height, :width] = free
+    return padded.reshape(rows, factor, cols, factor).all(axis=(1, 3))
+
+
+def distance_field(passable: np.ndarray, source) -> np.ndarray:
+    """
+    从 source 格子出发到所有格子的最短行驶代价，八邻域，直行代价 STRAIGHT_COST，斜行 DIAGONAL_COST，
+    斜行时两侧的直行格子都必须可通行，不会穿过墙角。
+    按代价分层的 Dijkstra：代价相差小于 STRAIGHT_COST 的格子不会互相更新，每层整体向量化扩展
+    :param passable: 可通行的格子
+    :param source: 起点 (行号, 列号)
+    :return: 与 passable 形状相同的代价数组，不可达为 UNREACHED
+    """
+    height, width = passable.shape
+    stride = width + 2
+    # 四周加一圈不可通行的格子，邻居下标不会越界
+    grid = np.zeros((height + 2, stride), bool)
+    grid[1:-1, 1:-1] = passable
+    grid = grid.ravel()
+    cost = np.full(grid.size, UNREACHED, np.int64)
+    start = (source[0] + 1) * stride + source[1] + 1
+    if not grid[start]:
+        return cost.reshape(height + 2, stride)[1:-1, 1:-1]
+    cost[start] = 0
+    straight = [(-stride, STRAIGHT_COST, ()), (stride, STRAIGHT_COST, ())]
+    straight += [(-1, STRAIGHT_COST, ()), (1, STRAIGHT_COST, ())]
+    diagonal = [
+        (dr * stride + dc, DIAGONAL_COST, (dr * stride, dc))
+        for dr in (-1, 1)
+        for dc in (-1, 1)
+    ]
+    cells, costs = np.array([start]), np.array([0], np.int64)
+    while cells.size:
+        layer = costs < costs.min() + STRAIGHT_COST
+        current, current_costs = cells[layer], costs[layer]
+        cells, costs = cells[~layer], costs[~layer]
+        # 丢弃之后找到了更短路径的过期记录，并去重
+        settled = cost[current] == current_costs
+        current, first = np.unique(current[settled], return_index=True)
+        current_costs = current_costs[settled][first]
+        next_cells, next_costs = [cells], [costs]
+        for offset, step, sides in straight + diagonal:
+            neighbours = current + offset
+            new_costs = current_costs + step
+            better = grid[neighbours] & (new_costs < cost[neighbours])
+            for side in sides:
+                better &= grid[current + side]
+            neighbours, new_costs = neighbours[better], new_costs[better]
+            cost[neighbours] = new_costs
+            next_cells.append(neighbours)
+            next_costs.append(new_costs)
+        cells, costs = np.concatenate(next_cells), np.concatenate(next_costs)
+    return cost.reshape(height + 2, stride)[1:-1, 1:-1]
+
+
+def finite(value, digits=3):
+    """
+    把距离转换为可序列化为 JSON 的值，不可达（inf）为 None
+    """
+    return None if np.isinf(value) else round(float(value), digits)
+
+
+class TravelGrid:
+    """
+    用于计算行驶距离的可通行栅格
+
+    grid: OccupancyGrid
+    resolution: 合并后的格子边长
+    """
+
+    def __init__(self, grid, resolution=TRAVEL_RESOLUTION):
+        self.grid = grid
+        self.factor = max(1, int(round(resolution / grid.resolution)))
+        self.cell_size = grid.resolution * self.factor
+        self.passable = coarsen(grid.free, self.factor)
+        self._snap = max(0, int(np.ceil(SNAP_RADIUS / self.cell_size)))
+
+    def cells(self, points) -> list:
+        """
+        把世界坐标转换为可通行的格子，不在地图内或附近没有可通行格子时为 None
+        :param points: 形如 [(pos_x, pos_y), ...] 的坐标列表
+        """
+        points = np.asarray(points, float).reshape(-1, 2)
+        rows, cols, inside = self.grid.world_to_cell(points[:, 0], points[:, 1])
+        rows, cols = rows // self.factor, cols // self.factor
+        return [
+            self._nearest_passable(row, col) if ok else None
+            for row, col, ok in zip(rows.tolist(), cols.tolist(), inside.tolist())
+        ]
+
+    def _nearest_passable(self, row: int, col: int):
+        if self.passable[row, col]:
+            return row, col
+        r = self._snap
+        top, left = max(row - r, 0), max(col - r, 0)
+        window = self.passable[top : row + r + 1, left : col + r + 1]
+        candidates = np.argwhere(window)
+        if not candidates.size:
+            return None
+        offsets = candidates - (row - top, col - left)
+        nearest = candidates[(offsets**2).sum(axis=1).argmin()]
+        return top + int(nearest[0]), left + int(nearest[1])
+
+    def field(self, cell) -> np.ndarray:
+        """
+        从 cell 出发的行驶距离（米），不可达为 inf
+        """
+        cost = distance_field(self.passable, cell)
+        meters = cost * (self.cell_size / STRAIGHT_COST)
+        meters[cost == UNREACHED] = np.inf
+        return meters
+
+
+class MapDistances:
+    """
+    一张地图上所有航点两两之间的行驶距离，按航点所在的格子保存，同一格子的航点共用一行
+    """
+
+    def __init__(self, travel_grid: TravelGrid):
+        self.travel_grid = travel_grid
+        # (格子列表, 距离矩阵)，整体替换，读取时不会看到更新到一半的状态
+        self.table = ([], np.zeros((0, 0)))
+        self.waypoint_version = None
+        # 等待更新的 (航点表版本号, 航点列表)，由后台线程处理
+        self._pending = None
+        self._worker = None
+        self._updated = threading.Event()
+        self._updated.set()
+        self._state_lock = threading.Lock()
+
+    def refresh(self, waypoint_version, load, timeout=0.0):
+        """
+        航点表版本变化后，在本地图的后台线程中增量更新距离表，请求线程最多等待 timeout 秒。
+        未更新完时继续使用已算好的部分，distances 会为其中没有的格子临时计算，结果不受影响
+        :param waypoint_version: 航点表的版本号
+        :param load: 返回 (id, pos_x, pos_y) 列表的函数，在调用线程中执行
+        :param timeout: 等待更新完成的最长时间（秒）
+        """
+        if self.waypoint_version == waypoint_version:
+            return
+        with self._state_lock:
+            if self._pending is None or self._pending[0] != waypoint_version:
+                if self.waypoint_version != waypoint_version:
+                    self._pending = (waypoint_version, load())
+                    self._updated.clear()
+            if self._pending is not None and self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="travel-distance", daemon=True
+                )
+                self._worker.start()
+        if timeout > 0:
+            self._updated.wait(timeout)
+
+    def _run(self):
+        while True:
+            with self._state_lock:
+                pending = self._pending
+                if pending is None:
+                    self._worker = None
+                    self._updated.set()
+                    return
+            version, waypoints = pending
+            try:
+                self.sync(waypoints)
+            except Exception as e:
+                print("travel distance update failed: " + str(e))
+            with self._state_lock:
+                self.waypoint_version = version
+                if self._pending is pending:
+                    self._pending = None
+
+    def sync(self, waypoints):
+        """
+        按航点的当前位置增量更新：只为新出现的格子计算距离场，删除不再有航点的格子；
+        每算完一个格子就替换一次距离表，正在查询的请求可以先用上
+        :param waypoints: (id, pos_x, pos_y) 列表
+        """
+        cells = self.travel_grid.cells([(x, y) for _, x, y in waypoints])
+        wanted = {cell for cell in cells if cell is not None}
+        sources, matrix = self.table
+        keep = [i for i, cell in enumerate(sources) if cell in wanted]
+        if len(keep) < len(sources):
+            sources = [sources[i] for i in keep]
+            matrix = matrix[np.ix_(keep, keep)]
+            self.table = (sources, matrix)
+        for cell in sorted(wanted - set(sources)):
+            sources, matrix = self._add(sources, matrix, [cell])
+            self.table = (sources, matrix)
+
+    def _add(self, sources, matrix, cells):
+        """
+        加入新的格子：每个新格子计算一次距离场，得到它到所有格子的距离，矩阵对称
+        """
+        if not cells:
+            return sources, matrix
+        old = len(sources)
+        sources = sources + list(cells)
+        rows, cols = (np.array(axis) for axis in zip(*sources))
+        grown = np.zeros((len(sources), len(sources)))
+        grown[:old, :old] = matrix
+        for i, cell in enumerate(cells, old):
+            distances = self.travel_grid.field(cell)[rows, cols]
+            grown[i, :] = distances
+            grown[:, i] = distances
+        return sources, grown
+
+    def distances(self, points) -> np.ndarray:
+        """
+        任意坐标两两之间的行驶距离，与航点在同一格子的坐标直接使用缓存，其余的临时计算距离场
+        :param points: 形如 [(pos_x, pos_y), ...] 的坐标列表
+        :return: n x n 距离矩阵，不可达或不在地图内为 inf
+        """
+        sources, matrix = self.table
+        cells = self.travel_grid.cells(points)
+        index = {cell: i for i, cell in enumerate(sources)}
+        rows = [index.get(cell) for cell in cells]
+        n = len(cells)
+        result = np.full((n, n), np.inf)
+        cached = [i for i, row in enumerate(rows) if row is not None]
+        result[np.ix_(cached, cached)] = matrix[
+            np.ix_([rows[i] for i in cached], [rows[i] for i in cached])
+        ]
+        fields = {}
+        for i, cell in enumerate(cells):
+            if cell is None or rows[i] is not None:
+                continue
+            if cell not in fields:
+                fields[cell] = self.travel_grid.field(cell)
+            for j, other in enumerate(cells):
+                if other is not None:
+                    result[i, j] = result[j, i] = fields[cell][other]
+        np.fill_diagonal(result, [np.inf if cell is None else 0 for cell in cells])
+        return result
+
+
+class TravelDistanceCache:
+    """
+    按地图缓存航点之间的行驶距离：地图文件变化后重新计算，
+    航点表变化后（表版本号改变）按航点位置增量更新。
+    全局锁只保护缓存字典，距离场由每张地图各自的后台线程计算，不在请求线程中计算整张表
+    """
+
+    def __init__(self):
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def get(self, map_id: int, mappath: str, timeout=TRAVEL_WAIT) -> MapDistances:
+        """
+        获取地图的距离表，航点表变化后最多等待 timeout 秒让后台线程更新
+        """
+        grid_version, grid = occupancy_grids.get(mappath)
+        with self._lock:
+            cached = self._maps.get(map_id)
+        if cached is None or cached[0] != grid_version:
+            # 在锁外构造可通行栅格，其他地图的请求不必等待
+            cached = (grid_version, MapDistances(TravelGrid(grid)))
+            with self._lock:
+                current = self._maps.get(map_id)
+                if current is not None and current[0] == grid_version:
+                    cached = current
+                else:
+                    self._maps[map_id] = cached
+        distances = cached[1]
+        distances.refresh(
+            versions.version(Waypoint.__table__.name),
+            lambda: db.session.query(Waypoint.id, Waypoint.pos_x, Waypoint.pos_y).all(),
+            timeout,
+        )
+        return distances
+
+    def warm(self, app):
+        """
+        在后台线程中为所有地图加载栅格并开始计算距离表，启动后的第一个请求不必等待
+        :param app: Flask 实例，用于在后台线程中创建应用上下文
+        """
+        threading.Thread(
+            target=self._warm, args=(app,), name="travel-distance-warm", daemon=True
+        ).start()
+
+    def _warm(self, app):
+        with app.app_context():
+            maps = db.session.query(Map.id, Map.mappath).all()
+            for map_id, mappath in maps:
+                try:
+                    self.get(map_id, mappath, timeout=0)
+                except MapFileError:
+                    # 没有 YAML 和 PGM 的地图不计算行驶距离
+                    continue
+
+    def invalidate(self, map_id: int):
+        with self._lock:
+            self._maps.pop(map_id, None)
+
+
+# 全局航点行驶距离缓存
+travel_distances = TravelDistanceCache()
@@ -0,0 +1,152 @@
+import random
+import threading
+import uuid
+from collections import defaultdict
+from functools import wraps
+
+from flask import Response, make_response, request
+from sqlalchemy import event, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import db
+from models.table_version_model import TableVersion
+
+
+class TableVersions:
+    """
+    每张表一个版本号，用于生成 ETag 和使进程内的缓存失效
+    版本号保存在 table_version 表中，与修改在同一个事务中加一，多个进程和服务共用；
+    绕过 SQLAlchemy 会话直接修改数据库不会更新版本号
+    另外在进程内维护一份提交后加一的计数，供每次调用都要检查版本的缓存使用，不查询数据库
+    """
+
+    def __init__(self):
+        self._local = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def bump_local(self, *tables: str):
+        with self._lock:
+            for table in tables:
+                self._local[table] += 1
+
+    def local_version(self, table: str) -> int:
+        """
+        本进程提交的修改次数，只能发现本进程的修改
+        """
+        return self._local[table]
+
+    def bump(self, session, tables):
+        """
+        在 session 当前的事务中把各表的版本号加一
+        """
+        connection = session.connection()
+        stored = TableVersion.__table__
+        # 按表名顺序加锁，并发的事务不会互相等待形成死锁
+        for table in sorted(tables):
+            bump = (
+                update(stored)
+                .where(stored.c.tablename == table)
+                .values(version=stored.c.version + 1)
+            )
+            if connection.execute(bump).rowcount:
+                continue
+            # 重建数据库后从随机值开始，旧的 ETag 不会与新的版本号相同
+            try:
+                with connection.begin_nested():
+                    connection.execute(
+                        insert(stored).values(
+                            tablename=table, version=random.randrange(1 << 30)
+                        )
+                    )
+            except IntegrityError:
+                # 其他事务同时插入了该表的版本号
+                connection.execute(bump)
+
+    def current(self, tables) -> dict:
+        """
+        从数据库读取各表的版本号，从未修改过的表为 0
+        """
+        rows = db.session.query(TableVersion.tablename, TableVersion.version).filter(
+            TableVersion.tablename.in_(tables)
+        )
+        stored = dict(rows.all())
+        return {table: stored.get(table, 0) for table in tables}
+
+    def version(self, table: str) -> int:
+        return self.current([table])[table]
+
+    def etag(self, tables, key: str) -> str:
+        """
+        生成强 ETag
+        :param tables: 响应所依赖的表名
+        :param key: 区分同一版本下不同响应的标识，如请求路径和参数
+        :return:
+        """
+        current = self.current(tables)
+        parts = [f"{table}.{current[table]}" for table in tables]
+        return f"{'-'.join(parts)}-{uuid.uuid5(uuid.NAMESPACE_URL, key).hex}"
+
+
+# 全局表版本号
+versions = TableVersions()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed(session, flush_context):
+    tables = session.info.setdefault("changed_tables", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        tables.add(obj.__table__.name)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_executed(orm_execute_state):
+    # db.session.execute(db.insert(...)) 等批量写入不经过 flush
+    state = orm_execute_state
+    if (state.is_insert or state.is_update or state.is_delete) and state.bind_mapper:
+        tables = state.session.info.setdefault("changed_tables", set())
+        tables.add(state.bind_mapper.local_table.name)
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_stored(session):
+    # 先写入尚未 flush 的修改，收集到所有被修改的表
+    session.flush()
+    tables = session.info.get("changed_tables")
+    if tables:
+        versions.bump(session, tables)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_committed(session):
+    versions.bump_local(*session.info.pop("changed_tables", ()))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("changed_tables", None)
+
+
+def conditional(*models):
+    """
+    视图装饰器：根据所依赖表的版本号和请求路径生成 ETag，
+    请求头 If-None-Match 与之匹配时直接返回 304，不执行查询和序列化
+    :param models: 响应所依赖的模型类
+    :return:
+    """
+    tables = [model.__table__.name for model in models]
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = versions.etag(tables, request.full_path)
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+            response.set_etag(etag)
+            return response
+
+        return wrapper
+
+    return decorator
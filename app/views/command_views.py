@@ -0,0 +1,66 @@
+from flask import Blueprint
+from flask_json import JsonError, json_response, request
+from rosbridge.dispatcher import dispatcher
+from rosbridge.connection import manager
+
+command_bp = Blueprint("command_views", __name__)
+
+
+def robot_arg():
+    """
+    读取查询参数中的目标机器人 ID，未指定时返回 None，表示默认机器人
+    """
+    robot_id = request.args.get("robot_id", type=int)
+    if robot_id is not None and robot_id not in manager:
+        raise JsonError(description="Robot not found.")
+    return robot_id
+
+
+@command_bp.route("/commands/<command_id>", methods=["GET"])
+def get_command(command_id):
+    """
+    查询命令执行状态
+    请求成功时，返回状态码 200。响应体包含一个 JSON 对象，其中包含命令的执行状态。
+    ---
+    tags:
+      - Command
+    parameters:
+      - in: path
+        name: command_id
+        type: string
+        required: true
+        description: 命令 ID
+    responses:
+      200:
+        description: 查询命令状态成功
+        schema:
+          id: CommandDetail
+          properties:
+            id:
+              type: string
+              description: 命令 ID
+            name:
+              type: string
+              description: 命令名称
+            status:
+              type: string
+              description: 命令状态，取值为 queued、running、succeeded、failed、cancelled
+            error:
+              type: string
+              description: 失败原因
+            created_at:
+              type: number
+              description: 提交时间
+            started_at:
+              type: number
+              description: 开始执行时间
+            finished_at:
+              type: number
+              description: 执行结束时间
+      400:
+        description: 命令不存在
+    """
+    command = dispatcher.get(command_id)
+    if command is None:
+        raise JsonError(description="Command not found.")
+    return json_response(**command.todict())
@@ -1,13 +1,31 @@
-from flask import Blueprint
+import mimetypes
+import os
+
+from flask import Blueprint, Response, send_file, stream_with_context
 from models.map_model import Map
+from models.waypoint_model import Waypoint
 from flask_json import JsonError, json_response, request
 from database import db
+from pagination import paginate
+from serializers import map_serializer
+from versions import conditional
+from map_tiles import map_tiles
+from occupancy_grid import MapFileError, map_files, occupancy_grids
+from precompressed import negotiate
+from travel_distance import finite, travel_distances
+from waypoint_cache import waypoint_poses
+from waypoint_sync import waypoint_sync
+from waypoint_validation import WAYPOINT_CLEARANCE, check_points
+from waypoint_io import MIMETYPES, WaypointFormatError, export, file_format, load
 from rosbridge.rosbridge_app import mapping_cmd
+from rosbridge.dispatcher import dispatcher
+from views.command_views import robot_arg
 
 map_bp = Blueprint("map_views", __name__)
 
 
 @map_bp.route("/maps", methods=["GET"])
+@conditional(Map)
 def maps():
     """
     获取地图列表
@@ -15,12 +33,36 @@ def maps():
     ---
     tags:
       - Map
+    parameters:
+      - in: query
+        name: cursor
+        type: integer
+        required: false
+        description: 上一页响应中的 next_cursor，不传时返回第一页
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: 每页记录数，最大 1000；只传 cursor 时默认 100，limit 和 cursor 都不传时返回全部记录
+      - in: query
+        name: fields
+        type: string
+        required: false
+        description: 逗号分隔的返回字段，如 mapname,mappath，id 总是返回
+      - in: query
+        name: mapname
+        type: string
+        required: false
+        description: 按地图名称过滤
     responses:
       200:
         description: 获取地图列表成功
         schema:
           id: MapResponse
           properties:
+            next_cursor:
+              type: integer
+              description: 下一页的游标，没有下一页时为 null
             maps:
               type: array
               items:
@@ -39,21 +81,12 @@ def maps():
                     type: string
                     description: 航点文件路径
     """
-    maps = Map.query.all()
-    return json_response(
-        maps=[
-            {
-                "id": map.id,
-                "mapname": map.mapname,
-                "mappath": map.mappath,
-                "waypointpath": map.waypointpath,
-            }
-            for map in maps
-        ]
-    )
+    maps, next_cursor = paginate(map_serializer, ("mapname",))
+    return json_response(maps=maps, next_cursor=next_cursor)
 
 
 @map_bp.route("/maps/<int:map_id>", methods=["GET"])
+@conditional(Map)
 def map_detail(map_id):
     """
     获取地图详情
@@ -91,12 +124,7 @@ def map_detail(map_id):
     map = Map.query.get(map_id)
     if map is None:
         raise JsonError(description="地图不存在")
-    return json_response(
-        id=map.id,
-        mapname=map.mapname,
-        mappath=map.mappath,
-        waypointpath=map.waypointpath,
-    )
+    return json_response(**map_serializer.dump(map))
 
 
 @map_bp.route("/maps", methods=["POST"])
@@ -157,12 +185,7 @@ def create_map():
     map = Map(mapname=mapname, mappath=mappath, waypointpath=waypointpath)
     db.session.add(map)
     db.session.commit()
-    return json_response(
-        id=map.id,
-        mapname=map.mapname,
-        mappath=map.mappath,
-        waypointpath=map.waypointpath,
-    )
+    return json_response(**map_serializer.dump(map))
 
 
 @map_bp.route("/maps/<int:map_id>", methods=["PUT"])
@@ -234,12 +257,9 @@ def update_map(map_id):
     map.mappath = mappath
     map.waypointpath = waypointpath
     db.session.commit()
-    return json_response(
-        id=map.id,
-        mapname=map.mapname,
-        mappath=map.mappath,
-        waypointpath=map.waypointpath,
-    )
+    map_tiles.invalidate(map_id)
+    travel_distances.invalidate(map_id)
+    return json_response(**map_serializer.dump(map))
 
 
 @map_bp.route("/maps/<int:map_id>", methods=["DELETE"])
@@ -282,11 +302,468 @@ def delete_map(map_id):
         raise JsonError(description="地图不存在")
     db.session.delete(map)
     db.session.commit()
+    map_tiles.invalidate(map_id)
+    travel_distances.invalidate(map_id)
+    return json_response(**map_serializer.dump(map))
+
+
+@map_bp.route("/maps/<int:map_id>/waypoints/import", methods=["POST"])
+def import_map_waypoints(map_id):
+    """
+    从地图的航点文件批量导入航点
+    读取 waypointpath 指向的文件，扩展名为 .json、.ndjson 时按对应格式解析，否则按 XML 航点文件解析，
+    在一个事务中写入，航点名称已存在时更新该航点。
+    地图有 YAML 和 PGM 时，航点必须位于空闲区域并与障碍物保持距离，否则整批不写入
+    ---
+    tags:
+      - Map
+    parameters:
+      - in: path
+        name: map_id
+        type: integer
+        required: true
+        description: 地图 ID
+    responses:
+      200:
+        description: 导入航点成功
+        schema:
+          id: WaypointImported
+          properties:
+            imported:
+              type: integer
+              description: 写入的航点数量
+      400:
+        description: 航点文件不存在、格式错误或航点位置无效，errors 中列出所有出错的航点
+      404:
+        description: 地图不存在
+    """
+    map = Map.query.get(map_id)
+    if map is None:
+        raise JsonError(description="地图不存在")
+    try:
+        with open(map.waypointpath, "rb") as f:
+            data = f.read()
+    except OSError:
+        raise JsonError(description=f"无法读取航点文件 {map.waypointpath}")
+    try:
+        grid = occupancy_grids.get(map.mappath)[1]
+    except MapFileError:
+        # 地图没有可读取的 YAML 和 PGM 时不检查航点位置
+        grid = None
+    try:
+        count = load(data, file_format(map.waypointpath), grid)
+    except WaypointFormatError as e:
+        raise JsonError(description="航点文件格式错误", errors=e.errors)
+    return json_response(imported=count)
+
+
+@map_bp.route("/maps/<int:map_id>/waypoints/sync", methods=["POST"])
+def sync_map_waypoints(map_id):
+    """
+    立即把地图的航点文件增量同步到航点表
+    后台每隔几秒自动检查一次航点文件，ROS 端保存航点后也可以调用此接口立即同步。
+    只写入与数据库不同的航点，删除上次同步后从文件中移除的航点，所有修改在一个事务中提交
+    ---
+    tags:
+      - Map
+    parameters:
+      - in: path
+        name: map_id
+        type: integer
+        required: true
+        description: 地图 ID
+    responses:
+      200:
+        description: 同步成功
+        schema:
+          id: WaypointSynced
+          properties:
+            inserted:
+              type: integer
+              description: 新增的航点数量
+            updated:
+              type: integer
+              description: 更新的航点数量
+            deleted:
+              type: integer
+              description: 删除的航点数量
+      400:
+        description: 地图不存在、航点文件无法读取、格式错误或航点位置无效，errors 中列出所有出错的航点
+    """
+    map = Map.query.get(map_id)
+    if map is None:
+        raise JsonError(description="地图不存在")
+    try:
+        result = waypoint_sync.sync(map.id, map.waypointpath or "", force=True)
+    except OSError:
+        raise JsonError(description=f"无法读取航点文件 {map.waypointpath}")
+    except WaypointFormatError as e:
+        raise JsonError(description="航点文件格式错误", errors=e.errors)
+    return json_response(**result)
+
+
+@map_bp.route("/maps/<int:map_id>/waypoints/export", methods=["GET"])
+@conditional(Map, Waypoint)
+def export_map_waypoints(map_id):
+    """
+    按地图航点文件的格式导出所有航点
+    以流的形式返回，格式由 waypointpath 的扩展名决定
+    ---
+    tags:
+      - Map
+    parameters:
+      - in: path
+        name: map_id
+        type: integer
+        required: true
+        description: 地图 ID
+    responses:
+      200:
+        description: 航点数据
+      404:
+        description: 地图不存在
+    """
+    map = Map.query.get(map_id)
+    if map is None:
+        raise JsonError(description="地图不存在")
+    fmt = file_format(map.waypointpath or "")
+    return Response(stream_with_context(export(fmt)), mimetype=MIMETYPES[fmt])
+
+
+def map_pyramid(map_id):
+    """
+    获取地图当前版本的瓦片金字塔，首次访问或地图图片变化后生成
+    :return: (版本标识, TilePyramid)
+    """
+    map = Map.query.get(map_id)
+    if map is None:
+        raise JsonError(description="地图不存在")
+    try:
+        return map_tiles.pyramid(map.id, map.mappath)
+    except MapFileError as e:
+        raise JsonError(description=str(e))
+
+
+@map_bp.route("/maps/<int:map_id>/tiles", methods=["GET"])
+def map_tile_info(map_id):
+    """
+    获取地图瓦片金字塔的信息
+    第 0 级为整张地图缩小到一个瓦片内，第 max_zoom 级为原始分辨率，每级长宽是上一级的两倍；
+    瓦片按行列编号，(0, 0) 为地图图片左上角
+    ---
+    tags:
+      - Map
+    parameters:
+      - in: path
+        name: map_id
+        type: integer
+        required: true
+        description: 地图 ID
+    responses:
+      200:
+        description: 瓦片金字塔信息
+        schema:
+          id: MapTileInfo
+          properties:
+            width:
+              type: integer
+              description: 原始地图宽度（像素）
+            height:
+              type: integer
+              description: 原始地图高度（像素）
+            tile_size:
+              type: integer
+              description: 瓦片边长（像素）
+            max_zoom:
+              type: integer
+              description: 最大缩放级别
+            levels:
+              type: array
+              items:
+                type: object
+                properties:
+                  width:
+                    type: integer
+                    description: 该级地图宽度（像素）
+                  height:
+                    type: integer
+                    description: 该级地图高度（像素）
+                  cols:
+                    type: integer
+                    description: 瓦片列数
+                  rows:
+                    type: integer
+                    description: 瓦片行数
+      400:
+        description: 地图不存在，或地图文件无法读取
+    """
+    _, pyramid = map_pyramid(map_id)
+    meta = pyramid.meta
+    return json_response(
+        width=meta["width"],
+        height=meta["height"],
+        tile_size=meta["tile_size"],
+        max_zoom=pyramid.max_zoom,
+        levels=[
+            {name: level[name] for name in ("width", "height", "cols", "rows")}
+            for level in meta["levels"]
+        ],
+    )
+
+
+@map_bp.route("/maps/<int:map_id>/tiles/<int:z>/<int:x>/<int:y>.png", methods=["GET"])
+def map_tile(map_id, z, x, y):
+    """
+    获取地图瓦片
+    返回 PNG 图片，瓦片直接从内存映射的缓存文件中读取；ETag 随地图图片变化，未变化时返回 304
+    ---
+    tags:
+      - Map
+    produces:
+      - image/png
+    parameters:
+      - in: path
+        name: map_id
+        type: integer
+        required: true
+        description: 地图 ID
+      - in: path
+        name: z
+        type: integer
+        required: true
+        description: 缩放级别，0 为最小
+      - in: path
+        name: x
+        type: integer
+        required: true
+        description: 瓦片列号
+      - in: path
+        name: y
+        type: integer
+        required: true
+        description: 瓦片行号
+    responses:
+      200:
+        description: PNG 瓦片
+      304:
+        description: 瓦片未变化
+      400:
+        description: 地图不存在，或地图文件无法读取
+      404:
+        description: 瓦片不存在
+    """
+    key, pyramid = map_pyramid(map_id)
+    tile = pyramid.tile(z, x, y)
+    if tile is None:
+        raise JsonError(status_=404, description="瓦片不存在")
+    response = Response(tile, mimetype="image/png")
+    response.set_etag(f"{key}-{z}-{x}-{y}")
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@map_bp.route("/maps/<int:map_id>/file", methods=["GET"])
+def map_file(map_id):
+    """
+    下载地图图片
+    mappath 指向 YAML 时下载其中 image 指定的图片。支持 Range 断点续传和 If-Modified-Since、If-None-Match 条件请求；
+    请求头 Accept-Encoding 包含 br 或 gzip 时，发送保存在原文件旁的预压缩版本，首次请求时生成
+    ---
+    tags:
+      - Map
+    produces:
+      - application/octet-stream
+    parameters:
+      - in: path
+        name: map_id
+        type: integer
+        required: true
+        description: 地图 ID
+    responses:
+      200:
+        description: 地图图片
+      206:
+        description: Range 请求的部分内容
+      304:
+        description: 地图图片未变化
+      400:
+        description: 地图不存在，或地图文件无法读取
+      416:
+        description: Range 超出文件范围
+    """
+    map = Map.query.get(map_id)
+    if map is None:
+        raise JsonError(description="地图不存在")
+    try:
+        _, image_path = map_files(map.mappath)
+    except MapFileError as e:
+        raise JsonError(description=str(e))
+    if not os.path.isfile(image_path):
+        raise JsonError(description=f"无法读取地图图片 {image_path}")
+    path, encoding = negotiate(image_path, request.accept_encodings)
+    response = send_file(
+        path,
+        mimetype=mimetypes.guess_type(image_path)[0] or "application/octet-stream",
+        download_name=os.path.basename(image_path),
+        conditional=True,
+    )
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def map_grid(map_id):
+    """
+    获取地图的栅格，地图文件变化后重新读取
+    :return: OccupancyGrid
+    """
+    map = Map.query.get(map_id)
+    if map is None:
+        raise JsonError(description="地图不存在")
+    try:
+        return occupancy_grids.get(map.mappath)[1]
+    except MapFileError as e:
+        raise JsonError(description=str(e))
+
+
+@map_bp.route("/maps/<int:map_id>/waypoints/validate", methods=["GET"])
+def validate_map_waypoints(map_id):
+    """
+    检查所有航点在地图上的位置
+    按 YAML 中的 origin 和 resolution 把航点坐标换算为栅格，
+    检查航点是否在地图范围内、是否位于空闲区域，以及 clearance 米以内是否有障碍物
+    ---
+    tags:
+      - Map
+    parameters:
+      - in: path
+        name: map_id
+        type: integer
+        required: true
+        description: 地图 ID
+      - in: query
+        name: clearance
+        type: float
+        required: false
+        description: 到障碍物的最小距离（米），默认 0.2
+    responses:
+      200:
+        description: 检查结果
+        schema:
+          id: WaypointValidation
+          properties:
+            checked:
+              type: integer
+              description: 检查的航点数量
+            invalid:
+              type: array
+              items:
+                type: object
+                properties:
+                  id:
+                    type: integer
+                    description: 航点 ID
+                  waypointname:
+                    type: string
+                    description: 航点名称
+                  pos_x:
+                    type: float
+                    description: 航点 x 坐标
+                  pos_y:
+                    type: float
+                    description: 航点 y 坐标
+                  problem:
+                    type: string
+                    description: 问题说明
+      400:
+        description: 地图不存在，或地图文件无法读取
+    """
+    grid = map_grid(map_id)
+    clearance = request.args.get("clearance", WAYPOINT_CLEARANCE, type=float)
+    rows = db.session.query(
+        Waypoint.id, Waypoint.waypointname, Waypoint.pos_x, Waypoint.pos_y
+    ).all()
+    problems = check_points(grid, [(row.pos_x, row.pos_y) for row in rows], clearance)
+    return json_response(
+        checked=len(rows),
+        invalid=[
+            {
+                "id": row.id,
+                "waypointname": row.waypointname,
+                "pos_x": row.pos_x,
+                "pos_y": row.pos_y,
+                "problem": problem,
+            }
+            for row, problem in zip(rows, problems)
+            if problem is not None
+        ],
+    )
+
+
+def map_distances(map_id):
+    """
+    获取地图上航点之间的行驶距离，首次访问或地图文件变化后重新计算，航点变化后增量更新
+    :return: MapDistances
+    """
+    map = Map.query.get(map_id)
+    if map is None:
+        raise JsonError(description="地图不存在")
+    try:
+        return travel_distances.get(map.id, map.mappath)
+    except MapFileError as e:
+        raise JsonError(description=str(e))
+
+
+@map_bp.route("/maps/<int:map_id>/distances", methods=["GET"])
+def get_map_distances(map_id):
+    """
+    获取航点之间沿地图可通行区域的行驶距离
+    按 map_server 的 YAML 和 PGM 计算，绕开墙壁和障碍物，比直线距离更接近实际路程
+    ---
+    tags:
+      - Map
+    parameters:
+      - in: path
+        name: map_id
+        type: integer
+        required: true
+        description: 地图 ID
+      - in: query
+        name: waypoints
+        type: string
+        required: true
+        description: 逗号分隔的航点名称
+    responses:
+      200:
+        description: 行驶距离矩阵
+        schema:
+          id: MapDistances
+          properties:
+            waypoints:
+              type: array
+              items:
+                type: string
+              description: 航点名称，与矩阵的行列顺序相同
+            distances:
+              type: array
+              items:
+                type: array
+                items:
+                  type: float
+              description: 行驶距离（米），不可达或航点不在地图内时为 null
+      400:
+        description: 地图不存在、地图文件无法读取，或航点不存在
+    """
+    names = [name for name in request.args.get("waypoints", "").split(",") if name]
+    if not names:
+        raise JsonError(description="航点名称不能为空")
+    poses, missing = waypoint_poses.resolve(names)
+    if missing:
+        raise JsonError(description=f"航点不存在: {missing}")
+    dist = map_distances(map_id).distances([poses[name][:2] for name in names])
     return json_response(
-        id=map.id,
-        mapname=map.mapname,
-        mappath=map.mappath,
-        waypointpath=map.waypointpath,
+        waypoints=names, distances=[[finite(d) for d in row] for row in dist]
     )
 
 
@@ -294,45 +771,85 @@ def delete_map(map_id):
 def start_mapping():
     """
     开始建图
-    请求成功时，返回状态码 200。响应体为空。
+    请求成功时，返回状态码 202。响应体包含命令 ID，可通过 /commands/{command_id} 查询执行状态。
     ---
     tags:
       - Map
+    parameters:
+      - in: query
+        name: robot_id
+        type: integer
+        required: false
+        description: 目标机器人 ID，不指定时发往默认机器人
     responses:
-      200:
-        description: 开始建图成功
+      202:
+        description: 开始建图命令已提交
+        schema:
+          id: CommandAccepted
+          properties:
+            command_id:
+              type: string
+              description: 命令 ID
     """
-    mapping_cmd("start")
-    return json_response()
+    command = dispatcher.submit(
+        "mapping_start", mapping_cmd, "start", robot_id=robot_arg()
+    )
+    return json_response(status_=202, command_id=command.id)
 
 
 @map_bp.route("/maps/save_map", methods=["POST"])
 def save_map():
     """
     保存地图
-    请求成功时，返回状态码 200。响应体为空。
+    请求成功时，返回状态码 202。响应体包含命令 ID，可通过 /commands/{command_id} 查询执行状态。
     ---
     tags:
       - Map
+    parameters:
+      - in: query
+        name: robot_id
+        type: integer
+        required: false
+        description: 目标机器人 ID，不指定时发往默认机器人
     responses:
-      200:
-        description: 保存地图成功
+      202:
+        description: 保存地图命令已提交
+        schema:
+          id: CommandAccepted
+          properties:
+            command_id:
+              type: string
+              description: 命令 ID
     """
-    mapping_cmd("save")
-    return json_response()
+    command = dispatcher.submit(
+        "mapping_save", mapping_cmd, "save", robot_id=robot_arg()
+    )
+    return json_response(status_=202, command_id=command.id)
 
 
 @map_bp.route("/maps/end_mapping", methods=["POST"])
 def end_mapping():
     """
     结束建图
-    请求成功时，返回状态码 200。响应体为空。
+    请求成功时，返回状态码 202。响应体包含命令 ID，可通过 /commands/{command_id} 查询执行状态。
     ---
     tags:
       - Map
+    parameters:
+      - in: query
+        name: robot_id
+        type: integer
+        required: false
+        description: 目标机器人 ID，不指定时发往默认机器人
     responses:
-      200:
-        description: 结束建图成功
+      202:
+        description: 结束建图命令已提交
+        schema:
+          id: CommandAccepted
+          properties:
+            command_id:
+              type: string
+              description: 命令 ID
     """
-    mapping_cmd("end")
-    return json_response()
+    command = dispatcher.submit("mapping_end", mapping_cmd, "end", robot_id=robot_arg())
+    return json_response(status_=202, command_id=command.id)
@@ -2,11 +2,15 @@ from flask import Blueprint
 from models.pt_model import Pt
 from flask_json import JsonError, json_response, request
 from database import db
+from pagination import paginate
+from serializers import pt_serializer
+from versions import conditional
 
 pt_bp = Blueprint("pt_views", __name__)
 
 
 @pt_bp.route("/pts", methods=["GET"])
+@conditional(Pt)
 def get_pts():
     """
     获取所有患者信息
@@ -14,12 +18,41 @@ def get_pts():
     ---
     tags:
       - Pt
+    parameters:
+      - in: query
+        name: cursor
+        type: integer
+        required: false
+        description: 上一页响应中的 next_cursor，不传时返回第一页
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: 每页记录数，最大 1000；只传 cursor 时默认 100，limit 和 cursor 都不传时返回全部记录
+      - in: query
+        name: fields
+        type: string
+        required: false
+        description: 逗号分隔的返回字段，如 name,waypoint_id，id 总是返回
+      - in: query
+        name: name
+        type: string
+        required: false
+        description: 按患者名称过滤
+      - in: query
+        name: waypoint_id
+        type: integer
+        required: false
+        description: 按病床航点 ID 过滤
     responses:
       200:
         description: 获取患者信息成功
         schema:
           id: PtResponse
           properties:
+            next_cursor:
+              type: integer
+              description: 下一页的游标，没有下一页时为 null
             pts:
               type: array
               items:
@@ -35,20 +68,12 @@ def get_pts():
                     type: integer
                     description: 病床航点 ID
     """
-    pts = Pt.query.all()
-    return json_response(
-        pts=[
-            {
-                "id": pt.id,
-                "name": pt.name,
-                "waypoint_id": pt.waypoint_id,
-            }
-            for pt in pts
-        ]
-    )
+    pts, next_cursor = paginate(pt_serializer, ("name", "waypoint_id"))
+    return json_response(pts=pts, next_cursor=next_cursor)
 
 
 @pt_bp.route("/pts/<int:pt_id>", methods=["GET"])
+@conditional(Pt)
 def get_pt(pt_id):
     """
     获取指定患者的信息
@@ -81,11 +106,7 @@ def get_pt(pt_id):
     pt = Pt.query.get(pt_id)
     if pt is None:
         raise JsonError(description="Not Found")
-    return json_response(
-        id=pt.id,
-        name=pt.name,
-        waypoint_id=pt.waypoint_id,
-    )
+    return json_response(**pt_serializer.dump(pt))
 
 
 @pt_bp.route("/pts", methods=["POST"])
@@ -129,11 +150,7 @@ def create_pt():
     pt = Pt(name=data["name"], waypoint_id=data["waypoint_id"])
     db.session.add(pt)
     db.session.commit()
-    return json_response(
-        id=pt.id,
-        name=pt.name,
-        waypoint_id=pt.waypoint_id,
-    )
+    return json_response(**pt_serializer.dump(pt))
 
 
 @pt_bp.route("/pts/<int:pt_id>", methods=["PUT"])
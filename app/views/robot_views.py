@@ -1,8 +1,23 @@
-from flask import Blueprint
+from flask import Blueprint, Response
 from models.robot_model import Robot
 from flask_json import JsonError, json_response, request
 from database import db
-from rosbridge.rosbridge_app import vel_ctrl_cmd
+from pagination import paginate
+from serializers import robot_serializer
+from app import sock
+from rosbridge.rosbridge_app import vel_ctrl_cmd, exception_cmd
+from rosbridge.exception_table import ExceptionTable
+from rosbridge.dispatcher import dispatcher
+from rosbridge.estop import estop
+from rosbridge.state import robot_states
+from rosbridge.connection import manager, RobotUnavailableError
+from views.command_views import robot_arg
+from rosbridge.teleop import TeleopSession
+import json
+from functools import partial
+
+# SSE 连接无状态变化时发送心跳的间隔（秒）
+SSE_KEEPALIVE = 15
 
 robot_bp = Blueprint("robot_views", __name__)
 
@@ -16,12 +31,31 @@ def get_robots():
     ---
     tags:
       - Robot
+    parameters:
+      - in: query
+        name: cursor
+        type: integer
+        required: false
+        description: 上一页响应中的 next_cursor，不传时返回第一页
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: 每页记录数，最大 1000；只传 cursor 时默认 100，limit 和 cursor 都不传时返回全部记录
+      - in: query
+        name: fields
+        type: string
+        required: false
+        description: 逗号分隔的返回字段，如 robot_ip，id 总是返回
     responses:
       200:
         description: 获取机器人信息成功
         schema:
           id: RobotResponse
           properties:
+            next_cursor:
+              type: integer
+              description: 下一页的游标，没有下一页时为 null
             robots:
               type: array
               items:
@@ -37,16 +71,132 @@ def get_robots():
                     type: string
                     description: 机器人 IP
     """
-    robots = Robot.query.all()
+    robots, next_cursor = paginate(robot_serializer)
+    return json_response(robots=robots, next_cursor=next_cursor)
+
+
+@robot_bp.route("/robots/live", methods=["GET"])
+def get_live_robots():
+    """
+    获取所有机器人的实时状态
+    直接读取内存中的状态缓存，不访问数据库。
+    请求成功时，返回状态码 200。响应体包含一个 JSON 对象，其中包含机器人实时状态列表。
+    ---
+    tags:
+      - Robot
+    responses:
+      200:
+        description: 获取机器人实时状态成功
+        schema:
+          id: RobotLiveResponse
+          properties:
+            version:
+              type: integer
+              description: 状态版本号
+            robots:
+              type: array
+              items:
+                type: object
+                properties:
+                  id:
+                    type: integer
+                    description: 机器人 ID
+                  transport_status:
+                    type: string
+                    description: 送药业务状态
+                  cruise_status:
+                    type: string
+                    description: 巡诊业务状态
+                  tp_request:
+                    type: string
+                    description: 测温请求
+                  tp_result:
+                    type: float
+                    description: 测温结果
+                  updated_at:
+                    type: number
+                    description: 最后更新时间
+    """
+    version, robots = robot_states.snapshot()
+    return json_response(version=version, robots=robots)
+
+
+@robot_bp.route("/robots/live/stream", methods=["GET"])
+def stream_live_robots():
+    """
+    订阅机器人实时状态（Server-Sent Events）
+    连接建立后先推送一次全部状态，之后每当有机器人状态变化时推送变化的机器人状态。
+    ---
+    tags:
+      - Robot
+    produces:
+      - text/event-stream
+    responses:
+      200:
+        description: 事件流，每个事件的 data 为机器人实时状态列表
+    """
+
+    def generate():
+        version, robots = robot_states.snapshot()
+        yield f"id: {version}\ndata: {json.dumps(robots)}\n\n"
+        while True:
+            new_version, robots = robot_states.changes(version, SSE_KEEPALIVE)
+            if new_version == version:
+                yield ": keepalive\n\n"
+                continue
+            version = new_version
+            yield f"id: {version}\ndata: {json.dumps(robots)}\n\n"
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@robot_bp.route("/robots/connections", methods=["GET"])
+def get_robot_connections():
+    """
+    获取所有机器人 rosbridge 连接的健康状态
+    请求成功时，返回状态码 200。响应体包含一个 JSON 对象，其中包含连接状态列表。
+    ---
+    tags:
+      - Robot
+    responses:
+      200:
+        description: 获取连接状态成功
+        schema:
+          id: RobotConnectionResponse
+          properties:
+            connections:
+              type: array
+              items:
+                type: object
+                properties:
+                  robot_id:
+                    type: integer
+                    description: 机器人 ID
+                  host:
+                    type: string
+                    description: rosbridge 地址
+                  port:
+                    type: integer
+                    description: rosbridge 端口
+                  connected:
+                    type: boolean
+                    description: 是否已连接
+                  circuit_open:
+                    type: boolean
+                    description: 是否处于熔断状态
+                  failures:
+                    type: integer
+                    description: 连续连接失败次数
+                  last_connected_at:
+                    type: number
+                    description: 最近一次健康检查通过的时间
+    """
     return json_response(
-        robots=[
-            {
-                "id": robot.id,
-                "robot_status": robot.robot_status,
-                "robot_ip": robot.robot_ip,
-            }
-            for robot in robots
-        ]
+        connections=[connection.todict() for connection in manager.all()]
     )
 
 
@@ -83,11 +233,7 @@ def get_robot(robot_id):
     robot = Robot.query.get(robot_id)
     if robot is None:
         raise JsonError(description="Robot not found.")
-    return json_response(
-        id=robot.id,
-        robot_status=robot.robot_status,
-        robot_ip=robot.robot_ip,
-    )
+    return json_response(**robot_serializer.dump(robot))
 
 
 @robot_bp.route("/robots", methods=["POST"])
@@ -137,11 +283,8 @@ def create_robot():
     )
     db.session.add(robot)
     db.session.commit()
-    return json_response(
-        id=robot.id,
-        robot_status=robot.robot_status,
-        robot_ip=robot.robot_ip,
-    )
+    manager.register(robot.id, robot.robot_ip)
+    return json_response(**robot_serializer.dump(robot))
 
 
 @robot_bp.route("/robots/<int:robot_id>", methods=["PUT"])
@@ -200,11 +343,8 @@ def update_robot(robot_id):
         raise JsonError(description="Missing fields.")
 
     db.session.commit()
-    return json_response(
-        id=robot.id,
-        robot_status=robot.robot_status,
-        robot_ip=robot.robot_ip,
-    )
+    manager.register(robot.id, robot.robot_ip)
+    return json_response(**robot_serializer.dump(robot))
 
 
 @robot_bp.route("/robots/<int:robot_id>", methods=["DELETE"])
@@ -231,6 +371,7 @@ def delete_robot(robot_id):
 
     db.session.delete(robot)
     db.session.commit()
+    manager.unregister(robot_id)
 
     return json_response()
 
@@ -238,110 +379,348 @@ def delete_robot(robot_id):
 @robot_bp.route("/ctrl/stop", methods=["POST"])
 def stop():
     """
-    发送停止命令
-    请求成功时，返回状态码 200。响应体为空。
+    急停
+    不经过命令队列，直接发送停车命令，并取消发往目标机器人的排队命令，正在执行的命令也不再发布。
+    请求成功时，返回状态码 200。响应体包含急停在后端的耗时。
     ---
     tags:
       - Robot
+    parameters:
+      - in: query
+        name: robot_id
+        type: integer
+        required: false
+        description: 目标机器人 ID，不指定时作用于所有机器人
     responses:
       200:
         description: 发送停止命令成功
+        schema:
+          id: EstopResponse
+          properties:
+            latency_ms:
+              type: number
+              description: 急停在后端的耗时（毫秒）
+            cancelled:
+              type: integer
+              description: 被取消的命令数量，包括正在执行、尚未发布的命令
+            unreachable:
+              type: array
+              items:
+                type: integer
+              description: 连接不可用、未能送达的机器人 ID
     """
-    vel_ctrl_cmd("stop")
-    return json_response()
+    return json_response(**estop.stop(robot_arg()))
+
+
+@robot_bp.route("/ctrl/interrupt", methods=["POST"])
+def interrupt():
+    """
+    中断当前任务
+    不经过命令队列，直接发送中断命令，并取消发往目标机器人的排队命令，正在执行的命令也不再发布。
+    请求成功时，返回状态码 200。响应体包含中断在后端的耗时。
+    ---
+    tags:
+      - Robot
+    parameters:
+      - in: query
+        name: robot_id
+        type: integer
+        required: false
+        description: 目标机器人 ID，不指定时作用于所有机器人
+    responses:
+      200:
+        description: 发送中断命令成功
+        schema:
+          id: EstopResponse
+          properties:
+            latency_ms:
+              type: number
+              description: 中断在后端的耗时（毫秒）
+            cancelled:
+              type: integer
+              description: 被取消的命令数量，包括正在执行、尚未发布的命令
+            unreachable:
+              type: array
+              items:
+                type: integer
+              description: 连接不可用、未能送达的机器人 ID
+    """
+    return json_response(**estop.interrupt(robot_arg()))
+
+
+@robot_bp.route("/ctrl/recover", methods=["POST"])
+def recover():
+    """
+    从中断中恢复任务
+    请求成功时，返回状态码 202。响应体包含命令 ID，可通过 /commands/{command_id} 查询执行状态。
+    ---
+    tags:
+      - Robot
+    parameters:
+      - in: query
+        name: robot_id
+        type: integer
+        required: false
+        description: 目标机器人 ID，不指定时发往默认机器人
+    responses:
+      202:
+        description: 恢复命令已提交
+        schema:
+          id: CommandAccepted
+          properties:
+            command_id:
+              type: string
+              description: 命令 ID
+    """
+    command = dispatcher.submit(
+        "recover", exception_cmd, ExceptionTable.recover, robot_id=robot_arg()
+    )
+    return json_response(status_=202, command_id=command.id)
+
+
+@robot_bp.route("/ctrl/estop/stats", methods=["GET"])
+def estop_stats():
+    """
+    获取急停耗时统计
+    请求成功时，返回状态码 200。响应体包含最近急停/中断在后端的耗时统计（毫秒）。
+    ---
+    tags:
+      - Robot
+    responses:
+      200:
+        description: 获取急停耗时统计成功
+        schema:
+          id: EstopStats
+          properties:
+            count:
+              type: integer
+              description: 急停次数
+            last:
+              type: number
+              description: 最近一次耗时
+            mean:
+              type: number
+              description: 平均耗时
+            p99:
+              type: number
+              description: 99 分位耗时
+            max:
+              type: number
+              description: 最大耗时
+    """
+    return json_response(**estop.stats())
 
 
 @robot_bp.route("/ctrl/front", methods=["POST"])
 def front():
     """
     发送前进命令
-    请求成功时，返回状态码 200。响应体为空。
+    请求成功时，返回状态码 202。响应体包含命令 ID，可通过 /commands/{command_id} 查询执行状态。
     ---
     tags:
       - Robot
+    parameters:
+      - in: query
+        name: robot_id
+        type: integer
+        required: false
+        description: 目标机器人 ID，不指定时发往默认机器人
     responses:
-      200:
-        description: 发送前进命令成功
+      202:
+        description: 前进命令已提交
+        schema:
+          id: CommandAccepted
+          properties:
+            command_id:
+              type: string
+              description: 命令 ID
     """
-    vel_ctrl_cmd("front")
-    return json_response()
+    command = dispatcher.submit(
+        "vel_ctrl_front", vel_ctrl_cmd, "front", robot_id=robot_arg()
+    )
+    return json_response(status_=202, command_id=command.id)
 
 
 @robot_bp.route("/ctrl/back", methods=["POST"])
 def back():
     """
     发送后退命令
-    请求成功时，返回状态码 200。响应体为空。
+    请求成功时，返回状态码 202。响应体包含命令 ID，可通过 /commands/{command_id} 查询执行状态。
     ---
     tags:
       - Robot
+    parameters:
+      - in: query
+        name: robot_id
+        type: integer
+        required: false
+        description: 目标机器人 ID，不指定时发往默认机器人
     responses:
-      200:
-        description: 发送后退命令成功
+      202:
+        description: 后退命令已提交
+        schema:
+          id: CommandAccepted
+          properties:
+            command_id:
+              type: string
+              description: 命令 ID
     """
-    vel_ctrl_cmd("back")
-    return json_response()
+    command = dispatcher.submit(
+        "vel_ctrl_back", vel_ctrl_cmd, "back", robot_id=robot_arg()
+    )
+    return json_response(status_=202, command_id=command.id)
 
 
 @robot_bp.route("/ctrl/left", methods=["POST"])
 def left():
     """
     发送左移命令
-    请求成功时，返回状态码 200。响应体为空。
+    请求成功时，返回状态码 202。响应体包含命令 ID，可通过 /commands/{command_id} 查询执行状态。
     ---
     tags:
       - Robot
+    parameters:
+      - in: query
+        name: robot_id
+        type: integer
+        required: false
+        description: 目标机器人 ID，不指定时发往默认机器人
     responses:
-      200:
-        description: 发送左移命令成功
+      202:
+        description: 左移命令已提交
+        schema:
+          id: CommandAccepted
+          properties:
+            command_id:
+              type: string
+              description: 命令 ID
     """
-    vel_ctrl_cmd("left")
-    return json_response()
+    command = dispatcher.submit(
+        "vel_ctrl_left", vel_ctrl_cmd, "left", robot_id=robot_arg()
+    )
+    return json_response(status_=202, command_id=command.id)
 
 
 @robot_bp.route("/ctrl/right", methods=["POST"])
 def right():
     """
     发送右移命令
-    请求成功时，返回状态码 200。响应体为空。
+    请求成功时，返回状态码 202。响应体包含命令 ID，可通过 /commands/{command_id} 查询执行状态。
     ---
     tags:
       - Robot
+    parameters:
+      - in: query
+        name: robot_id
+        type: integer
+        required: false
+        description: 目标机器人 ID，不指定时发往默认机器人
     responses:
-      200:
-        description: 发送右移命令成功
+      202:
+        description: 右移命令已提交
+        schema:
+          id: CommandAccepted
+          properties:
+            command_id:
+              type: string
+              description: 命令 ID
     """
-    vel_ctrl_cmd("right")
-    return json_response()
+    command = dispatcher.submit(
+        "vel_ctrl_right", vel_ctrl_cmd, "right", robot_id=robot_arg()
+    )
+    return json_response(status_=202, command_id=command.id)
 
 
 @robot_bp.route("/ctrl/turn_left", methods=["POST"])
 def turn_left():
     """
     发送左转命令
-    请求成功时，返回状态码 200。响应体为空。
+    请求成功时，返回状态码 202。响应体包含命令 ID，可通过 /commands/{command_id} 查询执行状态。
     ---
     tags:
       - Robot
+    parameters:
+      - in: query
+        name: robot_id
+        type: integer
+        required: false
+        description: 目标机器人 ID，不指定时发往默认机器人
     responses:
-      200:
-        description: 发送左转命令成功
+      202:
+        description: 左转命令已提交
+        schema:
+          id: CommandAccepted
+          properties:
+            command_id:
+              type: string
+              description: 命令 ID
     """
-    vel_ctrl_cmd("turn_left")
-    return json_response()
+    command = dispatcher.submit(
+        "vel_ctrl_turn_left", vel_ctrl_cmd, "turn_left", robot_id=robot_arg()
+    )
+    return json_response(status_=202, command_id=command.id)
 
 
 @robot_bp.route("/ctrl/turn_right", methods=["POST"])
 def turn_right():
     """
     发送右转命令
-    请求成功时，返回状态码 200。响应体为空。
+    请求成功时，返回状态码 202。响应体包含命令 ID，可通过 /commands/{command_id} 查询执行状态。
     ---
     tags:
       - Robot
+    parameters:
+      - in: query
+        name: robot_id
+        type: integer
+        required: false
+        description: 目标机器人 ID，不指定时发往默认机器人
     responses:
-      200:
-        description: 发送右转命令成功
+      202:
+        description: 右转命令已提交
+        schema:
+          id: CommandAccepted
+          properties:
+            command_id:
+              type: string
+              description: 命令 ID
     """
-    vel_ctrl_cmd("turn_right")
-    return json_response()
+    command = dispatcher.submit(
+        "vel_ctrl_turn_right", vel_ctrl_cmd, "turn_right", robot_id=robot_arg()
+    )
+    return json_response(status_=202, command_id=command.id)
+
+
+@sock.route("/ctrl/ws", bp=robot_bp)
+def teleop(ws):
+    """
+    遥控 WebSocket 通道
+    客户端以 10~20 Hz 持续发送移动意图，可以是纯文本（如 front）或 JSON（如 {"cmd": "front"}），
+    取值为 stop,front,back,left,right,turn_left,turn_right。
+    服务端合并重复意图，只把最新的变化转发到 /cli_vel_ctrl；客户端静默或断开时自动停车。
+    查询参数 robot_id 指定目标机器人，不指定时控制默认机器人。
+    """
+    robot_id = robot_arg()
+    session = TeleopSession(partial(vel_ctrl_cmd, robot_id=robot_id))
+    try:
+        while True:
+            data = ws.receive(timeout=session.interval)
+            if data is not None:
+                try:
+                    if data.startswith("{"):
+                        data = json.loads(data).get("cmd")
+                    session.update(data)
+                except ValueError as e:
+                    # 未知意图或 JSON 格式错误
+                    ws.send(json.dumps({"error": str(e)}))
+                except (AttributeError, TypeError):
+                    # 二进制帧、不是对象的 JSON，或 cmd 不是字符串
+                    ws.send(json.dumps({"error": "Invalid message."}))
+            session.tick()
+    except RobotUnavailableError as e:
+        ws.send(json.dumps({"error": str(e)}))
+    finally:
+        try:
+            session.close()
+        except RobotUnavailableError:
+            pass
@@ -2,11 +2,15 @@ from flask import Blueprint
 from models.rx_model import Rx
 from flask_json import JsonError, json_response, request
 from database import db
+from pagination import paginate
+from serializers import rx_serializer
+from versions import conditional
 
 rx_bp = Blueprint("rx_views", __name__)
 
 
 @rx_bp.route("/rxs", methods=["GET"])
+@conditional(Rx)
 def get_rxs():
     """
     获取所有处方信息
@@ -14,12 +18,36 @@ def get_rxs():
     ---
     tags:
       - Rx
+    parameters:
+      - in: query
+        name: cursor
+        type: integer
+        required: false
+        description: 上一页响应中的 next_cursor，不传时返回第一页
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: 每页记录数，最大 1000；只传 cursor 时默认 100，limit 和 cursor 都不传时返回全部记录
+      - in: query
+        name: fields
+        type: string
+        required: false
+        description: 逗号分隔的返回字段，如 name，id 总是返回
+      - in: query
+        name: name
+        type: string
+        required: false
+        description: 按处方名称过滤
     responses:
       200:
         description: 获取处方信息成功
         schema:
           id: RxResponse
           properties:
+            next_cursor:
+              type: integer
+              description: 下一页的游标，没有下一页时为 null
             rxs:
               type: array
               items:
@@ -32,19 +60,12 @@ def get_rxs():
                     type: string
                     description: 处方名称
     """
-    rxs = Rx.query.all()
-    return json_response(
-        rxs=[
-            {
-                "id": rx.id,
-                "name": rx.name,
-            }
-            for rx in rxs
-        ]
-    )
+    rxs, next_cursor = paginate(rx_serializer, ("name",))
+    return json_response(rxs=rxs, next_cursor=next_cursor)
 
 
 @rx_bp.route("/rxs/<int:rx_id>", methods=["GET"])
+@conditional(Rx)
 def get_rx(rx_id):
     """
     获取指定处方的信息
@@ -74,10 +95,7 @@ def get_rx(rx_id):
     rx = Rx.query.get(rx_id)
     if rx is None:
         raise JsonError(description="Not Found")
-    return json_response(
-        id=rx.id,
-        name=rx.name,
-    )
+    return json_response(**rx_serializer.dump(rx))
 
 
 @rx_bp.route("/rxs", methods=["POST"])
@@ -120,10 +138,7 @@ def create_rx():
     rx = Rx(name=name)
     db.session.add(rx)
     db.session.commit()
-    return json_response(
-        id=rx.id,
-        name=rx.name,
-    )
+    return json_response(**rx_serializer.dump(rx))
 
 
 @rx_bp.route("/rxs/<int:rx_id>", methods=["PUT"])
@@ -171,10 +186,7 @@ def update_rx(rx_id):
         raise JsonError(description="Bad Request")
     rx.name = name
     db.session.commit()
-    return json_response(
-        id=rx.id,
-        name=rx.name,
-    )
+    return json_response(**rx_serializer.dump(rx))
 
 
 @rx_bp.route("/rxs/<int:rx_id>", methods=["DELETE"])
@@ -0,0 +1,190 @@
+from flask import Blueprint
+from models.pt_model import Pt
+from models.rx_model import Rx
+from models.waypoint_model import Waypoint
+from flask_json import JsonError, json_response, request
+from database import db
+from rosbridge.poseStamped import PoseStamped
+from rosbridge.rosbridge_app import transport_cmd
+from rosbridge.dispatcher import dispatcher
+from rosbridge.transport_batch import TransportBatch
+from views.command_views import robot_arg
+from views.map_views import map_distances
+from travel_distance import ROBOT_SPEED, finite
+from waypoint_cache import waypoint_poses
+
+transport_bp = Blueprint("transport_views", __name__)
+
+
+@transport_bp.route("/transports/batch", methods=["POST"])
+def batch_transport():
+    """
+    批量送药
+    一次提交多个（患者, 处方）送药任务，按提交顺序依次下发给机器人：
+    上一个任务完成（/transport_status 报告 TRANSPORT_DONE_STATUS）后才下发下一个，
+    下发失败或等待超时时其余任务取消。
+    请求成功时，返回状态码 202。响应体包含每个送药任务的命令 ID，可通过 /commands/{command_id} 查询执行状态。
+    ---
+    tags:
+      - Transport
+    parameters:
+      - in: query
+        name: robot_id
+        type: integer
+        required: false
+        description: 目标机器人 ID，不指定时发往默认机器人
+      - in: query
+        name: map_id
+        type: integer
+        required: false
+        description: 指定时按该地图上的行驶距离估算每个送药任务的路程和到达时间
+      - in: body
+        name: body
+        required: true
+        schema:
+          id: BatchTransport
+          required:
+            - pharmacy
+            - origin
+            - deliveries
+          properties:
+            pharmacy:
+              type: string
+              description: 药房航点名称
+            origin:
+              type: string
+              description: 待机点航点名称
+            deliveries:
+              type: array
+              items:
+                type: object
+                properties:
+                  pt_id:
+                    type: integer
+                    description: 患者 ID
+                  rx_id:
+                    type: integer
+                    description: 处方 ID
+    responses:
+      202:
+        description: 送药任务已提交
+        schema:
+          id: BatchTransportAccepted
+          properties:
+            deliveries:
+              type: array
+              items:
+                type: object
+                properties:
+                  pt_id:
+                    type: integer
+                    description: 患者 ID
+                  rx_id:
+                    type: integer
+                    description: 处方 ID
+                  command_id:
+                    type: string
+                    description: 命令 ID
+                  distance:
+                    type: float
+                    description: 从待机点经药房到病床的行驶距离（米），仅指定 map_id 时返回，不可达时为 null
+                  eta:
+                    type: float
+                    description: 预计到达病床的时间（秒），从提交时起算，包含之前的送药任务，不含停留时间；仅指定 map_id 时返回
+      400:
+        description: 请求错误，可能的原因包括参数缺失、送药任务格式错误，或患者、处方、航点不存在
+    """
+    data = request.get_json() or {}
+    if not isinstance(data, dict):
+        raise JsonError(description="请求体必须是 JSON 对象")
+    pharmacy = data.get("pharmacy")
+    origin = data.get("origin")
+    deliveries = data.get("deliveries")
+    if pharmacy is None or origin is None or not deliveries:
+        raise JsonError(description="药房、待机点和送药任务不能为空")
+    if not isinstance(deliveries, list) or not all(
+        isinstance(delivery, dict)
+        and isinstance(delivery.get("pt_id"), int)
+        and isinstance(delivery.get("rx_id"), int)
+        for delivery in deliveries
+    ):
+        raise JsonError(description="每个送药任务都必须包含整数 pt_id 和 rx_id")
+    robot_id = robot_arg()
+
+    pt_ids = {delivery["pt_id"] for delivery in deliveries}
+    rx_ids = {delivery["rx_id"] for delivery in deliveries}
+
+    # 一次联表查询得到所有患者病床的位姿
+    beds = {
+        row.id: row
+        for row in db.session.query(
+            Pt.id,
+            Waypoint.pos_x,
+            Waypoint.pos_y,
+            Waypoint.ori_z,
+            Waypoint.ori_w,
+            Waypoint.table_height,
+        )
+        .join(Waypoint, Pt.waypoint_id == Waypoint.id)
+        .filter(Pt.id.in_(pt_ids))
+    }
+    ends, missing_ends = waypoint_poses.resolve([pharmacy, origin])
+    found_rx_ids = {row.id for row in db.session.query(Rx.id).filter(Rx.id.in_(rx_ids))}
+
+    errors = []
+    missing_pts = sorted(pt_ids - beds.keys())
+    if missing_pts:
+        errors.append(f"患者不存在或未分配病床: {missing_pts}")
+    missing_rxs = sorted(rx_ids - found_rx_ids)
+    if missing_rxs:
+        errors.append(f"处方不存在: {missing_rxs}")
+    if missing_ends:
+        errors.append(f"航点不存在: {missing_ends}")
+    if errors:
+        raise JsonError(description="；".join(errors))
+
+    start_pos = PoseStamped("map", *ends[pharmacy])
+    origin_pos = PoseStamped("map", *ends[origin])
+    targets = {
+        pt_id: PoseStamped("map", bed.pos_x, bed.pos_y, bed.ori_z, bed.ori_w)
+        for pt_id, bed in beds.items()
+    }
+
+    # 行驶距离矩阵的下标：0 为待机点，1 为药房，之后是各病床
+    dist = None
+    map_id = request.args.get("map_id", type=int)
+    if map_id is not None:
+        bed_index = {pt_id: i for i, pt_id in enumerate(targets, 2)}
+        dist = map_distances(map_id).distances(
+            [ends[origin][:2], ends[pharmacy][:2]]
+            + [(bed.pos_x, bed.pos_y) for bed in beds.values()]
+        )
+
+    accepted = []
+    commands = []
+    elapsed = 0.0
+    for delivery in deliveries:
+        pt_id = delivery["pt_id"]
+        command = dispatcher.create(
+            "transport",
+            transport_cmd,
+            start_pos,
+            targets[pt_id],
+            origin_pos,
+            beds[pt_id].table_height,
+            robot_id=robot_id,
+        )
+        commands.append(command)
+        accepted.append(
+            {"pt_id": pt_id, "rx_id": delivery["rx_id"], "command_id": command.id}
+        )
+        if dist is not None:
+            # 任务依次执行：待机点 -> 药房 -> 病床 -> 待机点
+            bed = bed_index[pt_id]
+            to_bed = dist[0, 1] + dist[1, bed]
+            accepted[-1]["distance"] = finite(to_bed)
+            accepted[-1]["eta"] = finite(elapsed + to_bed / ROBOT_SPEED, 1)
+            elapsed += (to_bed + dist[bed, 0]) / ROBOT_SPEED
+    # 上一个任务完成后才下发下一个，与到达时间的估算一致
+    TransportBatch(commands, robot_id).start()
+    return json_response(status_=202, deliveries=accepted)
@@ -1,8 +1,14 @@
 from flask import Blueprint, g
-from models.user_model import User
+from models.user_model import (
+    ACCESS_TOKEN_EXPIRES,
+    REFRESH_TOKEN_EXPIRES,
+    User,
+    current_user,
+)
 from flask_json import JsonError, json_response, request
 from database import db
 from app import multi_auth
+from serializers import user_serializer
 
 user_bp = Blueprint("user_views", __name__)
 
@@ -69,9 +75,7 @@ def new_user():
     user.hash_password(password)
     db.session.add(user)
     db.session.commit()
-    return json_response(
-        id=user.id, username=user.username, role=user.role, message="用户创建成功"
-    )
+    return json_response(**user_serializer.dump(user), message="用户创建成功")
 
 
 @user_bp.route("/users/<int:id>", methods=["GET"])
@@ -111,7 +115,7 @@ def get_user(id):
     if not user:
         # 返回错误：不存在id为 {id} 的用户
         raise JsonError(description=f"不存在id为 {id} 的用户")
-    return json_response(id=user.id, username=user.username, role=user.role)
+    return json_response(**user_serializer.dump(user))
 
 
 @user_bp.route("/token", methods=["GET"])
@@ -120,7 +124,8 @@ def get_auth_token():
     """
     获取授权令牌
     此请求可以使用HTTP Basic Auth（提供用户名和密码）或者 Bearer Token（请求头 Authorization: Bearer {token}）进行认证。
-    成功时，返回一个 JSON 对象，其中包含一个 token 字段，设置为用户的认证令牌，和一个 duration 字段，设置为令牌有效的秒数。
+    成功时，返回一个 JSON 对象，其中包含一个 token 字段，设置为用户的认证令牌，和一个 duration 字段，设置为令牌有效的秒数；
+    以及 refresh_token 和 refresh_duration 字段，access token 过期后可以用 refresh token 在 /token/refresh 换取新的 access token，无需再次提供密码。
     失败时，返回状态码 401（未授权）。
     ---
     tags:
@@ -137,11 +142,92 @@ def get_auth_token():
             duration:
               type: integer
               description: 有效期（秒）
+            refresh_token:
+              type: string
+              description: 刷新令牌
+            refresh_duration:
+              type: integer
+              description: 刷新令牌有效期（秒）
     security:
       - ApiKeyAuth: []
     """
-    token = g.user.generate_auth_token(600)
-    return json_response(token=token, duration=600)
+    user = current_user()
+    return json_response(
+        token=user.generate_auth_token(),
+        duration=ACCESS_TOKEN_EXPIRES,
+        refresh_token=user.generate_refresh_token(),
+        refresh_duration=REFRESH_TOKEN_EXPIRES,
+    )
+
+
+@user_bp.route("/token/refresh", methods=["POST"])
+def refresh_auth_token():
+    """
+    刷新授权令牌
+    用 refresh token 换取新的 access token，不需要验证密码。用户的令牌被吊销后 refresh token 失效。
+    失败时，返回状态码 401（未授权）。
+    ---
+    tags:
+      - User
+    parameters:
+      - in: body
+        name: body
+        schema:
+          id: TokenRefresh
+          required:
+            - refresh_token
+          properties:
+            refresh_token:
+              type: string
+              description: 刷新令牌
+    responses:
+      200:
+        description: 新的授权令牌和有效期
+        schema:
+          id: AuthTokenRefreshResponse
+          properties:
+            token:
+              type: string
+              description: 授权令牌
+            duration:
+              type: integer
+              description: 有效期（秒）
+      401:
+        description: 刷新令牌无效、已过期或已被吊销
+    """
+    user = User.verify_refresh_token(request.json.get("refresh_token") or "")
+    if user is None:
+        raise JsonError(status_=401, description="刷新令牌无效")
+    return json_response(
+        token=user.generate_auth_token(), duration=ACCESS_TOKEN_EXPIRES
+    )
+
+
+@user_bp.route("/token/revoke", methods=["POST"])
+@multi_auth.login_required
+def revoke_auth_tokens():
+    """
+    吊销当前登录用户的所有令牌
+    之前签发的 refresh token 立即失效，access token 最迟在有效期结束后失效。
+    ---
+    tags:
+      - User
+    responses:
+      200:
+        description: 令牌已吊销
+        schema:
+          id: TokenRevokeResponse
+          properties:
+            message:
+              type: string
+              description: 返回消息
+    security:
+      - Bearer: []
+    """
+    user = current_user()
+    user.revoke_tokens()
+    db.session.commit()
+    return json_response(message="令牌已吊销")
 
 
 @user_bp.route("/users/password", methods=["PUT"])
@@ -181,7 +267,7 @@ def change_password():
     security:
       - Bearer: []
     """
-    user = g.user
+    user = current_user()
     old_password = request.json.get("old_password")
     new_password = request.json.get("new_password")
 
@@ -194,6 +280,8 @@ def change_password():
     #     raise JsonError(description="新密码不符合要求，必须至少包含8个字符")
 
     user.hash_password(new_password)
+    # 修改密码后，之前签发的令牌全部失效
+    user.revoke_tokens()
     db.session.commit()
 
     return json_response(message="密码修改成功")
@@ -1,14 +1,65 @@
-from flask import Blueprint
+import math
+import numpy as np
+from flask import Blueprint, Response, stream_with_context
 from models.waypoint_model import Waypoint
 from flask_json import JsonError, json_response, request
 from database import db
+from pagination import paginate
+from serializers import waypoint_serializer
+from versions import conditional, versions
 from rosbridge.poseStamped import PoseStamped
 from rosbridge.rosbridge_app import cruise_cmd
+from rosbridge.dispatcher import dispatcher
+from views.command_views import robot_arg
+from views.map_views import map_distances, map_grid
+from route_planner import distance_matrix, plan_cruise
+from waypoint_cache import waypoint_poses
+from spatial_index import waypoint_index
+from waypoint_io import MIMETYPES, WaypointFormatError, export, load
+from waypoint_validation import check_points
 
 waypoint_bp = Blueprint("waypoint", __name__)
 
 
+def submit_cruise(waypoints: list):
+    """
+    提交巡诊命令；请求参数 optimize=true 时先重新规划访问顺序，起始点仍在最后，
+    同时指定 map_id 时按该地图上的行驶距离规划
+    :param waypoints: PoseStamped 列表，最后一个是机器人的起始点
+    :return: 响应
+    """
+    robot_id = robot_arg()
+    if request.args.get("optimize", "false").lower() != "true":
+        command = dispatcher.submit("cruise", cruise_cmd, waypoints, robot_id=robot_id)
+        return json_response(status_=202, command_id=command.id)
+    points = [(waypoint.position_x, waypoint.position_y) for waypoint in waypoints]
+    dist = None
+    map_id = request.args.get("map_id", type=int)
+    if map_id is not None:
+        dist = map_distances(map_id).distances(points)
+        # 地图上不可达的航点之间仍按直线距离估算
+        dist = np.where(np.isinf(dist), distance_matrix(points), dist)
+    order, length = plan_cruise(points, dist)
+    waypoints = [waypoints[i] for i in order]
+    command = dispatcher.submit("cruise", cruise_cmd, waypoints, robot_id=robot_id)
+    return json_response(status_=202, command_id=command.id, order=order, length=length)
+
+
+def check_position(data: dict):
+    """
+    请求参数指定 map_id 时，检查航点在该地图上的位置，无效时返回 400
+    :param data: 含 pos_x、pos_y 的航点数据
+    """
+    map_id = request.args.get("map_id", type=int)
+    if map_id is None:
+        return
+    problem = check_points(map_grid(map_id), [(data["pos_x"], data["pos_y"])])[0]
+    if problem is not None:
+        raise JsonError(description=f"航点位置无效: {problem}")
+
+
 @waypoint_bp.route("/waypoints", methods=["GET"])
+@conditional(Waypoint)
 def get_waypoints():
     """
     获取航点列表
@@ -16,12 +67,36 @@ def get_waypoints():
     ---
     tags:
       - Waypoint
+    parameters:
+      - in: query
+        name: cursor
+        type: integer
+        required: false
+        description: 上一页响应中的 next_cursor，不传时返回第一页
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: 每页记录数，最大 1000；只传 cursor 时默认 100，limit 和 cursor 都不传时返回全部记录
+      - in: query
+        name: fields
+        type: string
+        required: false
+        description: 逗号分隔的返回字段，如 waypointname,pos_x,pos_y，id 总是返回
+      - in: query
+        name: waypointname
+        type: string
+        required: false
+        description: 按航点名称过滤
     responses:
       200:
         description: 获取航点列表成功
         schema:
           id: WaypointResponse
           properties:
+            next_cursor:
+              type: integer
+              description: 下一页的游标，没有下一页时为 null
             waypoints:
               type: array
               items:
@@ -58,27 +133,15 @@ def get_waypoints():
                     type: float
                     description: 航点桌面高度
     """
-    waypoints = Waypoint.query.all()
-    return json_response(
-        waypoints=[
-            {
-                "id": waypoint.id,
-                "waypointname": waypoint.waypointname,
-                "pos_x": waypoint.pos_x,
-                "pos_y": waypoint.pos_y,
-                "pos_z": waypoint.pos_z,
-                "ori_x": waypoint.ori_x,
-                "ori_y": waypoint.ori_y,
-                "ori_z": waypoint.ori_z,
-                "ori_w": waypoint.ori_w,
-                "table_height": waypoint.table_height,
-            }
-            for waypoint in waypoints
-        ]
+    waypoints, next_cursor = paginate(
+        waypoint_serializer,
+        ("waypointname",),
     )
+    return json_response(waypoints=waypoints, next_cursor=next_cursor)
 
 
 @waypoint_bp.route("/waypoints/<int:waypoint_id>", methods=["GET"])
+@conditional(Waypoint)
 def get_waypoint(waypoint_id):
     """
     获取航点详情
@@ -130,18 +193,7 @@ def get_waypoint(waypoint_id):
     waypoint = Waypoint.query.get(waypoint_id)
     if waypoint is None:
         raise JsonError(description="Waypoint not found.")
-    return json_response(
-        id=waypoint.id,
-        waypointname=waypoint.waypointname,
-        pos_x=waypoint.pos_x,
-        pos_y=waypoint.pos_y,
-        pos_z=waypoint.pos_z,
-        ori_x=waypoint.ori_x,
-        ori_y=waypoint.ori_y,
-        ori_z=waypoint.ori_z,
-        ori_w=waypoint.ori_w,
-        table_height=waypoint.table_height,
-    )
+    return json_response(**waypoint_serializer.dump(waypoint))
 
 
 @waypoint_bp.route("/waypoints", methods=["POST"])
@@ -153,6 +205,11 @@ def create_waypoint():
     tags:
       - Waypoint
     parameters:
+      - in: query
+        name: map_id
+        type: integer
+        required: false
+        description: 指定时检查航点在该地图上是否位于空闲区域并与障碍物保持距离
       - in: body
         name: body
         required: true
@@ -234,6 +291,7 @@ def create_waypoint():
               description: 航点桌面高度
     """
     data = request.get_json()
+    check_position(data)
     waypoint = Waypoint(
         waypointname=data["waypointname"],
         pos_x=data["pos_x"],
@@ -247,18 +305,15 @@ def create_waypoint():
     )
     db.session.add(waypoint)
     db.session.commit()
-    return json_response(
-        id=waypoint.id,
-        waypointname=waypoint.waypointname,
-        pos_x=waypoint.pos_x,
-        pos_y=waypoint.pos_y,
-        pos_z=waypoint.pos_z,
-        ori_x=waypoint.ori_x,
-        ori_y=waypoint.ori_y,
-        ori_z=waypoint.ori_z,
-        ori_w=waypoint.ori_w,
-        table_height=waypoint.table_height,
+    waypoint_poses.invalidate()
+    waypoint_index.add(
+        waypoint.id,
+        waypoint.waypointname,
+        waypoint.pos_x,
+        waypoint.pos_y,
+        versions.version(Waypoint.__table__.name),
     )
+    return json_response(**waypoint_serializer.dump(waypoint))
 
 
 @waypoint_bp.route("/waypoints/<int:waypoint_id>", methods=["PUT"])
@@ -274,6 +329,11 @@ def update_waypoint(waypoint_id):
         name: waypoint_id
         type: integer
     parameters:
+      - in: query
+        name: map_id
+        type: integer
+        required: false
+        description: 指定时检查航点在该地图上是否位于空闲区域并与障碍物保持距离
       - in: body
         name: body
         required: true
@@ -348,6 +408,7 @@ def update_waypoint(waypoint_id):
     if waypoint is None:
         raise JsonError(description="Waypoint not found.")
     data = request.get_json()
+    check_position(data)
     waypoint.waypointname = data["waypointname"]
     waypoint.pos_x = data["pos_x"]
     waypoint.pos_y = data["pos_y"]
@@ -358,18 +419,15 @@ def update_waypoint(waypoint_id):
     waypoint.ori_w = data["ori_w"]
     waypoint.table_height = data["table_height"]
     db.session.commit()
-    return json_response(
-        id=waypoint.id,
-        waypointname=waypoint.waypointname,
-        pos_x=waypoint.pos_x,
-        pos_y=waypoint.pos_y,
-        pos_z=waypoint.pos_z,
-        ori_x=waypoint.ori_x,
-        ori_y=waypoint.ori_y,
-        ori_z=waypoint.ori_z,
-        ori_w=waypoint.ori_w,
-        table_height=waypoint.table_height,
+    waypoint_poses.invalidate()
+    waypoint_index.add(
+        waypoint.id,
+        waypoint.waypointname,
+        waypoint.pos_x,
+        waypoint.pos_y,
+        versions.version(Waypoint.__table__.name),
     )
+    return json_response(**waypoint_serializer.dump(waypoint))
 
 
 @waypoint_bp.route("/waypoints/<int:waypoint_id>", methods=["DELETE"])
@@ -393,9 +451,215 @@ def delete_waypoint(waypoint_id):
         raise JsonError(description="Waypoint not found.")
     db.session.delete(waypoint)
     db.session.commit()
+    waypoint_poses.invalidate()
+    waypoint_index.remove(waypoint_id, versions.version(Waypoint.__table__.name))
     return json_response()
 
 
+def float_arg(name: str) -> float:
+    try:
+        value = float(request.args[name])
+    except KeyError:
+        raise JsonError(description=f"Missing parameter: {name}")
+    except ValueError:
+        raise JsonError(description=f"{name} must be a number.")
+    # float 接受 nan 和 inf，无法换算为网格坐标
+    if not math.isfinite(value):
+        raise JsonError(description=f"{name} must be a finite number.")
+    return value
+
+
+@waypoint_bp.route("/waypoints/nearest", methods=["GET"])
+def nearest_waypoints():
+    """
+    查询距离给定位置最近的航点
+    请求成功时，返回状态码 200。响应体包含按距离从近到远排列的航点列表。
+    ---
+    tags:
+      - Waypoint
+    parameters:
+      - in: query
+        name: x
+        type: float
+        required: true
+        description: x 坐标
+      - in: query
+        name: y
+        type: float
+        required: true
+        description: y 坐标
+      - in: query
+        name: k
+        type: integer
+        required: false
+        description: 返回的航点数量，默认 1，最大 100
+    responses:
+      200:
+        description: 查询成功
+        schema:
+          id: WaypointNearest
+          properties:
+            waypoints:
+              type: array
+              items:
+                type: object
+                properties:
+                  id:
+                    type: integer
+                    description: 航点 ID
+                  waypointname:
+                    type: string
+                    description: 航点名称
+                  pos_x:
+                    type: float
+                    description: 航点 x 坐标
+                  pos_y:
+                    type: float
+                    description: 航点 y 坐标
+                  distance:
+                    type: float
+                    description: 到给定位置的距离
+    """
+    x, y = float_arg("x"), float_arg("y")
+    k = request.args.get("k", 1, type=int)
+    if not 0 < k <= 100:
+        raise JsonError(description="k must be between 1 and 100.")
+    return json_response(waypoints=waypoint_index.nearest(x, y, k))
+
+
+@waypoint_bp.route("/waypoints/within", methods=["GET"])
+def waypoints_within():
+    """
+    查询矩形范围内的航点
+    请求成功时，返回状态码 200。响应体包含范围内的航点列表。
+    ---
+    tags:
+      - Waypoint
+    parameters:
+      - in: query
+        name: bbox
+        type: string
+        required: true
+        description: 矩形范围 min_x,min_y,max_x,max_y
+    responses:
+      200:
+        description: 查询成功
+        schema:
+          id: WaypointWithin
+          properties:
+            waypoints:
+              type: array
+              items:
+                type: object
+                properties:
+                  id:
+                    type: integer
+                    description: 航点 ID
+                  waypointname:
+                    type: string
+                    description: 航点名称
+                  pos_x:
+                    type: float
+                    description: 航点 x 坐标
+                  pos_y:
+                    type: float
+                    description: 航点 y 坐标
+    """
+    try:
+        min_x, min_y, max_x, max_y = map(float, request.args["bbox"].split(","))
+    except (KeyError, ValueError):
+        raise JsonError(description="bbox must be min_x,min_y,max_x,max_y.")
+    if not all(map(math.isfinite, (min_x, min_y, max_x, max_y))):
+        raise JsonError(description="bbox must be finite numbers.")
+    if min_x > max_x or min_y > max_y:
+        raise JsonError(description="bbox must be min_x,min_y,max_x,max_y.")
+    return json_response(waypoints=waypoint_index.within(min_x, min_y, max_x, max_y))
+
+
+@waypoint_bp.route("/waypoints/import", methods=["POST"])
+def import_waypoints():
+    """
+    批量导入航点
+    请求体是 JSON（航点数组或 {"waypoints": [...]}）、NDJSON（Content-Type: application/x-ndjson，每行一个航点）
+    或 XML 航点文件（Content-Type: application/xml），在一个事务中写入，航点名称已存在时更新该航点
+    pos_z、ori_x、ori_y 可省略，默认为 0；table_height 可省略，更新时保留原值
+    请求成功时，返回状态码 200。响应体包含写入的航点数量。
+    ---
+    tags:
+      - Waypoint
+    consumes:
+      - application/json
+      - application/x-ndjson
+      - application/xml
+    parameters:
+      - in: query
+        name: map_id
+        type: integer
+        required: false
+        description: 指定时检查所有航点在该地图上是否位于空闲区域并与障碍物保持距离，有无效航点时整批不写入
+      - in: body
+        name: body
+        required: true
+        schema:
+          id: WaypointImport
+          properties:
+            waypoints:
+              type: array
+              items:
+                $ref: "#/definitions/WaypointCreate"
+    responses:
+      200:
+        description: 导入航点成功
+        schema:
+          id: WaypointImported
+          properties:
+            imported:
+              type: integer
+              description: 写入的航点数量
+      400:
+        description: 数据格式错误或航点位置无效，errors 中列出所有出错的航点
+    """
+    if request.mimetype == "application/x-ndjson":
+        fmt = "ndjson"
+    elif request.mimetype in ("application/xml", "text/xml"):
+        fmt = "xml"
+    else:
+        fmt = "json"
+    map_id = request.args.get("map_id", type=int)
+    grid = map_grid(map_id) if map_id is not None else None
+    try:
+        count = load(request.get_data(), fmt, grid)
+    except WaypointFormatError as e:
+        raise JsonError(description="航点数据格式错误", errors=e.errors)
+    return json_response(imported=count)
+
+
+@waypoint_bp.route("/waypoints/export", methods=["GET"])
+@conditional(Waypoint)
+def export_waypoints():
+    """
+    导出所有航点
+    以流的形式返回，格式与导入时相同
+    ---
+    tags:
+      - Waypoint
+    parameters:
+      - in: query
+        name: format
+        type: string
+        enum: [json, ndjson, xml]
+        required: false
+        description: 导出格式，默认 json
+    responses:
+      200:
+        description: 航点数据
+    """
+    fmt = request.args.get("format", "json")
+    if fmt not in MIMETYPES:
+        raise JsonError(description=f"Unsupported format: {fmt}")
+    return Response(stream_with_context(export(fmt)), mimetype=MIMETYPES[fmt])
+
+
 @waypoint_bp.route("/waypoints/startcruisebyvalue", methods=["post"])
 def startcruisebyvalue():
     """
@@ -432,9 +696,38 @@ def startcruisebyvalue():
                   ori_w:
                     type: float
                     description: 航点 w 方向
+      - in: query
+        name: robot_id
+        type: integer
+        required: false
+        description: 目标机器人 ID，不指定时发往默认机器人
+      - in: query
+        name: optimize
+        type: boolean
+        required: false
+        description: 为 true 时重新规划访问顺序以缩短路程，起始点仍在最后
+      - in: query
+        name: map_id
+        type: integer
+        required: false
+        description: 与 optimize=true 一起使用，按该地图上的行驶距离而不是直线距离规划
     responses:
-      200:
-        description: 启动巡诊模式成功
+      202:
+        description: 启动巡诊模式命令已提交
+        schema:
+          id: CruiseAccepted
+          properties:
+            command_id:
+              type: string
+              description: 命令 ID
+            order:
+              type: array
+              items:
+                type: integer
+              description: 规划后的访问顺序，即请求中航点的下标，仅 optimize=true 时返回
+            length:
+              type: float
+              description: 预计路程（米），仅 optimize=true 时返回
     """
     data = request.get_json()
     waypoints = []
@@ -448,8 +741,7 @@ def startcruisebyvalue():
                 waypoint["ori_w"],
             )
         )
-    cruise_cmd(waypoints)
-    return json_response()
+    return submit_cruise(waypoints)
 
 
 @waypoint_bp.route("/waypoints/startcruisebyname", methods=["post"])
@@ -473,20 +765,45 @@ def startcruisebyname():
               type: array
               items:
                 type: string
+      - in: query
+        name: robot_id
+        type: integer
+        required: false
+        description: 目标机器人 ID，不指定时发往默认机器人
+      - in: query
+        name: optimize
+        type: boolean
+        required: false
+        description: 为 true 时重新规划访问顺序以缩短路程，起始点仍在最后
+      - in: query
+        name: map_id
+        type: integer
+        required: false
+        description: 与 optimize=true 一起使用，按该地图上的行驶距离而不是直线距离规划
     responses:
-      200:
-        description: 启动巡诊模式成功
+      202:
+        description: 启动巡诊模式命令已提交
+        schema:
+          id: CruiseAccepted
+          properties:
+            command_id:
+              type: string
+              description: 命令 ID
+            order:
+              type: array
+              items:
+                type: integer
+              description: 规划后的访问顺序，即请求中航点的下标，仅 optimize=true 时返回
+            length:
+              type: float
+              description: 预计路程（米），仅 optimize=true 时返回
+      400:
+        description: 航点不存在，错误信息中列出所有不存在的航点名称
     """
     data = request.get_json()
-    waypoints = []
-    for waypoint_name in data["waypoints"]:
-        waypoint = Waypoint.query.filter_by(waypointname=waypoint_name).first()
-        if waypoint is None:
-            raise JsonError(description="Waypoint not found.")
-        waypoints.append(
-            PoseStamped(
-                "map", waypoint.pos_x, waypoint.pos_y, waypoint.ori_z, waypoint.ori_w
-            )
-        )
-    cruise_cmd(waypoints)
-    return json_response()
+    names = data["waypoints"]
+    poses, missing = waypoint_poses.resolve(names)
+    if missing:
+        raise JsonError(description=f"Waypoint not found: {missing}")
+    waypoints = [PoseStamped("map", *poses[name]) for name in names]
+    return submit_cruise(waypoints)
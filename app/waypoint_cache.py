@@ -0,0 +1,63 @@
+import threading
+
+from database import db
+from models.waypoint_model import Waypoint
+from versions import versions
+
+
+class WaypointPoseCache:
+    """
+    航点名称到位姿 (pos_x, pos_y, ori_z, ori_w) 的进程内缓存，
+    未命中的名称用一次 IN 查询补齐；每次解析时检查航点表的版本号，
+    其他进程修改航点表后也会清空，本进程的视图写入后可以调用 invalidate 立即清空
+    """
+
+    def __init__(self):
+        self._poses = {}
+        self._generation = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+    def resolve(self, names):
+        """
+        把航点名称解析为位姿
+        :param names: 航点名称列表
+        :return: (名称到位姿的映射, 不存在的名称列表)
+        """
+        version = versions.version(Waypoint.__table__.name)
+        with self._lock:
+            if version != self._version:
+                self._poses.clear()
+                self._generation += 1
+                self._version = version
+            poses = {name: self._poses[name] for name in names if name in self._poses}
+            generation = self._generation
+        unknown = set(names) - poses.keys()
+        if unknown:
+            rows = db.session.query(
+                Waypoint.waypointname,
+                Waypoint.pos_x,
+                Waypoint.pos_y,
+                Waypoint.ori_z,
+                Waypoint.ori_w,
+            ).filter(Waypoint.waypointname.in_(unknown))
+            found = {row.waypointname: tuple(row[1:]) for row in rows}
+            with self._lock:
+                # 查询期间缓存被清空过时，查到的可能是旧数据，不写入缓存
+                if generation == self._generation:
+                    self._poses.update(found)
+            poses.update(found)
+        missing = []
+        for name in names:
+            if name not in poses and name not in missing:
+                missing.append(name)
+        return poses, missing
+
+    def invalidate(self):
+        with self._lock:
+            self._poses.clear()
+            self._generation += 1
+
+
+# 全局航点位姿缓存
+waypoint_poses = WaypointPoseCache()
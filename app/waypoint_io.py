@@ -0,0 +1,245 @@
+import json
+import os
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from flask import current_app
+from sqlalchemy import func, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from database import db
+from models.waypoint_model import Waypoint
+from waypoint_cache import waypoint_poses
+from spatial_index import waypoint_index
+from serializers import waypoint_serializer
+from waypoint_validation import invalid_waypoints
+
+# 航点字段，及导入时可以省略的字段的默认值
+FIELDS = (
+    "waypointname",
+    "pos_x",
+    "pos_y",
+    "pos_z",
+    "ori_x",
+    "ori_y",
+    "ori_z",
+    "ori_w",
+    "table_height",
+)
+DEFAULTS = {"pos_z": 0.0, "ori_x": 0.0, "ori_y": 0.0, "table_height": None}
+# 航点文件（waterplus_map_tools 格式）中的标签名
+XML_TAGS = {
+    "waypointname": "Name",
+    "pos_x": "Pos_x",
+    "pos_y": "Pos_y",
+    "pos_z": "Pos_z",
+    "ori_x": "Ori_x",
+    "ori_y": "Ori_y",
+    "ori_z": "Ori_z",
+    "ori_w": "Ori_w",
+    "table_height": "Table_height",
+}
+# 导出时每次从数据库读取的行数
+EXPORT_BATCH_SIZE = 500
+MIMETYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "xml": "application/xml",
+}
+
+
+class WaypointFormatError(ValueError):
+    """
+    航点数据格式错误，errors 中是所有出错记录的说明
+    """
+
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def file_format(path: str) -> str:
+    """
+    根据航点文件的扩展名判断格式，默认是 xml
+    """
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    return ext if ext in ("json", "ndjson") else "xml"
+
+
+def parse(data, fmt: str) -> list:
+    """
+    解析航点数据
+    :param data: 文本或字节
+    :param fmt: json、ndjson 或 xml
+    :return: 航点字典列表，字段未经校验
+    """
+    try:
+        if fmt == "xml":
+            root = ElementTree.fromstring(data)
+            return [
+                {
+                    field: node.findtext(tag)
+                    for field, tag in XML_TAGS.items()
+                    if node.find(tag) is not None
+                }
+                for node in root.iter("Waypoint")
+            ]
+        if fmt == "ndjson":
+            if isinstance(data, bytes):
+                data = data.decode("utf-8")
+            return [json.loads(line) for line in data.splitlines() if line.strip()]
+        data = json.loads(data)
+    except (ElementTree.ParseError, ValueError) as e:
+        raise WaypointFormatError([f"无法解析 {fmt} 数据: {e}"])
+    waypoints = data.get("waypoints") if isinstance(data, dict) else data
+    if not isinstance(waypoints, list):
+        raise WaypointFormatError(['JSON 数据应为航点数组或 {"waypoints": [...]}'])
+    return waypoints
+
+
+def validate(waypoints: list) -> list:
+    """
+    校验并补全航点字段，一次报告所有出错的记录
+    :param waypoints: 航点字典列表
+    :return: 可直接用于批量写入的行
+    """
+    rows, errors = [], []
+    for i, waypoint in enumerate(waypoints):
+        if not isinstance(waypoint, dict):
+            errors.append(f"第 {i + 1} 个航点不是对象")
+            continue
+        row = dict(DEFAULTS)
+        row.update({k: v for k, v in waypoint.items() if k in FIELDS and v is not None})
+        missing = [field for field in FIELDS if field not in row]
+        if missing:
+            errors.append(f"第 {i + 1} 个航点缺少字段 {missing}")
+            continue
+        try:
+            for field in FIELDS[1:]:
+                if row[field] is not None:
+                    row[field] = float(row[field])
+        except (TypeError, ValueError):
+            errors.append(f"第 {i + 1} 个航点的坐标不是数字")
+            continue
+        row["waypointname"] = str(row["waypointname"])
+        rows.append(row)
+    if errors:
+        raise WaypointFormatError(errors)
+    return rows
+
+
+def upsert(rows: list) -> int:
+    """
+    在一个事务中批量写入航点，名称已存在时更新；导入数据没有桌面高度时保留原值
+    :param rows: validate 返回的行
+    :return: 写入的航点数量
+    """
+    if not rows:
+        return 0
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "sqlite":
+        stmt = sqlite.insert(Waypoint)
+    elif dialect == "postgresql":
+        stmt = postgresql.insert(Waypoint)
+    else:
+        return _upsert_by_name(rows)
+    columns = {field: stmt.excluded[field] for field in FIELDS[1:]}
+    columns["table_height"] = func.coalesce(
+        stmt.excluded.table_height, Waypoint.table_height
+    )
+    stmt = stmt.on_conflict_do_update(index_elements=["waypointname"], set_=columns)
+    try:
+        db.session.execute(stmt, rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(rows)
+
+
+def _upsert_by_name(rows: list) -> int:
+    """
+    不支持 ON CONFLICT 的数据库（如 MySQL）使用的通用写法：
+    先按名称查出已存在的航点，再在同一个事务中批量更新和插入
+    """
+    # 同名航点以最后一个为准，与 ON CONFLICT 逐行写入的结果一致
+    rows = list({row["waypointname"]: row for row in rows}.values())
+    try:
+        existing = dict(
+            db.session.query(Waypoint.waypointname, Waypoint.id).filter(
+                Waypoint.waypointname.in_([row["waypointname"] for row in rows])
+            )
+        )
+        inserts, updates = [], []
+        for row in rows:
+            waypoint_id = existing.get(row["waypointname"])
+            if waypoint_id is None:
+                inserts.append(row)
+                continue
+            values = {"id": waypoint_id, **row}
+            if values["table_height"] is None:
+                # 导入数据没有桌面高度时保留原值
+                del values["table_height"]
+            updates.append(values)
+        if inserts:
+            db.session.execute(insert(Waypoint), inserts)
+        if updates:
+            db.session.execute(update(Waypoint), updates)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(rows)
+
+
+def load(data, fmt: str, grid=None) -> int:
+    """
+    解析、校验并批量写入航点数据
+    :param data: 文本或字节
+    :param fmt: json、ndjson 或 xml
+    :param grid: OccupancyGrid，指定时航点必须位于地图的空闲区域并与障碍物保持距离
+    :return: 写入的航点数量
+    """
+    rows = validate(parse(data, fmt))
+    if grid is not None:
+        errors = invalid_waypoints(grid, rows)
+        if errors:
+            raise WaypointFormatError(errors)
+    count = upsert(rows)
+    waypoint_poses.invalidate()
+    waypoint_index.invalidate()
+    return count
+
+
+def export(fmt: str):
+    """
+    按批次读取所有航点并逐条序列化，不在内存中构造完整的响应
+    :param fmt: json、ndjson 或 xml
+    :return: 生成响应文本片段的生成器
+    """
+    query = (
+        waypoint_serializer.query(FIELDS)
+        .order_by(Waypoint.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    dump_row = waypoint_serializer.row_dumper(FIELDS)
+    dumps = current_app.json.dumps
+    if fmt == "xml":
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n<Waterplus>\n'
+        for row in query:
+            yield "    <Waypoint>\n"
+            for field, value in zip(FIELDS, row):
+                if value is not None:
+                    tag = XML_TAGS[field]
+                    yield f"        <{tag}>{escape(str(value))}</{tag}>\n"
+            yield "    </Waypoint>\n"
+        yield "</Waterplus>\n"
+    elif fmt == "ndjson":
+        for row in query:
+            yield dumps(dump_row(row), sort_keys=False) + "\n"
+    else:
+        yield '{"waypoints": ['
+        separator = ""
+        for row in query:
+            yield separator + dumps(dump_row(row), sort_keys=False)
+            separator = ", "
+        yield "]}\n"
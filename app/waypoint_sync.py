@@ -0,0 +1,328 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，不限制同步进程
+    fcntl = None
+
+from sqlalchemy import delete, insert, update
+
+from app import app
+from database import db
+from models.map_model import Map
+from models.waypoint_model import Waypoint
+from occupancy_grid import MapFileError, occupancy_grids
+from spatial_index import waypoint_index
+from waypoint_cache import waypoint_poses
+from waypoint_io import FIELDS, WaypointFormatError, file_format, parse, validate
+from waypoint_validation import invalid_waypoints
+
+# 检查航点文件是否变化的间隔（秒）
+SYNC_INTERVAL = float(os.environ.get("WAYPOINT_SYNC_INTERVAL", 2.0))
+# 多进程部署时只有取得该文件锁的进程运行后台同步
+SYNC_LOCK = os.environ.get(
+    "WAYPOINT_SYNC_LOCK", os.path.join(tempfile.gettempdir(), "waypoint_sync.lock")
+)
+
+_XML_RECORD = re.compile(rb"<Waypoint\b.*?</Waypoint>", re.S)
+
+
+def split_records(data: bytes, fmt: str) -> list:
+    """
+    把航点文件切分为每个航点的原始数据，不解析字段
+    """
+    if fmt == "xml":
+        return _XML_RECORD.findall(data)
+    if fmt == "ndjson":
+        return [line for line in data.splitlines() if line.strip()]
+    # JSON 需要整体解析，再把每个航点重新序列化作为其原始数据
+    return [app.json.dumps(waypoint).encode() for waypoint in parse(data, fmt)]
+
+
+def parse_records(records: list, fmt: str) -> list:
+    """
+    解析并校验 split_records 切分出的部分航点，返回的行与 records 一一对应
+    """
+    if not records:
+        return []
+    if fmt == "xml":
+        data = b"<Waterplus>" + b"".join(records) + b"</Waterplus>"
+    elif fmt == "ndjson":
+        data = b"\n".join(records)
+    else:
+        data = b"[" + b",".join(records) + b"]"
+    return validate(parse(data, fmt))
+
+
+class FileState:
+    """
+    航点文件上次同步时的状态，只保存在内存中，用于跳过未变化的文件和航点
+
+    path: 文件路径
+    stat: (大小, 修改时间)
+    digest: 文件内容的哈希
+    records: 每个航点原始数据的哈希到解析结果的映射
+    """
+
+    def __init__(self, path: str, stat, digest: str, records: dict):
+        self.path = path
+        self.stat = stat
+        self.digest = digest
+        self.records = records
+
+
+class WaypointFileSync:
+    """
+    把地图的航点文件（Map.waypointpath）增量同步到航点表：
+    大小和修改时间不变时不读取文件，内容哈希不变时不解析，
+    只解析原始数据与上次不同的航点，并只写入与数据库不同的航点，删除从文件中移除的航点，
+    所有修改在一个事务中提交。由后台线程定期检查，也可以通过接口立即同步
+    上次同步的内容哈希和航点名称与航点一起保存在地图表中，重启后仍能识别未变化的文件和被移除的航点
+
+    app: Flask 实例，用于在后台线程中创建应用上下文
+    interval: 检查间隔
+    lock_path: 后台同步的文件锁，同一台机器上只有一个进程运行后台同步
+    """
+
+    def __init__(self, app, interval=SYNC_INTERVAL, lock_path=SYNC_LOCK):
+        self.app = app
+        self.interval = interval
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._states = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def sync(self, map_id: int, path: str, force=False) -> dict:
+        """
+        同步一张地图的航点文件
+        :param map_id: 地图 ID
+        :param path: 航点文件路径
+        :param force: 为 True 时不跳过未变化的文件，把文件中的所有航点与数据库比较，
+                      纠正通过接口或直接修改数据库造成的差异
+        :return: 插入、更新、删除的航点数量
+        """
+        result = {"inserted": 0, "updated": 0, "deleted": 0}
+        with self._lock:
+            st = os.stat(path)
+            stat = (st.st_size, st.st_mtime_ns)
+            state = self._states.get(map_id)
+            if state is not None and state.path != path:
+                state = None
+            if state is not None and state.stat == stat and not force:
+                return result
+            synced = (
+                db.session.query(Map.waypointdigest, Map.waypointnames)
+                .filter(Map.id == map_id)
+                .one_or_none()
+            )
+            if synced is None:
+                return result
+            with open(path, "rb") as f:
+                data = f.read()
+            digest = hashlib.sha1(data).hexdigest()
+            if synced.waypointdigest == digest and not force:
+                if state is None or state.digest != digest:
+                    state = FileState(path, stat, digest, {})
+                state.stat = stat
+                self._states[map_id] = state
+                return result
+            fmt = file_format(path)
+            old = state.records if state is not None else {}
+            try:
+                keys, changed = [], []
+                for record in split_records(data, fmt):
+                    key = hashlib.blake2b(record, digest_size=16).digest()
+                    keys.append(key)
+                    if key not in old:
+                        changed.append((key, record))
+                rows = parse_records([record for _, record in changed], fmt)
+            except WaypointFormatError:
+                # 文件变化前不再重复解析，上次成功同步的状态保留用于下次比较
+                if state is not None:
+                    state.stat = stat
+                raise
+            parsed = dict(old)
+            parsed.update((key, row) for (key, _), row in zip(changed, rows))
+            records = {key: parsed[key] for key in keys}
+            # 同名航点以文件中最后一个为准
+            current = {row["waypointname"]: row for row in records.values()}
+            if force or state is None:
+                # 数据库可能已被修改，文件中的所有航点都与数据库比较
+                names = current.keys()
+            else:
+                names = {row["waypointname"] for row in rows}
+            # 航点表没有地图列，只删除本地图的文件上次同步时拥有的航点
+            previous = set(json.loads(synced.waypointnames or "[]"))
+            removed = previous - current.keys()
+            try:
+                result = self._apply(
+                    map_id,
+                    digest,
+                    sorted(current),
+                    [current[name] for name in names],
+                    removed,
+                )
+            except WaypointFormatError:
+                # 有航点位置无效时整个文件都不写入，文件变化前不再重复检查
+                self._states[map_id] = FileState(path, stat, None, old)
+                raise
+            self._states[map_id] = FileState(path, stat, digest, records)
+        if any(result.values()):
+            waypoint_poses.invalidate()
+            waypoint_index.invalidate()
+        return result
+
+    def _apply(
+        self, map_id: int, digest: str, synced: list, rows: list, removed: set
+    ) -> dict:
+        """
+        在一个事务中写入与数据库不同的航点，删除 removed 中的航点，并记录本次同步的状态；
+        地图有栅格时先检查航点位置，有无效航点时不写入任何修改
+        :param map_id: 地图 ID
+        :param digest: 航点文件内容的哈希
+        :param synced: 航点文件中的所有航点名称
+        :param rows: 可能有变化的航点
+        :param removed: 本地图的文件中已移除的航点名称，其他地图的文件中仍有的不删除
+        :return: 插入、更新、删除的航点数量
+        """
+        mappath = db.session.query(Map.mappath).filter(Map.id == map_id).scalar()
+        try:
+            grid = occupancy_grids.get(mappath)[1]
+        except MapFileError:
+            # 地图没有可读取的 YAML 和 PGM 时不检查航点位置，与导入接口一致
+            grid = None
+        if grid is not None:
+            errors = invalid_waypoints(grid, rows)
+            if errors:
+                raise WaypointFormatError(errors)
+        columns = [getattr(Waypoint, field) for field in FIELDS]
+        existing = {
+            row.waypointname: row
+            for row in db.session.query(Waypoint.id, *columns).filter(
+                Waypoint.waypointname.in_([row["waypointname"] for row in rows])
+            )
+        }
+        inserts, updates = [], []
+        for row in rows:
+            # 航点文件没有桌面高度时保留数据库中的值，与导入接口一致
+            values = {
+                field: value
+                for field, value in row.items()
+                if value is not None or field != "table_height"
+            }
+            found = existing.get(row["waypointname"])
+            if found is None:
+                inserts.append(row)
+            elif any(getattr(found, field) != value for field, value in values.items()):
+                updates.append({"id": found.id, **values})
+        try:
+            if inserts:
+                db.session.execute(insert(Waypoint), inserts)
+            if updates:
+                db.session.execute(update(Waypoint), updates)
+            deleted = 0
+            # 航点名称全局唯一，其他地图的文件中仍有的同名航点保留
+            removed = set(removed) - self._owned_by_others(map_id)
+            if removed:
+                deleted = db.session.execute(
+                    delete(Waypoint).where(Waypoint.waypointname.in_(removed))
+                ).rowcount
+            db.session.execute(
+                update(Map)
+                .where(Map.id == map_id)
+                .values(
+                    waypointdigest=digest,
+                    waypointnames=json.dumps(synced, ensure_ascii=False),
+                )
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return {"inserted": len(inserts), "updated": len(updates), "deleted": deleted}
+
+    @staticmethod
+    def _owned_by_others(map_id: int) -> set:
+        """
+        其他地图的航点文件上次同步时拥有的航点名称
+        """
+        names = set()
+        for (waypointnames,) in db.session.query(Map.waypointnames).filter(
+            Map.id != map_id, Map.waypointnames.isnot(None)
+        ):
+            names.update(json.loads(waypointnames))
+        return names
+
+    def sync_all(self):
+        """
+        检查所有地图的航点文件，文件不存在或格式错误的地图跳过
+        """
+        with self.app.app_context():
+            maps = db.session.query(Map.id, Map.waypointpath).all()
+            for map_id, path in maps:
+                if not path:
+                    continue
+                try:
+                    self.sync(map_id, path)
+                except FileNotFoundError:
+                    continue
+                except (OSError, WaypointFormatError) as e:
+                    print(f"waypoint sync failed for {path}: {e}")
+
+    def start(self) -> bool:
+        """
+        启动后台检查线程，其他进程已经在同步时不启动
+        :return: 是否由本进程运行后台同步
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return True
+        if not self._acquire_lock():
+            return False
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="waypoint-sync", daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._lock_file is not None:
+            # 关闭文件即释放锁
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _acquire_lock(self) -> bool:
+        """
+        以非阻塞方式获取文件锁，进程退出时由系统释放
+        """
+        if fcntl is None or self._lock_file is not None:
+            return True
+        f = open(self.lock_path, "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._lock_file = f
+        return True
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.sync_all()
+            except Exception as e:
+                print("waypoint sync failed: " + str(e))
+
+
+# 全局航点文件同步
+waypoint_sync = WaypointFileSync(app)
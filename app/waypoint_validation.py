@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+
+# 航点到最近障碍物的最小距离（米），约为机器人半径
+WAYPOINT_CLEARANCE = float(os.environ.get("WAYPOINT_CLEARANCE", 0.2))
+
+
+def disk_offsets(radius: float):
+    """
+    半径 radius（格）以内所有格子相对圆心的行列偏移
+    :return: (行偏移数组, 列偏移数组)
+    """
+    r = int(np.ceil(radius))
+    dr, dc = np.mgrid[-r : r + 1, -r : r + 1]
+    inside = dr**2 + dc**2 <= radius**2
+    return dr[inside], dc[inside]
+
+
+def check_points(grid, points, clearance=WAYPOINT_CLEARANCE) -> list:
+    """
+    批量检查航点是否可以导航：在地图范围内、位于空闲区域，且 clearance 以内没有障碍物
+    所有航点的邻域一次取出，形状为 (航点数, 邻域格子数)，不逐个循环
+    :param grid: OccupancyGrid
+    :param points: 形如 [(pos_x, pos_y), ...] 的坐标列表，坐标为 None 时视为不在地图范围内
+    :param clearance: 到障碍物的最小距离（米）
+    :return: 每个航点的问题说明，没有问题为 None
+    """
+    points = np.asarray(points, float).reshape(-1, 2)
+    rows, cols, inside = grid.world_to_cell(points[:, 0], points[:, 1])
+    height, width = grid.shape
+    free = inside & grid.free[rows, cols]
+    dr, dc = disk_offsets(clearance / grid.resolution)
+    near_rows, near_cols = rows[:, None] + dr, cols[:, None] + dc
+    # 地图范围外的邻域不算障碍物
+    in_map = (
+        (near_rows >= 0) & (near_rows < height) & (near_cols >= 0) & (near_cols < width)
+    )
+    blocked = (
+        grid.occupied[
+            np.clip(near_rows, 0, height - 1), np.clip(near_cols, 0, width - 1)
+        ]
+        & in_map
+    ).any(axis=1)
+    problems = np.full(len(points), None, object)
+    problems[blocked] = f"距离障碍物不足 {clearance} 米"
+    problems[~free] = "位于障碍物或未知区域"
+    problems[~inside] = "不在地图范围内"
+    return problems.tolist()
+
+
+def invalid_waypoints(grid, waypoints, clearance=WAYPOINT_CLEARANCE) -> list:
+    """
+    检查航点字典列表
+    :param waypoints: 含 waypointname、pos_x、pos_y 的字典列表
+    :return: 出错航点的说明列表，如 "航点 A: 位于障碍物或未知区域"
+    """
+    points = [(waypoint.get("pos_x"), waypoint.get("pos_y")) for waypoint in waypoints]
+    return [
+        f"航点 {waypoint.get('waypointname')}: {problem}"
+        for waypoint, problem in zip(waypoints, check_points(grid, points, clearance))
+        if problem is not None
+    ]
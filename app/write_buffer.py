@@ -0,0 +1,97 @@
+import threading
+from collections import defaultdict
+
+from database import db
+
+# 缓冲区积累到多少条记录时立即提交
+BATCH_SIZE = 200
+# 最长多久（秒）提交一次
+FLUSH_INTERVAL = 1.0
+
+
+class WriteBehindBuffer:
+    """
+    写回缓冲区，先在内存中积累记录，由后台线程按批次在一个事务中写入数据库
+
+    app: Flask 实例，用于在后台线程中创建应用上下文
+    batch_size: 触发立即提交的记录数量
+    flush_interval: 两次提交之间的最长间隔
+    """
+
+    def __init__(self, app, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._rows = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add(self, model, **values):
+        """
+        追加一条待写入的记录
+        :param model: 模型类
+        :param values: 列名到值的映射
+        :return:
+        """
+        with self._lock:
+            self._rows.append((model, values))
+            full = len(self._rows) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        把缓冲区中的记录按模型分组，在一个事务中批量插入
+        :return: 写入的记录数量
+        """
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return 0
+        grouped = defaultdict(list)
+        for model, values in rows:
+            grouped[model].append(values)
+        with self.app.app_context():
+            try:
+                for model, values in grouped.items():
+                    db.session.execute(db.insert(model), values)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+        return len(rows)
+
+    def start(self):
+        """
+        启动后台提交线程
+        :return:
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="write-behind-buffer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        停止后台线程，并提交剩余记录
+        :return:
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print("write-behind flush failed: " + str(e))
@@ -0,0 +1,117 @@
+"""
+SQLite 读写混合吞吐量基准测试
+
+对比 SQLite 默认配置（rollback 日志、synchronous=FULL）与 app/database.py 中的配置（WAL、synchronous=NORMAL、busy_timeout、连接池）：
+若干写线程模拟监听服务写入状态记录，若干读线程模拟 API 查询，统计每秒完成的操作数和 database is locked 错误数
+
+用法：python benchmarks/db_bench.py [--seconds 5] [--writers 2] [--readers 8]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, "app"))
+)
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+import database
+
+
+def make_engine(path: str, tuned: bool):
+    uri = "sqlite:///" + path
+    if not tuned:
+        # 与修改前的 app.py 相同：默认引擎参数和 SQLite 默认配置
+        return create_engine(uri)
+    engine = create_engine(uri, **database.engine_options(uri))
+    event.listen(engine, "connect", database.set_sqlite_pragma)
+    return engine
+
+
+def run(tuned: bool, seconds: float, writers: int, readers: int):
+    fd, path = tempfile.mkstemp(suffix=".sqlite")
+    os.close(fd)
+    engine = make_engine(path, tuned)
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE status (id INTEGER PRIMARY KEY, robot_id INTEGER, "
+                "data VARCHAR(64), created_at REAL)"
+            )
+        )
+        conn.execute(text("CREATE INDEX ix_status_robot_id ON status (robot_id)"))
+
+    counts = {"write": 0, "read": 0, "locked": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def count(key):
+        with lock:
+            counts[key] += 1
+
+    def writer(robot_id):
+        while time.monotonic() < deadline:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(
+                        text(
+                            "INSERT INTO status (robot_id, data, created_at) "
+                            "VALUES (:robot_id, 'running', :now)"
+                        ),
+                        {"robot_id": robot_id, "now": time.time()},
+                    )
+                count("write")
+            except OperationalError:
+                count("locked")
+
+    def reader(robot_id):
+        while time.monotonic() < deadline:
+            try:
+                with engine.connect() as conn:
+                    conn.execute(
+                        text(
+                            "SELECT * FROM status WHERE robot_id = :robot_id "
+                            "ORDER BY id DESC LIMIT 20"
+                        ),
+                        {"robot_id": robot_id},
+                    ).fetchall()
+                count("read")
+            except OperationalError:
+                count("locked")
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--readers", type=int, default=8)
+    args = parser.parse_args()
+    for name, tuned in (("default", False), ("tuned", True)):
+        counts = run(tuned, args.seconds, args.writers, args.readers)
+        print(
+            f"{name:>8}: {counts['write'] / args.seconds:8.0f} writes/s "
+            f"{counts['read'] / args.seconds:8.0f} reads/s "
+            f"{counts['locked']:6d} locked errors"
+        )
+
+
+if __name__ == "__main__":
+    main()
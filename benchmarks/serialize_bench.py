@@ -0,0 +1,111 @@
+"""
+航点列表序列化微基准测试
+
+对比两种生成 /waypoints 响应的方式，输出每行的平均耗时：
+before: 查询 ORM 对象，逐字段手写字典，标准库 JSON 编码
+after: 只查询列元组，用 serializers.py 预先生成的转换函数，orjson 编码
+
+用法：python benchmarks/serialize_bench.py [--rows 10000] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, "app"))
+)
+# 使用内存数据库，不影响 app/data.sqlite
+os.environ["DATABASE_URL"] = "sqlite://"
+
+from flask_json import FlaskJSONProvider
+
+from app import app
+from database import db
+from fast_json import OrjsonProvider
+from models.waypoint_model import Waypoint
+from serializers import waypoint_serializer
+
+
+def before():
+    waypoints = Waypoint.query.all()
+    rows = [
+        {
+            "id": waypoint.id,
+            "waypointname": waypoint.waypointname,
+            "pos_x": waypoint.pos_x,
+            "pos_y": waypoint.pos_y,
+            "pos_z": waypoint.pos_z,
+            "ori_x": waypoint.ori_x,
+            "ori_y": waypoint.ori_y,
+            "ori_z": waypoint.ori_z,
+            "ori_w": waypoint.ori_w,
+            "table_height": waypoint.table_height,
+        }
+        for waypoint in waypoints
+    ]
+    return rows
+
+
+def after():
+    return waypoint_serializer.dump_rows(waypoint_serializer.query().all())
+
+
+def measure(func, provider, repeat: int):
+    """
+    :return: (查询和转换字典的最短耗时, 完整生成响应的最短耗时)
+    """
+    build, total = [], []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        rows = func()
+        built = time.perf_counter()
+        provider.response(waypoints=rows)
+        encoded = time.perf_counter()
+        build.append(built - start)
+        total.append(encoded - start)
+    return min(build), min(total)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(
+            db.insert(Waypoint),
+            [
+                {
+                    "waypointname": f"waypoint-{i}",
+                    "pos_x": i * 0.5,
+                    "pos_y": i * 0.25,
+                    "pos_z": 0.0,
+                    "ori_x": 0.0,
+                    "ori_y": 0.0,
+                    "ori_z": 0.7071,
+                    "ori_w": 0.7071,
+                    "table_height": 0.75,
+                }
+                for i in range(args.rows)
+            ],
+        )
+        db.session.commit()
+
+        for name, func, provider in (
+            ("before", before, FlaskJSONProvider(app)),
+            ("after", after, OrjsonProvider(app)),
+        ):
+            build, total = measure(func, provider, args.repeat)
+            print(
+                f"{name:>7}: {build / args.rows * 1e6:6.2f} us/row to build, "
+                f"{total / args.rows * 1e6:6.2f} us/row including JSON encoding"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import threading
+import time
+
+import roslibpy
+from roslibpy.core import RosTimeoutError
+from rosbridge.publisher import PublisherNotReadyError, PublisherRegistry
+
+# rosbridge 默认端口
+ROSBRIDGE_PORT = 9090
+# 后台首次连接时等待连接就绪的最长时间（秒）
+CONNECT_TIMEOUT = 3
+# 首次使用连接时最多等待多久（秒），超时后熔断
+FIRST_USE_TIMEOUT = 2
+# 断线重连的初始间隔和最大间隔（秒），间隔按指数增长
+RECONNECT_INITIAL_DELAY = 1
+RECONNECT_MAX_DELAY = 30
+# 熔断的初始时长和最大时长（秒），连续失败时按指数增长
+BREAKER_INITIAL_DELAY = 1
+BREAKER_MAX_DELAY = 30
+# 健康检查间隔（秒）
+HEALTH_CHECK_INTERVAL = 5
+
+
+class RobotUnavailableError(Exception):
+    """
+    机器人的 rosbridge 连接不可用（离线或处于熔断状态）
+    """
+
+    pass
+
+
+def parse_address(robot_ip: str):
+    """
+    解析机器人地址，支持 "ip" 和 "ip:port" 两种格式
+    :param robot_ip: Robot.robot_ip
+    :return: (host, port)
+    """
+    host, _, port = robot_ip.partition(":")
+    return host, int(port) if port else ROSBRIDGE_PORT
+
+
+class RobotConnection:
+    """
+    到一台机器人 rosbridge 的连接，首次使用时才建立，断线后由 roslibpy 按指数退避自动重连，
+    连接不可用时熔断，直接失败而不是把命令积压到重连之后
+
+    robot_id: 机器人 ID
+    host: rosbridge 地址
+    port: rosbridge 端口
+    hooks: 创建 roslibpy 连接后执行的回调（如订阅话题、预先 advertise）
+    """
+
+    def __init__(self, robot_id: int, host: str, port=ROSBRIDGE_PORT, hooks=()):
+        self.robot_id = robot_id
+        self.host = host
+        self.port = port
+        self.hooks = list(hooks)
+        self.listeners = []
+        self.last_connected_at = None
+        self.failures = 0
+        self.open_until = 0.0
+        self._client = None
+        self._publishers = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def open(self) -> roslibpy.Ros:
+        """
+        创建 roslibpy 连接并在后台开始连接，已创建时直接返回
+        :return:
+        """
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._open()
+        return self._client
+
+    @property
+    def client(self) -> roslibpy.Ros:
+        return self.open()
+
+    @property
+    def publishers(self) -> PublisherRegistry:
+        self.open()
+        return self._publishers
+
+    def _open(self):
+        client = roslibpy.Ros(host=self.host, port=self.port)
+        client.factory.set_initial_delay(RECONNECT_INITIAL_DELAY)
+        client.factory.set_max_delay(RECONNECT_MAX_DELAY)
+        client.on("close", self._on_close)
+        client.on_ready(self._on_ready, run_in_thread=False)
+        self._publishers = PublisherRegistry(client)
+        self._client = client
+        # 订阅和 advertise 消息会在连接就绪后才发送，这里不会阻塞
+        for hook in self.hooks:
+            hook(self)
+        threading.Thread(
+            target=self._run, name=f"rosbridge-connect-{self.robot_id}", daemon=True
+        ).start()
+
+    def _run(self):
+        try:
+            self._client.run(CONNECT_TIMEOUT)
+        except RosTimeoutError:
+            print(f"robot {self.robot_id} ({self.host}:{self.port}) is not reachable")
+
+    def _on_ready(self):
+        self.failures = 0
+        self.open_until = 0.0
+        self.last_connected_at = time.time()
+        self._ready.set()
+
+    def _on_close(self, _proto):
+        self._ready.clear()
+        self._client.on_ready(self._on_ready, run_in_thread=False)
+
+    def add_hook(self, hook):
+        """
+        追加回调，连接已创建时立即执行
+        :param hook: 接受 RobotConnection 的函数
+        :return:
+        """
+        self.hooks.append(hook)
+        if self._client is not None:
+            hook(self)
+
+    @property
+    def is_connected(self):
+        return self._client is not None and self._client.is_connected
+
+    @property
+    def is_open(self):
+        """
+        是否处于熔断状态
+        """
+        return time.monotonic() < self.open_until
+
+    def ensure(self, timeout=FIRST_USE_TIMEOUT):
+        """
+        确保连接可用；熔断期间立即失败，否则最多等待 timeout 秒，超时后熔断
+        :param timeout: 等待连接就绪的最长时间
+        :return:
+        """
+        client = self.client
+        if client.is_connected:
+            return client
+        if self.is_open:
+            raise RobotUnavailableError(
+                f"Robot {self.robot_id} is unavailable, retry later."
+            )
+        if self._ready.wait(timeout):
+            return client
+        self.failures += 1
+        delay = min(BREAKER_MAX_DELAY, BREAKER_INITIAL_DELAY * 2 ** (self.failures - 1))
+        self.open_until = time.monotonic() + delay
+        raise RobotUnavailableError(f"Robot {self.robot_id} is not reachable.")
+
+    def publish(self, name: str, message_type: str, message, wait=True, guard=None):
+        """
+        确保连接可用后，通过长期存活的发布者发布消息
+        :param name: 话题名称
+        :param message_type: 消息类型
+        :param message: 要发布的消息
+        :param wait: 是否等待连接和发布者就绪，急停等不能等待的场景传 False
+        :param guard: 参见 Publisher.publish
+        :return:
+        """
+        self.ensure(FIRST_USE_TIMEOUT if wait else 0)
+        try:
+            self.publishers.publish(name, message_type, message, wait, guard)
+        except PublisherNotReadyError as e:
+            raise RobotUnavailableError(str(e))
+
+    def check(self):
+        """
+        健康检查，记录最近一次连接正常的时间
+        :return: 是否已连接
+        """
+        if self.is_connected:
+            self.last_connected_at = time.time()
+            return True
+        return False
+
+    def close(self):
+        if self._client is None:
+            return
+        for listener in self.listeners:
+            listener.unsubscribe()
+        self.listeners = []
+        # 停止底层的自动重连，否则离线机器人被注销后仍会不断重试
+        self._client.factory.stopTrying()
+        if self._client.is_connected:
+            self._client.close()
+
+    def todict(self):
+        return {
+            "robot_id": self.robot_id,
+            "host": self.host,
+            "port": self.port,
+            "connected": self.is_connected,
+            "circuit_open": self.is_open,
+            "failures": self.failures,
+            "last_connected_at": self.last_connected_at,
+        }
+
+
+class ConnectionManager:
+    """
+    机器人连接池，每台已注册的机器人一个 rosbridge 连接，并定期做健康检查
+    """
+
+    def __init__(self, health_check_interval=HEALTH_CHECK_INTERVAL):
+        self.health_check_interval = health_check_interval
+        self._connections = {}
+        self._hooks = []
+        self._lock = threading.RLock()
+        self._health_thread = None
+
+    def __contains__(self, robot_id):
+        return robot_id in self._connections
+
+    def add_hook(self, hook):
+        """
+        注册连接创建时执行的回调（如订阅话题、预先 advertise），对已有连接同样生效
+        :param hook: 接受 RobotConnection 的函数
+        :return:
+        """
+        with self._lock:
+            self._hooks.append(hook)
+            connections = list(self._connections.values())
+        for connection in connections:
+            connection.add_hook(hook)
+
+    def register(self, robot_id: int, robot_ip: str) -> RobotConnection:
+        """
+        注册机器人，地址变化时重建连接；只登记地址，不会立即建立连接
+        :param robot_id: 机器人 ID
+        :param robot_ip: 机器人地址，格式为 "ip" 或 "ip:port"
+        :return:
+        """
+        host, port = parse_address(robot_ip)
+        with self._lock:
+            connection = self._connections.get(robot_id)
+            if connection is not None:
+                if (connection.host, connection.port) == (host, port):
+                    return connection
+                self.unregister(robot_id)
+            connection = RobotConnection(robot_id, host, port, self._hooks)
+            self._connections[robot_id] = connection
+        self._ensure_health_check()
+        return connection
+
+    def unregister(self, robot_id: int):
+        """
+        注销机器人并关闭连接
+        :param robot_id: 机器人 ID
+        :return:
+        """
+        with self._lock:
+            connection = self._connections.pop(robot_id, None)
+        if connection is not None:
+            connection.close()
+
+    def sync(self, robots):
+        """
+        使连接池与机器人表一致
+        :param robots: (robot_id, robot_ip) 列表
+        :return:
+        """
+        robots = {robot_id: robot_ip for robot_id, robot_ip in robots if robot_ip}
+        for robot_id in set(self._connections) - set(robots):
+            self.unregister(robot_id)
+        for robot_id, robot_ip in robots.items():
+            self.register(robot_id, robot_ip)
+
+    def connect_all(self):
+        """
+        在后台为所有机器人建立连接，不等待连接就绪
+        :return:
+        """
+        for connection in self.all():
+            connection.open()
+
+    def get(self, robot_id: int = None) -> RobotConnection:
+        """
+        获取机器人的连接，未指定机器人时返回 ID 最小的机器人
+        :param robot_id: 机器人 ID
+        :return:
+        """
+        with self._lock:
+            if robot_id is None:
+                if not self._connections:
+                    raise LookupError("No robot registered.")
+                robot_id = min(self._connections)
+            try:
+                return self._connections[robot_id]
+            except KeyError:
+                raise LookupError(f"Robot {robot_id} is not registered.")
+
+    def all(self):
+        with self._lock:
+            return list(self._connections.values())
+
+    def _ensure_health_check(self):
+        if self._health_thread is None or not self._health_thread.is_alive():
+            self._health_thread = threading.Thread(
+                target=self._health_check, name="rosbridge-health-check", daemon=True
+            )
+            self._health_thread.start()
+
+    def _health_check(self):
+        while True:
+            time.sleep(self.health_check_interval)
+            for connection in self.all():
+                connection.check()
+
+
+# 全局机器人连接池
+manager = ConnectionManager()
@@ -0,0 +1,231 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# 最多保留的命令记录数量，超出后丢弃最早完成的记录
+HISTORY_SIZE = 1000
+
+
+class CommandStatus:
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+    cancelled = "cancelled"
+
+
+class CommandCancelled(Exception):
+    """
+    命令在发布消息前被急停取消
+    """
+
+    pass
+
+
+class Command:
+    """
+    一条待发送到 ROS 端的命令
+
+    id: 命令 ID
+    name: 命令名称
+    status: 命令状态，参见 CommandStatus
+    robot_id: 目标机器人 ID，为 None 时发往默认机器人
+    """
+
+    def __init__(self, name: str, func, args, kwargs):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.robot_id = kwargs.get("robot_id")
+        self.status = CommandStatus.queued
+        # 执行中被急停取消，之后不再发布消息
+        self.cancel_requested = False
+        # 执行结束或被取消时设置
+        self.done = threading.Event()
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def todict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class CommandDispatcher:
+    """
+    后台命令分发器，请求线程只负责入队，由单个后台线程按顺序发送命令
+    """
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        self.history_size = history_size
+        self._queue = queue.Queue()
+        self._commands = OrderedDict()
+        self._lock = threading.Lock()
+        # 急停发布期间阻止命令发布消息，保证急停消息先于被取消命令的消息发出
+        self._publish_lock = threading.Lock()
+        self._local = threading.local()
+        self._worker = None
+
+    def submit(self, name: str, func, *args, **kwargs) -> Command:
+        """
+        提交命令，立即返回命令对象
+        :param name: 命令名称
+        :param func: 实际发送命令的函数
+        :return:
+        """
+        command = self.create(name, func, *args, **kwargs)
+        self.enqueue(command)
+        return command
+
+    def create(self, name: str, func, *args, **kwargs) -> Command:
+        """
+        创建命令但不入队，可以查询状态和被急停取消，之后由 enqueue 入队，用于依次执行的一组命令
+        :param name: 命令名称
+        :param func: 实际发送命令的函数
+        :return:
+        """
+        command = Command(name, func, args, kwargs)
+        with self._lock:
+            self._commands[command.id] = command
+            self._trim()
+        return command
+
+    def enqueue(self, command: Command):
+        """
+        把 create 创建的命令加入队列，已被取消的命令不入队
+        :param command: 命令
+        :return: 是否入队
+        """
+        with self._lock:
+            if command.status != CommandStatus.queued:
+                return False
+            self._ensure_worker()
+        self._queue.put(command)
+        return True
+
+    def cancel(self, commands, error: str = None):
+        """
+        取消尚未开始执行的命令
+        :param commands: 命令列表
+        :param error: 取消的原因
+        :return:
+        """
+        with self._lock:
+            for command in commands:
+                if command.status == CommandStatus.queued:
+                    command.status = CommandStatus.cancelled
+                    command.error = error
+                    command.finished_at = time.time()
+                    command.done.set()
+
+    def get(self, command_id: str):
+        """
+        按 ID 查询命令，不存在时返回 None
+        :param command_id: 命令 ID
+        :return:
+        """
+        return self._commands.get(command_id)
+
+    def cancel_pending(self, robots=None):
+        """
+        取消尚未开始执行的命令，正在执行的命令之后不再发布消息，用于急停等需要抢占的场景
+        :param robots: 只取消发往这些机器人的命令，集合中的 None 表示发往默认机器人的命令，
+                       为 None 时取消所有命令
+        :return: 被取消的命令数量
+        """
+        cancelled = 0
+        with self._lock:
+            for command in self._commands.values():
+                if robots is not None and command.robot_id not in robots:
+                    continue
+                if command.status == CommandStatus.queued:
+                    command.status = CommandStatus.cancelled
+                    command.finished_at = time.time()
+                    command.done.set()
+                    cancelled += 1
+                elif (
+                    command.status == CommandStatus.running
+                    and not command.cancel_requested
+                ):
+                    command.cancel_requested = True
+                    cancelled += 1
+        return cancelled
+
+    @contextmanager
+    def preempt(self, robots=None):
+        """
+        急停使用：取消命令，并在退出前阻止正在执行的命令发布消息
+        :param robots: 参见 cancel_pending
+        :return: 被取消的命令数量
+        """
+        with self._publish_lock:
+            yield self.cancel_pending(robots)
+
+    @contextmanager
+    def guard(self):
+        """
+        命令发布消息时使用：所在的命令已被取消时抛出 CommandCancelled，急停发布期间等待
+        :return:
+        """
+        with self._publish_lock:
+            command = getattr(self._local, "command", None)
+            if command is not None and command.cancel_requested:
+                raise CommandCancelled(f"Command {command.id} was cancelled.")
+            yield
+
+    def _trim(self):
+        while len(self._commands) > self.history_size:
+            oldest_id, oldest = next(iter(self._commands.items()))
+            if oldest.status in (CommandStatus.queued, CommandStatus.running):
+                break
+            del self._commands[oldest_id]
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(
+                target=self._run, name="command-dispatcher", daemon=True
+            )
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            command = self._queue.get()
+            with self._lock:
+                if command.status == CommandStatus.cancelled:
+                    # 排队期间已被取消
+                    self._queue.task_done()
+                    continue
+                command.status = CommandStatus.running
+                command.started_at = time.time()
+            self._local.command = command
+            try:
+                command.func(*command.args, **command.kwargs)
+            except CommandCancelled:
+                command.status = CommandStatus.cancelled
+            except Exception as e:
+                command.status = CommandStatus.failed
+                command.error = str(e)
+            else:
+                command.status = CommandStatus.succeeded
+            finally:
+                self._local.command = None
+            command.finished_at = time.time()
+            command.done.set()
+            self._queue.task_done()
+
+
+# 全局命令分发器
+dispatcher = CommandDispatcher()
@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import deque
+
+import roslibpy
+from rosbridge.dispatcher import dispatcher
+from rosbridge.connection import manager, RobotUnavailableError
+
+# 急停通道使用的话题，机器人连接建立时预先 advertise
+ESTOP_TOPICS = [
+    ("/cli_vel_ctrl", "std_msgs/String"),
+    ("/exception_cmd", "std_msgs/String"),
+]
+# 保留最近多少次急停的耗时用于统计
+LATENCY_WINDOW = 1000
+
+
+class EmergencyStop:
+    """
+    急停通道，不经过命令队列，直接使用预先 advertise 的发布者发送停车/中断指令，
+    同时取消发往该机器人的排队命令，正在执行的命令也不再发布，并记录每次急停在后端的耗时
+    """
+
+    def __init__(self, manager, dispatcher, window=LATENCY_WINDOW):
+        self.manager = manager
+        self.dispatcher = dispatcher
+        self._latencies = deque(maxlen=window)
+        self._count = 0
+        self._lock = threading.Lock()
+        manager.add_hook(self._prime)
+
+    @staticmethod
+    def _prime(connection):
+        connection.publishers.prime(ESTOP_TOPICS)
+
+    def _publish(self, topic: str, data: str, robot_id=None):
+        start = time.perf_counter()
+        if robot_id is None:
+            connections = self.manager.all()
+        else:
+            connections = [self.manager.get(robot_id)]
+        message = roslibpy.Message({"data": data})
+        unreachable = []
+        # 急停消息发出前，被取消的命令都不能再发布
+        with self.dispatcher.preempt(self._targets(robot_id)) as cancelled:
+            for connection in connections:
+                try:
+                    connection.publish(topic, "std_msgs/String", message, wait=False)
+                except RobotUnavailableError:
+                    unreachable.append(connection.robot_id)
+        latency_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._latencies.append(latency_ms)
+            self._count += 1
+        return {
+            "latency_ms": latency_ms,
+            "cancelled": cancelled,
+            "unreachable": unreachable,
+        }
+
+    def _targets(self, robot_id):
+        """
+        要取消的命令的目标机器人，参见 CommandDispatcher.cancel_pending
+        """
+        if robot_id is None:
+            return None
+        targets = {robot_id}
+        try:
+            # 未指定机器人的命令发往 ID 最小的机器人
+            if self.manager.get().robot_id == robot_id:
+                targets.add(None)
+        except LookupError:
+            pass
+        return targets
+
+    def stop(self, robot_id: int = None):
+        """
+        立即停车
+        :param robot_id: 机器人 ID，为 None 时所有机器人都停车
+        :return: 耗时毫秒数、被取消的命令数量和未能送达的机器人
+        """
+        return self._publish("/cli_vel_ctrl", "stop", robot_id)
+
+    def interrupt(self, robot_id: int = None):
+        """
+        中断当前任务，参见 ExceptionTable.interrupt
+        :param robot_id: 机器人 ID，为 None 时中断所有机器人
+        :return: 耗时毫秒数、被取消的命令数量和未能送达的机器人
+        """
+        return self._publish("/exception_cmd", "interrupt", robot_id)
+
+    def stats(self):
+        """
+        急停耗时统计（毫秒）
+        :return:
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            last = self._latencies[-1] if self._latencies else None
+            count = self._count
+        if not latencies:
+            return {
+                "count": count,
+                "last": None,
+                "mean": None,
+                "p99": None,
+                "max": None,
+            }
+        return {
+            "count": count,
+            "last": last,
+            "mean": sum(latencies) / len(latencies),
+            "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            "max": latencies[-1],
+        }
+
+
+# 全局急停通道
+estop = EmergencyStop(manager, dispatcher)
@@ -1,58 +1,155 @@
+import sys
+import os
+
+# 添加 app 目录到系统路径，以便写入数据库
+sys.path.append(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, "app"))
+)
+
+import threading
+from datetime import datetime
+from functools import partial
+
 import roslibpy
+from sqlalchemy.exc import OperationalError
+from app import app
+from database import db
+from write_buffer import WriteBehindBuffer
+from models.robot_model import Robot
+from models.history_model import TransportStatus, CruiseStatus, TpRequest, TpResult
+from rosbridge.connection import manager, RobotConnection
+from rosbridge.state import robot_states
 
-client = roslibpy.Ros(host="192.168.126.140", port=9090)
-client.run()
+# 机器人表为空时使用的默认机器人
+DEFAULT_ROBOT_ID = 1
+DEFAULT_ROBOT_IP = "192.168.126.140"
 
-print("ros_bridge connection is ", client.is_connected)
+# 状态消息写回缓冲区，按批次写入历史表
+history_buffer = WriteBehindBuffer(app)
+# 是否把状态消息写入历史表，由 start 设置
+_persist = False
+
+
+def _record(robot_id: int, model, field: str, data):
+    """
+    更新实时状态缓存，并在需要时把消息追加到写回缓冲区
+    :param robot_id: 发来消息的机器人 ID
+    :param model: 历史表模型
+    :param field: 实时状态中的字段名
+    :param data: 消息内容
+    :return:
+    """
+    robot_states.update(robot_id, **{field: data})
+    if _persist:
+        history_buffer.add(
+            model, robot_id=robot_id, data=data, created_at=datetime.now()
+        )
 
 
-def transport_listen(message: dict):
+def transport_listen(message: dict, robot_id: int = DEFAULT_ROBOT_ID):
     """
     监听'/transport_status'话题发来的消息，该话题中发布的是 送药业务的执行状态
     :param message: 格式{‘data’: (string)xxx}
+    :param robot_id: 发来消息的机器人 ID
     :return:
     """
     print("get transport status: " + message["data"])
+    _record(robot_id, TransportStatus, "transport_status", message["data"])
 
 
-def cruise_listen(message: dict):
+def cruise_listen(message: dict, robot_id: int = DEFAULT_ROBOT_ID):
     """
     监听'/transport_status'话题发来的消息，该话题中发布的是 巡诊业务的执行状态
     :param message: 格式{‘data’: (string)xxx}
+    :param robot_id: 发来消息的机器人 ID
     :return:
     """
     print("get cruise status: " + message["data"])
+    _record(robot_id, CruiseStatus, "cruise_status", message["data"])
 
 
-def tp_req_listen(message: dict):
+def tp_req_listen(message: dict, robot_id: int = DEFAULT_ROBOT_ID):
     """
     监听'/take_tp_req'话题发来的消息，该话题中发布的是 测温请求
     :param message: 格式{‘data’: (string)xxx}
+    :param robot_id: 发来消息的机器人 ID
     :return:
     """
     print("get take temperature request: " + message["data"])
+    _record(robot_id, TpRequest, "tp_request", message["data"])
 
 
-def tp_result_listen(message: dict):
+def tp_result_listen(message: dict, robot_id: int = DEFAULT_ROBOT_ID):
     """
     监听'/tp_result'话题发来的消息，该话题中发布的是 测温结果
     :param message: 格式{‘data’: (float)xxx}，其中xxx是float类型的
+    :param robot_id: 发来消息的机器人 ID
+    :return:
+    """
+    print("get body temperature: " + str(message["data"]))
+    _record(robot_id, TpResult, "tp_result", message["data"])
+
+
+# 订阅的话题：(话题, 消息类型, 回调)
+SUBSCRIPTIONS = [
+    ("/transport_status", "std_msgs/String", transport_listen),
+    ("/cruise_status", "std_msgs/String", cruise_listen),
+    ("/take_tp_req", "std_msgs/String", tp_req_listen),
+    ("/tp_result", "std_msgs/Float32", tp_result_listen),
+]
+
+
+def subscribe_robot(connection: RobotConnection):
+    """
+    订阅一台机器人的所有状态话题，回调中带上机器人 ID
+    :param connection: 机器人连接
+    :return:
+    """
+    for name, message_type, callback in SUBSCRIPTIONS:
+        listener = roslibpy.Topic(connection.client, name, message_type)
+        listener.subscribe(partial(callback, robot_id=connection.robot_id))
+        connection.listeners.append(listener)
+
+
+def load_robots():
+    """
+    从机器人表读取所有机器人的地址
+    :return: (robot_id, robot_ip) 列表
+    """
+    with app.app_context():
+        try:
+            robots = db.session.query(Robot.id, Robot.robot_ip).all()
+        except OperationalError:
+            # 数据库尚未初始化
+            robots = []
+    return [tuple(robot) for robot in robots] or [(DEFAULT_ROBOT_ID, DEFAULT_ROBOT_IP)]
+
+
+def start(persist=True):
+    """
+    连接所有机器人并订阅状态话题，之后注册的机器人也会自动订阅
+    :param persist: 是否启动历史记录写回缓冲区，只应由监听服务进程开启，避免重复写入
     :return:
     """
-    print("get body temperature: " + message["data"])
+    global _persist
+    _persist = persist
+    if persist:
+        history_buffer.start()
+    manager.add_hook(subscribe_robot)
+    manager.sync(load_robots())
+    # 后台建立连接，机器人离线时不阻塞启动
+    manager.connect_all()
 
 
 if __name__ == "__main__":
-    transport_listener = roslibpy.Topic(client, "/transport_status", "std_msgs/String")
-    transport_listener.subscribe(transport_listen)
-    cruise_listener = roslibpy.Topic(client, "/cruise_status", "std_msgs/String")
-    cruise_listener.subscribe(cruise_listen)
-    tp_req_listener = roslibpy.Topic(client, "/take_tp_req", "std_msgs/String")
-    tp_req_listener.subscribe(tp_req_listen)
-    tp_result_listener = roslibpy.Topic(client, "/tp_result", "std_msgs/Float32")
-    tp_result_listener.subscribe(tp_result_listen)
+    with app.app_context():
+        db.create_all()
+    start()
+    # 消息回调在 reactor 线程中执行，主线程只需阻塞等待退出信号
+    stopped = threading.Event()
     try:
-        while True:
-            pass
+        stopped.wait()
     except KeyboardInterrupt:
-        client.terminate()
+        history_buffer.stop()
+        for connection in manager.all():
+            connection.close()
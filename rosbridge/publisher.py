@@ -0,0 +1,149 @@
+import threading
+import time
+from contextlib import nullcontext
+
+import roslibpy
+
+# 话题首次 advertise 后，ROS 端订阅者完成连接所需的等待时间（秒）
+ADVERTISE_SETTLE = 0.5
+# 等待 rosbridge 连接就绪的最长时间（秒）
+READY_TIMEOUT = 5
+
+
+class PublisherNotReadyError(Exception):
+    """
+    等待发布者就绪超时，话题可能尚未 advertise，此时发布的消息可能丢失或乱序
+    """
+
+    pass
+
+
+class Publisher:
+    """
+    长期存活的话题发布者，只 advertise 一次，之后每次发布只需一次 websocket 写入
+    """
+
+    def __init__(
+        self,
+        client: roslibpy.Ros,
+        name: str,
+        message_type: str,
+        settle=ADVERTISE_SETTLE,
+    ):
+        self.client = client
+        self.name = name
+        self.message_type = message_type
+        self.settle = settle
+        self.topic = roslibpy.Topic(client, name, message_type)
+        self._connected = threading.Event()
+        self._ready_at = None
+
+    def advertise(self):
+        """
+        向 rosbridge 注册为该话题的发布者，并在连接就绪时开始计算就绪时间
+        :return:
+        """
+        self.topic.advertise()
+        self.client.on("close", self._on_close)
+        self.client.on_ready(self._on_ready, run_in_thread=False)
+
+    def _on_ready(self):
+        self._ready_at = time.monotonic() + self.settle
+        self._connected.set()
+
+    def _on_close(self, _proto):
+        # 断线后 roslibpy 会自动重新 advertise，这里只需重新跟踪就绪状态
+        self._connected.clear()
+        self.client.on_ready(self._on_ready, run_in_thread=False)
+
+    @property
+    def is_ready(self):
+        """
+        连接已就绪且 advertise 后的等待时间已过
+        """
+        return self._connected.is_set() and time.monotonic() >= self._ready_at
+
+    def wait_ready(self, timeout=READY_TIMEOUT):
+        """
+        阻塞直到发布者就绪，已就绪时立即返回
+        :param timeout: 等待连接就绪的最长时间
+        :return: 是否就绪
+        """
+        if not self._connected.wait(timeout):
+            return False
+        remaining = self._ready_at - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        return True
+
+    def publish(self, message: roslibpy.Message, wait=True, guard=None):
+        """
+        发布消息，仅在刚 advertise 后的第一次发布时等待就绪
+        :param message: 要发布的消息
+        :param wait: 未就绪时是否等待，等待超时时抛出 PublisherNotReadyError，不发布；急停等不能等待的场景传 False
+        :param guard: 等待就绪后、发布时进入的上下文管理器，如 dispatcher.guard，可在其中放弃发布
+        :return:
+        """
+        if wait and not self.is_ready and not self.wait_ready():
+            raise PublisherNotReadyError(
+                f"Publisher for {self.name} is not ready after {READY_TIMEOUT}s."
+            )
+        with guard() if guard is not None else nullcontext():
+            self.topic.publish(message)
+
+
+class PublisherRegistry:
+    """
+    按 (话题, 消息类型) 缓存 Publisher，所有命令共享同一个 rosbridge 连接
+    """
+
+    def __init__(self, client: roslibpy.Ros):
+        self.client = client
+        self._publishers = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, message_type: str) -> Publisher:
+        """
+        获取已注册的发布者，不存在时创建并 advertise
+        :param name: 话题名称
+        :param message_type: 消息类型
+        :return:
+        """
+        key = (name, message_type)
+        publisher = self._publishers.get(key)
+        if publisher is None:
+            with self._lock:
+                publisher = self._publishers.get(key)
+                if publisher is None:
+                    publisher = Publisher(self.client, name, message_type)
+                    publisher.advertise()
+                    self._publishers[key] = publisher
+        return publisher
+
+    def publish(
+        self,
+        name: str,
+        message_type: str,
+        message: roslibpy.Message,
+        wait=True,
+        guard=None,
+    ):
+        """
+        通过已注册的发布者发布消息
+        :param name: 话题名称
+        :param message_type: 消息类型
+        :param message: 要发布的消息
+        :param wait: 未就绪时是否等待
+        :param guard: 参见 Publisher.publish
+        :return:
+        """
+        self.get(name, message_type).publish(message, wait, guard)
+
+    def prime(self, topics):
+        """
+        预先 advertise 一组话题，避免首次发布时等待
+        :param topics: (话题, 消息类型) 列表
+        :return:
+        """
+        for name, message_type in topics:
+            self.get(name, message_type)
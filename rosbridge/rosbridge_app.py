@@ -8,17 +8,28 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardi
 print(sys.path)
 
 import roslibpy
-import time
-from rosbridge.listener import client
+from rosbridge.connection import manager
+from rosbridge.dispatcher import dispatcher
 from rosbridge.poseStamped import PoseStamped
 from rosbridge.exception_table import ExceptionTable
 
 
+def _publish(robot_id, name: str, message_type: str, message: roslibpy.Message):
+    """
+    通过目标机器人连接上长期存活的发布者发布消息
+    :param robot_id: 目标机器人 ID，为 None 时发往默认机器人
+    :return:
+    """
+    # 等待连接就绪期间被急停取消的命令不再发布
+    manager.get(robot_id).publish(name, message_type, message, guard=dispatcher.guard)
+
+
 def transport_cmd(
         start_pos: PoseStamped,
         target_pos: PoseStamped,
         origin_pos: PoseStamped,
         table_height,
+        robot_id: int = None,
 ):
     """
     向ROS端发送送药命令
@@ -26,11 +37,9 @@ def transport_cmd(
     :param target_pos: 病床坐标
     :param origin_pos: 待机点
     :param table_height: 病床床头柜高度
+    :param robot_id: 目标机器人 ID，为 None 时发往默认机器人
     :return:
     """
-    send_goal_topic = roslibpy.Topic(
-        client, "/transport_cmd", "medirover_pkg/transport_cmd"
-    )
     goal_msg = roslibpy.Message(
         {
             "start_pos": start_pos.todict(),
@@ -40,91 +49,86 @@ def transport_cmd(
         }
     )
     print("Sending transport message...")
-    send_goal_topic.publish(goal_msg)
-    time.sleep(1)
+    _publish(robot_id, "/transport_cmd", "medirover_pkg/transport_cmd", goal_msg)
 
 
-def cruise_cmd(target_poses: list = None):
+def cruise_cmd(target_poses: list = None, robot_id: int = None):
     """
     Send position of cruise targets to robot.
     The last element of "poses" must be the original point where robot will return after accomplishing cruise mission.
     :param target_poses:
+    :param robot_id: 目标机器人 ID，为 None 时发往默认机器人
     :return:
     """
-    send_goal_topic = roslibpy.Topic(client, "/cruise_cmd", "geometry_msgs/PoseArray")
     poses = [(i.todict())["pose"] for i in target_poses]
     poses.reverse()
     goal_msg = roslibpy.Message({"header": {"frame_id": "map"}, "poses": poses})
     print("Sending cruise message...")
-    send_goal_topic.publish(goal_msg)
-    time.sleep(1)
+    _publish(robot_id, "/cruise_cmd", "geometry_msgs/PoseArray", goal_msg)
 
 
-def exception_cmd(exc_type: int):
+def exception_cmd(exc_type: int, robot_id: int = None):
     """
     向ROS发出异常处理指令，其中异常类型参见exception_table.py
+    :param robot_id: 目标机器人 ID，为 None 时发往默认机器人
     :return:
     """
-    interrupt_topic = roslibpy.Topic(client, "/exception_cmd", "std_msgs/String")
     if exc_type == ExceptionTable.interrupt:
         exc_cmd = roslibpy.Message({"data": "interrupt"})
         print("sending interrupt message...")
     if exc_type == ExceptionTable.recover:
         exc_cmd = roslibpy.Message({"data": "recover"})
         print("sending recover message...")
-    interrupt_topic.publish(exc_cmd)
-    time.sleep(1)
+    _publish(robot_id, "/exception_cmd", "std_msgs/String", exc_cmd)
 
 
-def mapping_cmd(cmd: str):
+def mapping_cmd(cmd: str, robot_id: int = None):
     """
     向ROS发送建图命令
     :param cmd: 从以下模式中选择一个：start,save,end
+    :param robot_id: 目标机器人 ID，为 None 时发往默认机器人
     :return:
     """
-    mapping_topic = roslibpy.Topic(client, "/bd_map_cmd", "std_msgs/String")
-    mapping_topic.publish(roslibpy.Message({"data": cmd}))
+    _publish(robot_id, "/bd_map_cmd", "std_msgs/String", roslibpy.Message({"data": cmd}))
     print("sending mapping message...")
-    time.sleep(1)
 
 
-def vel_ctrl_cmd(cmd: str):
+def vel_ctrl_cmd(cmd: str, robot_id: int = None):
     """
     向ROS发送移动控制命令
     :param cmd: 从以下模式中选择一个：stop,front,back,left,right,turn_left,turn_right
+    :param robot_id: 目标机器人 ID，为 None 时发往默认机器人
     :return:
     """
-    vel_ctrl_topic = roslibpy.Topic(client, "/cli_vel_ctrl", "std_msgs/String")
-    vel_ctrl_topic.publish(roslibpy.Message({"data": cmd}))
+    _publish(robot_id, "/cli_vel_ctrl", "std_msgs/String", roslibpy.Message({"data": cmd}))
     print("sending vel_ctrl message...")
-    time.sleep(1)
 
 
-def take_temperature_cmd(cmd: bool):
+def take_temperature_cmd(cmd: bool, robot_id: int = None):
     """
     向ROS发送测温命令
     :param cmd: 若为True，则同意马上测温；若为False，则跳过测温步骤
+    :param robot_id: 目标机器人 ID，为 None 时发往默认机器人
     :return:
     """
-    take_tp_topic = roslibpy.Topic(client, "/take_tp_reply", "std_msgs/Bool")
-    take_tp_topic.publish(roslibpy.Message({"data": cmd}))
+    _publish(robot_id, "/take_tp_reply", "std_msgs/Bool", roslibpy.Message({"data": cmd}))
     print("sending take temperature message...")
-    time.sleep(1)
 
 
-def proc_waypoint_cmd(cmd: str):
+def proc_waypoint_cmd(cmd: str, robot_id: int = None):
     """
     向ROS发送航点标注命令
     :param cmd: 从以下模式中选择一个：start,save,end
+    :param robot_id: 目标机器人 ID，为 None 时发往默认机器人
     :return:
     """
-    proc_waypoint_topic = roslibpy.Topic(client, "/proc_waypoint_cmd", "std_msgs/String")
-    proc_waypoint_topic.publish(roslibpy.Message({"data": cmd}))
+    _publish(robot_id, "/proc_waypoint_cmd", "std_msgs/String", roslibpy.Message({"data": cmd}))
     print("sending process waypoint message...")
-    time.sleep(1)
 
 
 if __name__ == "__main__":
+    manager.register(1, "192.168.126.140")
+
     def app_transport():
         start_pos = PoseStamped("map", 0.12, 1.73, 0, 1)
         target_pos = PoseStamped("map", -4.36, -1.60, 0, 1)
@@ -0,0 +1,82 @@
+import threading
+import time
+
+
+class RobotStateStore:
+    """
+    进程内的机器人实时状态缓存，由话题回调写入，供 HTTP 接口和 SSE 推送读取
+    """
+
+    def __init__(self):
+        self._states = {}
+        self._versions = {}
+        # (机器人 ID, 字段) 最近一次被写入时的版本号
+        self._field_versions = {}
+        self._version = 0
+        self._cond = threading.Condition()
+
+    @property
+    def version(self):
+        return self._version
+
+    def update(self, robot_id: int, **fields):
+        """
+        合并机器人的最新状态，并唤醒等待中的订阅者
+        :param robot_id: 机器人 ID
+        :param fields: 状态字段
+        :return:
+        """
+        with self._cond:
+            state = dict(self._states.get(robot_id, {"id": robot_id}))
+            state.update(fields)
+            state["updated_at"] = time.time()
+            self._version += 1
+            self._states[robot_id] = state
+            self._versions[robot_id] = self._version
+            for field in fields:
+                self._field_versions[(robot_id, field)] = self._version
+            self._cond.notify_all()
+
+    def snapshot(self):
+        """
+        所有机器人的最新状态
+        :return: (版本号, 状态列表)
+        """
+        with self._cond:
+            return self._version, list(self._states.values())
+
+    def changes(self, since: int, timeout=None):
+        """
+        阻塞直到有版本号大于 since 的状态变化，或超时
+        :param since: 上次读取到的版本号
+        :param timeout: 最长等待时间
+        :return: (当前版本号, 变化的状态列表)
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._version > since, timeout)
+            changed = [
+                self._states[robot_id]
+                for robot_id, version in self._versions.items()
+                if version > since
+            ]
+            return self._version, changed
+
+    def wait_field(self, robot_id: int, field: str, since: int, timeout=None):
+        """
+        阻塞直到机器人的 field 字段在版本号 since 之后被写入，或超时；
+        只看该字段本身，其他字段的更新不会唤醒返回
+        :param robot_id: 机器人 ID
+        :param field: 状态字段
+        :param since: 上次读取到的版本号
+        :param timeout: 最长等待时间
+        :return: (当前版本号, 字段的新值)，超时时字段值为 None
+        """
+        with self._cond:
+            written = lambda: self._field_versions.get((robot_id, field), 0) > since
+            if self._cond.wait_for(written, timeout):
+                return self._version, self._states[robot_id][field]
+            return self._version, None
+
+
+# 全局实时状态缓存
+robot_states = RobotStateStore()
@@ -0,0 +1,65 @@
+import time
+
+# 合法的移动控制意图，与 vel_ctrl_cmd 的参数一致
+INTENTS = ("stop", "front", "back", "left", "right", "turn_left", "turn_right")
+# 向 ROS 转发移动意图的最高频率（Hz）
+SEND_RATE = 20
+# 客户端超过该时间（秒）没有发来意图时自动停车
+IDLE_TIMEOUT = 0.5
+
+
+class TeleopSession:
+    """
+    一个遥控连接的状态，合并高频的移动意图，只把最新且有变化的意图转发给 ROS
+
+    send: 实际发送移动控制命令的函数，参见 vel_ctrl_cmd
+    rate: 最高转发频率
+    idle_timeout: 客户端静默多久后自动停车
+    """
+
+    def __init__(self, send, rate=SEND_RATE, idle_timeout=IDLE_TIMEOUT):
+        self.send = send
+        self.interval = 1.0 / rate
+        self.idle_timeout = idle_timeout
+        self.intent = "stop"
+        self.sent = "stop"
+        self.sent_at = 0.0
+        self.last_seen = time.monotonic()
+
+    def update(self, intent: str):
+        """
+        记录客户端发来的最新意图，同时刷新心跳时间
+        :param intent: 移动控制意图，参见 INTENTS
+        :return:
+        """
+        if intent not in INTENTS:
+            raise ValueError(f"Unknown intent: {intent}")
+        self.intent = intent
+        self.last_seen = time.monotonic()
+
+    def tick(self):
+        """
+        按限速规则转发最新意图，停车意图不受限速影响
+        :return: 本次转发的意图，没有转发时为 None
+        """
+        now = time.monotonic()
+        if now - self.last_seen > self.idle_timeout:
+            self.intent = "stop"
+        if self.intent == self.sent:
+            return None
+        if self.intent != "stop" and now - self.sent_at < self.interval:
+            return None
+        self.send(self.intent)
+        self.sent = self.intent
+        self.sent_at = now
+        return self.sent
+
+    def close(self):
+        """
+        连接断开时停车
+        :return:
+        """
+        self.intent = "stop"
+        if self.sent != "stop":
+            self.send("stop")
+            self.sent = "stop"
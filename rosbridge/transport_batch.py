@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+
+from rosbridge.connection import manager
+from rosbridge.dispatcher import CommandStatus, dispatcher
+from rosbridge.state import robot_states
+
+# /transport_status 中表示一次送药已完成并返回待机点的状态
+TRANSPORT_DONE_STATUS = os.environ.get("TRANSPORT_DONE_STATUS", "done")
+# 等待一次送药完成的最长时间（秒），超时后其余任务取消
+TRANSPORT_TIMEOUT = float(os.environ.get("TRANSPORT_TIMEOUT", 1800))
+# 等待状态变化时检查任务是否被取消的间隔（秒）
+POLL_INTERVAL = 1.0
+
+
+class TransportBatch:
+    """
+    依次执行一组送药命令：机器人一次只能执行一个送药任务，
+    上一个任务下发成功，且机器人通过 /transport_status 报告完成后才下发下一个。
+    下发失败、等待超时，或后续任务被急停取消时，其余任务全部取消
+
+    commands: dispatcher.create 创建的送药命令，按执行顺序排列
+    robot_id: 目标机器人 ID，为 None 时发往默认机器人
+    """
+
+    def __init__(
+        self,
+        commands: list,
+        robot_id: int = None,
+        dispatcher=dispatcher,
+        states=robot_states,
+        timeout=TRANSPORT_TIMEOUT,
+    ):
+        self.commands = commands
+        self.robot_id = robot_id
+        self.dispatcher = dispatcher
+        self.states = states
+        self.timeout = timeout
+        self._thread = None
+
+    def start(self):
+        """
+        启动后台线程依次下发命令
+        :return:
+        """
+        self._thread = threading.Thread(
+            target=self._run, name="transport-batch", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        for i, command in enumerate(self.commands):
+            rest = self.commands[i + 1 :]
+            since = self.states.version
+            if not self.dispatcher.enqueue(command):
+                # 已被急停取消，后续任务也已一并取消
+                continue
+            command.done.wait()
+            if command.status != CommandStatus.succeeded:
+                self.dispatcher.cancel(rest, "上一个送药任务未能下发")
+                return
+            if rest and not self._wait_done(since, rest[0]):
+                self.dispatcher.cancel(rest, "等待上一个送药任务完成超时")
+                return
+
+    def _wait_done(self, since: int, following) -> bool:
+        """
+        等待机器人报告送药完成
+        :param since: 下发命令前的状态版本号，只接受之后的状态
+        :param following: 下一个命令，被取消时不再等待
+        :return: 是否在超时前完成或下一个命令已被取消
+        """
+        try:
+            robot_id = manager.get(self.robot_id).robot_id
+        except LookupError:
+            return False
+        deadline = time.monotonic() + self.timeout
+        while following.status == CommandStatus.queued:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            # 只接受下发之后写入的送药状态，上一个任务留下的完成状态和其他话题的更新都不算
+            since, status = self.states.wait_field(
+                robot_id, "transport_status", since, min(remaining, POLL_INTERVAL)
+            )
+            if status == TRANSPORT_DONE_STATUS:
+                return True
+        return True